@@ -0,0 +1,147 @@
+# bench_html_parsers.py
+"""
+Сравнение разбора страницы задачи: старый путь (html.parser + три отдельных
+extract_* с квадратичным поиском описания) против extract_page_info на
+каждом установленном бэкенде.
+
+    python bench_html_parsers.py [--challenges 300] [--depth 12] [--repeat 3]
+"""
+import argparse
+import os
+import time
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+import scraper_core
+from scraper_core import safe_name
+
+
+def build_page(challenges: int, depth: int) -> str:
+    """
+    Синтетическая /challenges как у CTFd: много карточек, глубокая
+    вложенность div, скрипты и блок с вложениями.
+    """
+    parts = [
+        "<html><head><title>Challenges | CTFd</title>",
+        "<script>var init = {" + ", ".join(f"k{i}: {i}" for i in range(500)) + "};</script>",
+        "</head><body><nav><a href='/'>CTF</a><a href='/scoreboard'>Scoreboard</a></nav>",
+        "<h1>Challenges</h1>",
+    ]
+    for i in range(challenges):
+        opening = "".join(f"<div class='lvl-{d}'>" for d in range(depth))
+        closing = "</div>" * depth
+        parts.append(
+            f"{opening}<div class='card'>"
+            f"<button class='challenge-button' value='{i}'>Task {i}</button>"
+            f"<p>Short teaser {i}.</p>"
+            f"<div><span>{'lorem ipsum dolor sit amet ' * (i % 7 + 1)}</span></div>"
+            f"</div>{closing}"
+        )
+    parts.append("<div class='attachments'>")
+    for i in range(20):
+        parts.append(f"<a href='/files/{i:02x}/dist{i}.tar.gz?token=x'>dist{i}.tar.gz</a>")
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+# ---- прежняя реализация, для сравнения ----
+
+def legacy_extract_title(soup: BeautifulSoup) -> str:
+    for el in soup.select(".challenge-name, .challenge-title, h1.challenge-name, h1.challenge-title"):
+        text = el.get_text(strip=True)
+        if text:
+            return text
+    h1 = soup.find("h1")
+    if h1 and h1.get_text(strip=True):
+        return h1.get_text(strip=True)
+    if soup.title and soup.title.string:
+        return soup.title.string.strip()
+    return "challenge"
+
+
+def legacy_extract_description(soup: BeautifulSoup) -> str:
+    for sel in scraper_core.DESC_SELECTORS:
+        el = soup.select_one(sel)
+        if el:
+            text = el.get_text("\n", strip=True)
+            if text:
+                return text
+    best = ""
+    for p in soup.find_all(["p", "div"]):
+        text = p.get_text(" ", strip=True)
+        if len(text) > len(best) and len(text) > 40:
+            best = text
+    return best or scraper_core.DEFAULT_DESCRIPTION
+
+
+def legacy_extract_file_links(soup: BeautifulSoup, base_url: str):
+    file_links = []
+    containers = soup.select(".challenge-files, .challenge-file, .files, .attachments")
+    if not containers:
+        links = soup.find_all("a", attrs={"download": True}) or soup.find_all("a", href=True)
+    else:
+        links = []
+        for cont in containers:
+            links.extend(cont.find_all("a", href=True))
+    seen = set()
+    for a in links:
+        href = a.get("href")
+        if not href:
+            continue
+        abs_url = urljoin(base_url, href).split("#", 1)[0]
+        if abs_url in seen:
+            continue
+        seen.add(abs_url)
+        fname = a.get("download") or a.get_text(strip=True) or os.path.basename(urlparse(abs_url).path)
+        fname = safe_name(fname, default=os.path.basename(urlparse(abs_url).path) or "file")
+        if fname:
+            file_links.append((fname, abs_url))
+    return file_links
+
+
+def legacy(html_text: str, base_url: str) -> dict:
+    soup = BeautifulSoup(html_text, "html.parser")
+    return {
+        "title": legacy_extract_title(soup),
+        "description": legacy_extract_description(soup),
+        "files": legacy_extract_file_links(soup, base_url),
+    }
+
+
+def timed(fn, repeat: int) -> tuple[float, dict]:
+    best = float("inf")
+    result = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--challenges", type=int, default=300)
+    ap.add_argument("--depth", type=int, default=12)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    base_url = "https://ctf.example.org/challenges"
+    html_text = build_page(args.challenges, args.depth)
+    print(f"Страница: {len(html_text) / 1024:.0f} KB, {args.challenges} карточек, вложенность {args.depth}")
+
+    baseline, expected = timed(lambda: legacy(html_text, base_url), args.repeat)
+    print(f"{'legacy html.parser':<28} {baseline * 1000:9.1f} ms")
+
+    for name in scraper_core.available_html_parsers():
+        scraper_core.set_html_parser(name)
+        elapsed, got = timed(lambda: scraper_core.extract_page_info(html_text, base_url), args.repeat)
+        same = "совпадает" if got == expected else "ОТЛИЧАЕТСЯ"
+        print(
+            f"{'extract_page_info ' + name:<28} {elapsed * 1000:9.1f} ms"
+            f"  x{baseline / elapsed:5.1f}  {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,225 @@
 import os
 import re
 import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import email.utils
+import hashlib
+import heapq
+import importlib.util
+import io
+import json
+import multiprocessing
+import queue
+import random
 import shutil
-from datetime import datetime
-from typing import Optional, List, Dict, Any
-from urllib.parse import urljoin, urlparse
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import (
+    Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator,
+)
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse
 
 import httpx
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+try:
+    import lxml  # noqa: F401
+except ImportError:  # lxml не обязателен
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax не обязателен
+    LexborHTMLParser = None
+
+try:
+    import blake3
+except ImportError:  # BLAKE3 не обязателен
+    blake3 = None
+
+try:
+    import fcntl
+except ImportError:  # нет на Windows — там без reflink
+    fcntl = None
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = ".ctfd_manifest.json"
+
+# минимальный интервал между событиями file_progress для одного файла, сек
+PROGRESS_INTERVAL = 0.25
+
+# колбэк прогресса: получает словарь {"type": ..., "ts": ..., ...поля события}
+EventCallback = Callable[[Dict[str, Any]], None]
+
+# ioctl FICLONE (Linux): копия файла без копирования данных на btrfs/xfs
+FICLONE = 0x40049409
+
+# поля ответа API, которые меняются во время CTF и не влияют на содержимое дампа
+VOLATILE_PAYLOAD_KEYS = {"solves", "solved_by_me", "attempts"}
+
+# параметры ссылок на файлы, которые CTFd подписывает заново в каждом ответе
+VOLATILE_QUERY_KEYS = {"token"}
+
+RUN_LOG_NAME = "run_log.jsonl"
+# контрольные суммы дампа рядом с INDEX.md (см. write_checksums / verify_dump)
+CHECKSUMS_NAME = "SHA256SUMS"
+B3SUMS_NAME = "B3SUMS"
+CHECKSUMS_JSON_NAME = "checksums.json"
+# машиночитаемый индекс (см. DumpExport)
+EXPORT_JSONL_NAME = "challenges.jsonl"
+EXPORT_DB_NAME = "dump.sqlite"
+INDEX_MD_NAME = "INDEX.md"
+# индекс прерванного прогона: INDEX.md прошлого полного прогона не трогаем
+PARTIAL_INDEX_NAME = "INDEX.partial.md"
+
+# уровни для JSON-лога по привычным префиксам строк
+LOG_PREFIX_LEVELS = {"[+]": "info", "[=]": "info", "[!]": "warning"}
+
+
+class RunLog:
+    """
+    Машиночитаемый журнал прогона: JSON lines в <out_dir>/run_log.jsonl.
+    Каждая запись — {"ts", "run", "kind", ...}: kind=log (строки log()
+    с уровнем), event (события прогресса), challenge (итоговые метрики
+    задачи), summary (сводка по хостам). Файл дописывается, прогоны
+    различаются по полю run. Пишут в него и event loop, и потоки
+    (архивация, DiskWriter): write() только кладёт строку в очередь, а в
+    файл её пишет отдельный поток, так что диск не тормозит event loop.
+    open() и close() тоже трогают диск — из async-кода через to_thread.
+    """
+
+    def __init__(self, path: str, run_id: Optional[str] = None):
+        self.path = path
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S_") + os.urandom(3).hex()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._f = open(path, "a", encoding="utf-8")
+        self._lines: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="ctfd-run-log", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def open(cls, out_dir: str) -> "RunLog":
+        os.makedirs(out_dir, exist_ok=True)
+        return cls(os.path.join(out_dir, RUN_LOG_NAME))
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(
+            {"ts": time.time(), "run": self.run_id, **record},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock:
+            if not self._closed:
+                self._lines.put(line)
+
+    def _drain(self) -> None:
+        while (line := self._lines.get()) is not None:
+            self._f.write(line + "\n")
+        self._f.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._lines.put(None)
+        self._thread.join()
+
+
+# журнал текущего прогона и метрики текущей задачи: run_scrape и его
+# воркеры выставляют их, а log()/add_metric() находят без передачи
+# через все слои (download_file, RetryTransport, PageCache, ...)
+current_run_log: contextvars.ContextVar[Optional[RunLog]] = contextvars.ContextVar(
+    "current_run_log", default=None
+)
+current_metrics: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "current_metrics", default=None
+)
+
+
+def log(message: str, level: Optional[str] = None, **fields: Any) -> None:
+    """
+    Строка для человека в stdout и, если идёт прогон, запись в run_log.jsonl.
+    Уровень по умолчанию берётся из префикса: [!] — warning, иначе info.
+    """
+    print(message)
+    run_log = current_run_log.get()
+    if run_log is None:
+        return
+    text = message.strip()
+    prefix = text[:3]
+    if prefix in LOG_PREFIX_LEVELS:
+        level = level or LOG_PREFIX_LEVELS[prefix]
+        text = text[3:].strip()
+    metrics = current_metrics.get()
+    if metrics is not None and "challenge" not in fields:
+        fields["challenge"] = metrics["url"]
+    run_log.write({"kind": "log", "level": level or "info", "msg": text, **fields})
+
+
+def add_metric(key: str, value: float = 1) -> None:
+    """Прибавить value к метрике текущей задачи (если она есть)."""
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + value
+
+HTML_PARSERS = ("selectolax", "lxml", "html.parser")
+
+
+def available_html_parsers() -> List[str]:
+    available = []
+    if LexborHTMLParser is not None:
+        available.append("selectolax")
+    if lxml is not None:
+        available.append("lxml")
+    available.append("html.parser")
+    return available
+
+
+def pick_html_parser(name: Optional[str] = None) -> str:
+    """
+    Бэкенд разбора HTML: явно заданный (или CTFD_SCRAPER_HTML_PARSER),
+    если он установлен, иначе самый быстрый из доступных.
+    """
+    name = name or os.environ.get("CTFD_SCRAPER_HTML_PARSER")
+    available = available_html_parsers()
+    if name:
+        if name not in HTML_PARSERS:
+            raise ValueError(f"Неизвестный HTML-парсер: {name}")
+        if name in available:
+            return name
+        log(f"[!] HTML-парсер {name} не установлен, использую {available[0]}")
+    return available[0]
+
+
+HTML_PARSER = pick_html_parser()
+
+
+def set_html_parser(name: Optional[str]) -> str:
+    global HTML_PARSER
+    HTML_PARSER = pick_html_parser(name)
+    return HTML_PARSER
+
+
+def make_soup(markup: str) -> BeautifulSoup:
+    """
+    BeautifulSoup на самом быстром доступном дереве. У selectolax нет
+    дерева для bs4, поэтому там, где нужен soup, берём lxml.
+    """
+    features = "lxml" if HTML_PARSER != "html.parser" and lxml is not None else "html.parser"
+    return BeautifulSoup(markup, features)
+
 
 def parse_cookie_header(cookie_str: Optional[str]) -> dict:
     if not cookie_str:
@@ -31,6 +243,37 @@ def safe_name(name: str, default: str = "challenge") -> str:
     return name.strip("._") or default
 
 
+def emit_event(on_event: Optional[EventCallback], event_type: str, **fields: Any) -> None:
+    """
+    Отправить типизированное событие прогресса. Ошибки подписчика не должны
+    ронять дамп, поэтому только печатаем их.
+    Типы: discovered, challenge_started, challenge_finished, challenge_retry,
+    challenge_failed, file_started, file_progress, file_finished,
+    archive_started, archive_progress, archive_finished, finished.
+    """
+    if on_event is None:
+        return
+    try:
+        on_event({"type": event_type, "ts": time.time(), **fields})
+    except Exception as e:
+        log(f"[!] Ошибка в обработчике событий ({event_type}): {e}")
+
+
+def file_url_key(url: str) -> str:
+    """
+    Ключ файла: URL без фрагмента и одноразового ?token=... — CTFd отдаёт
+    один и тот же файл по ссылке с новым токеном в каждом ответе API.
+    Качать всё равно нужно по исходному URL, ключ — только для сравнения.
+    """
+    p = urlparse(url.split("#", 1)[0])
+    query = [
+        (k, v)
+        for k, v in parse_qsl(p.query, keep_blank_values=True)
+        if k not in VOLATILE_QUERY_KEYS
+    ]
+    return p._replace(query=urlencode(query)).geturl()
+
+
 def get_api_root(url: str) -> str:
     """
     Получить базу API вида https://host/api/v1
@@ -39,17 +282,80 @@ def get_api_root(url: str) -> str:
     return f"{p.scheme}://{p.netloc}/api/v1"
 
 
+def parse_challenge_id(url: str) -> Optional[int]:
+    """
+    ID задачи из URL:
+      1) из фрагмента #...-<id>, например "#-23" или "#Скоростные-Пазлы-1-23";
+      2) из пути /challenges/<id>.
+    """
+    p = urlparse(url)
+    nums = re.findall(r"\d+", p.fragment or "")
+    if nums:
+        return int(nums[-1])
+    path_parts = [seg for seg in p.path.split("/") if seg]
+    if len(path_parts) >= 2 and path_parts[0] == "challenges" and path_parts[1].isdigit():
+        return int(path_parts[1])
+    return None
+
+
+@dataclass
+class ChallengeDescriptor:
+    """
+    Задача на пути от обнаружения к скачиванию: URL, ID и всё, что уже
+    известно из списка /api/v1/challenges (name, category, value, solved).
+    Пустой listing — задача пришла из HTML или передана ссылкой напрямую.
+    """
+
+    url: str
+    id: Optional[int] = None
+    name: Optional[str] = None
+    category: Optional[str] = None
+    value: Optional[Any] = None
+    solved: Optional[bool] = None
+    listing: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        """
+        Ключ для дедупликации: /challenges/23 и /challenges#-23 — одна задача.
+        """
+        if self.id is None:
+            return self.url
+        p = urlparse(self.url)
+        return f"{p.scheme}://{p.netloc}#{self.id}"
+
+    @classmethod
+    def from_url(cls, url: str) -> "ChallengeDescriptor":
+        return cls(url=url, id=parse_challenge_id(url))
+
+    @classmethod
+    def from_listing(cls, site_root: str, chal: Dict[str, Any]) -> Optional["ChallengeDescriptor"]:
+        cid = chal.get("id")
+        if not (isinstance(cid, int) or (isinstance(cid, str) and cid.isdigit())):
+            return None
+        return cls(
+            # вот тут и делаем нужный формат ссылки
+            url=f"{site_root}/challenges#-{cid}",
+            id=int(cid),
+            name=chal.get("name"),
+            category=chal.get("category"),
+            value=chal.get("value"),
+            solved=chal.get("solved_by_me"),
+            listing=dict(chal),
+        )
+
+
 async def login_ctfd(
     client: httpx.AsyncClient,
     login_url: str,
     username: str,
     password: str,
 ) -> None:
-    print(f"[+] Пытаюсь залогиниться по адресу: {login_url}")
+    log(f"[+] Пытаюсь залогиниться по адресу: {login_url}")
     r = await client.get(login_url)
     r.raise_for_status()
 
-    soup = BeautifulSoup(r.text, "html.parser")
+    soup = make_soup(r.text)
     form = soup.find("form")
     if not form:
         raise RuntimeError("Не найден <form> на странице логина")
@@ -86,7 +392,7 @@ async def login_ctfd(
     data[username_field_name] = username
     data[password_field_name] = password
 
-    print(
+    log(
         f"[+] Отправляю форму логина на {action_url} "
         f"(user field: {username_field_name}, pass field: {password_field_name})"
     )
@@ -95,9 +401,316 @@ async def login_ctfd(
     r2.raise_for_status()
 
     if "/login" in str(r2.url):
-        print(f"[!] Похоже, логин не удался, всё ещё на странице логина: {r2.url}")
+        log(f"[!] Похоже, логин не удался, всё ещё на странице логина: {r2.url}")
     else:
-        print(f"[+] Логин вероятно успешен, текущий URL: {r2.url}")
+        log(f"[+] Логин вероятно успешен, текущий URL: {r2.url}")
+
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After бывает числом секунд или HTTP-датой.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Политика повторов по классам ошибок:
+      - rate_limit: 429
+      - server: 500/502/503/504
+      - connect: не удалось установить соединение
+      - timeout: таймауты чтения/пула
+      - read: соединение оборвалось посреди ответа
+    Задержка — экспоненциальная с полным джиттером, но не меньше Retry-After.
+    """
+
+    DEFAULT_ATTEMPTS = {
+        "rate_limit": 6,
+        "server": 4,
+        "connect": 4,
+        "timeout": 3,
+        "read": 3,
+    }
+
+    def __init__(
+        self,
+        max_attempts: Optional[Dict[str, int]] = None,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        max_retry_after: float = 120.0,
+    ):
+        self.max_attempts = dict(self.DEFAULT_ATTEMPTS)
+        if max_attempts:
+            self.max_attempts.update(max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    @staticmethod
+    def classify_status(status_code: int) -> Optional[str]:
+        if status_code == 429:
+            return "rate_limit"
+        if status_code in (500, 502, 503, 504):
+            return "server"
+        return None
+
+    @staticmethod
+    def classify_exception(exc: Exception) -> Optional[str]:
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return "connect"
+        if isinstance(exc, httpx.TimeoutException):
+            return "timeout"
+        if isinstance(exc, (httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError)):
+            return "read"
+        return None
+
+    def backoff(self, attempt: int) -> float:
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, cap)
+
+
+class RetryBudget:
+    """
+    Общий на весь прогон лимит повторов, чтобы лежащий сервер не
+    превращал дамп в бесконечные ретраи.
+    """
+
+    def __init__(self, max_retries: int = 200):
+        self.max_retries = max(0, max_retries)
+        self.used = 0
+
+    def take(self) -> bool:
+        if self.used >= self.max_retries:
+            return False
+        self.used += 1
+        return True
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """
+    Обёртка над транспортом httpx: повторяет идемпотентные запросы
+    (GET/HEAD/OPTIONS) на 429/5xx и сетевых ошибках по RetryPolicy.
+    POST (логин) уходит как есть.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        policy: Optional[RetryPolicy] = None,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self._transport = transport
+        self.policy = policy or RetryPolicy()
+        self.budget = budget or RetryBudget()
+
+    def _may_retry(self, kind: str, attempts: Dict[str, int]) -> bool:
+        attempts[kind] = attempts.get(kind, 0) + 1
+        if attempts[kind] >= self.policy.max_attempts.get(kind, 1):
+            return False
+        return self.budget.take()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method not in IDEMPOTENT_METHODS:
+            return await self._transport.handle_async_request(request)
+
+        attempts: Dict[str, int] = {}
+        while True:
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                kind = self.policy.classify_exception(e)
+                if kind is None or not self._may_retry(kind, attempts):
+                    raise
+                delay = self.policy.backoff(attempts[kind])
+                add_metric("http_retries")
+                log(
+                    f"[!] {request.method} {request.url}: {type(e).__name__}, "
+                    f"повтор через {delay:.1f} с"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            kind = self.policy.classify_status(response.status_code)
+            if kind is None or not self._may_retry(kind, attempts):
+                return response
+
+            delay = self.policy.backoff(attempts[kind])
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.policy.max_retry_after))
+            await response.aclose()
+            add_metric("http_retries")
+            log(
+                f"[!] {request.method} {request.url}: HTTP {response.status_code}, "
+                f"повтор через {delay:.1f} с"
+            )
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class HostController:
+    """
+    Адаптивный лимит одновременных запросов к одному хосту (AIMD):
+      - пока ответы быстрые и без ошибок, лимит растёт примерно на 1 за
+        "раунд" (+1/limit на каждый успешный ответ);
+      - на 429/5xx, таймауты или заметный рост задержки относительно
+        базовой — лимит умножается на backoff_factor, не чаще раза за
+        текущую задержку, чтобы одна волна ошибок не обнулила его.
+    Дополнительно можно включить жёсткий token bucket по запросам в секунду.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        max_rps: float = 0.0,
+        latency_tolerance: float = 2.0,
+        backoff_factor: float = 0.5,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.max_rps = max_rps
+        self.latency_tolerance = latency_tolerance
+        self.backoff_factor = backoff_factor
+
+        self.inflight = 0
+        self.latency_ewma: Optional[float] = None
+        self.latency_base: Optional[float] = None
+        self.requests = 0
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+        self._tokens = max(1.0, max_rps)
+        self._tokens_at = time.monotonic()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+        if self.max_rps > 0:
+            await self._take_token()
+
+    async def _take_token(self) -> None:
+        capacity = max(1.0, self.max_rps)
+        while True:
+            now = time.monotonic()
+            self._tokens = min(capacity, self._tokens + (now - self._tokens_at) * self.max_rps)
+            self._tokens_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.max_rps)
+
+    async def release(self, latency: Optional[float], overloaded: bool) -> None:
+        self.requests += 1
+        now = time.monotonic()
+        if overloaded:
+            self.overloads += 1
+            self._decrease(now)
+        elif latency is not None:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+                self.latency_base = latency
+            else:
+                self.latency_ewma += 0.2 * (latency - self.latency_ewma)
+                # базовая задержка — медленно плывущий минимум
+                self.latency_base = min(
+                    self.latency_ewma,
+                    self.latency_base + 0.01 * (self.latency_ewma - self.latency_base),
+                )
+            if self.latency_ewma > self.latency_base * self.latency_tolerance:
+                self._decrease(now)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+        async with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    def _decrease(self, now: float) -> None:
+        if now - self._last_decrease < max(self.latency_ewma or 0.0, 0.5):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.backoff_factor)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "latency_ms": round((self.latency_ewma or 0.0) * 1000, 1),
+            "requests": self.requests,
+            "overloads": self.overloads,
+        }
+
+
+class AdaptiveLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт, пропускающий каждый запрос через HostController своего
+    хоста. Слот занят до получения заголовков ответа: тело больших файлов
+    ограничивает уже DownloadLimiter.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        initial: int = 5,
+        max_limit: int = 32,
+        max_rps: float = 0.0,
+    ):
+        self._transport = transport
+        self.initial = initial
+        self.max_limit = max_limit
+        self.max_rps = max_rps
+        self.hosts: Dict[str, HostController] = {}
+
+    def controller(self, host: str) -> HostController:
+        ctl = self.hosts.get(host)
+        if ctl is None:
+            ctl = self.hosts[host] = HostController(
+                self.initial, max_limit=self.max_limit, max_rps=self.max_rps
+            )
+        return ctl
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        ctl = self.controller(request.url.netloc.decode("ascii"))
+        await ctl.acquire()
+        started = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TimeoutException:
+            await ctl.release(None, overloaded=True)
+            raise
+        except BaseException:
+            await ctl.release(None, overloaded=False)
+            raise
+        overloaded = response.status_code == 429 or response.status_code in (502, 503, 504)
+        await ctl.release(time.monotonic() - started, overloaded)
+        return response
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {host: ctl.snapshot() for host, ctl in self.hosts.items()}
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
 
 
 async def api_get_json(client: httpx.AsyncClient, url: str) -> dict:
@@ -106,97 +719,134 @@ async def api_get_json(client: httpx.AsyncClient, url: str) -> dict:
     Обязательно ставим Content-Type: application/json (даже для GET),
     иначе некоторые версии CTFd не отдают JSON нормально.
     """
-    r = await client.get(url, headers={"Content-Type": "application/json"})
+    data, _ = await api_get_json_conditional(client, url)
+    return data
+
+
+def conditional_headers(validators: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    If-None-Match / If-Modified-Since по сохранённым в манифесте валидаторам.
+    """
+    headers: Dict[str, str] = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def response_validators(r: httpx.Response) -> Dict[str, Optional[str]]:
+    return {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+    }
+
+
+async def api_get_json_conditional(
+    client: httpx.AsyncClient,
+    url: str,
+    validators: Optional[Dict[str, Any]] = None,
+) -> tuple[Optional[dict], Dict[str, Optional[str]]]:
+    """
+    Как api_get_json, но с условным запросом: если сервер ответил 304,
+    вместо JSON возвращается None. Вторым элементом — валидаторы ответа.
+    """
+    headers = {"Content-Type": "application/json"}
+    headers.update(conditional_headers(validators))
+    r = await client.get(url, headers=headers)
+    if r.status_code == 304:
+        return None, dict(validators or {})
     r.raise_for_status()
     try:
-        return r.json()
+        return r.json(), response_validators(r)
     except ValueError as e:
         raise RuntimeError(f"Не удалось распарсить JSON с {url}: {e}") from e
 
 
-async def api_list_challenges(
+async def iter_api_challenges(
     client: httpx.AsyncClient,
     any_url_on_site: str,
-) -> List[Dict[str, Any]]:
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    /api/v1/challenges — основной способ получить список задач.
+    /api/v1/challenges постранично: задачи отдаются по мере получения
+    страниц, следующая страница берётся из meta.pagination.next.
+    Старые CTFd пагинацию не возвращают — тогда это одна страница.
     """
     api_root = get_api_root(any_url_on_site)
     url = f"{api_root}/challenges"
-    print(f"[+] Запрашиваю список задач через API: {url}")
-    data = await api_get_json(client, url)
-    if not data.get("success", False):
-        raise RuntimeError(f"API /challenges вернул success={data.get('success')}")
-    challenges = data.get("data") or []
-    print(f"[+] Через API найдено задач: {len(challenges)}")
-    return challenges
+    page: Optional[int] = None
+    seen_pages: set = set()
+    total = 0
+    while True:
+        page_url = url if page is None else f"{url}?page={page}"
+        log(f"[+] Запрашиваю список задач через API: {page_url}")
+        data = await api_get_json(client, page_url)
+        if not data.get("success", False):
+            raise RuntimeError(f"API /challenges вернул success={data.get('success')}")
+        challenges = data.get("data") or []
+        total += len(challenges)
+        for chal in challenges:
+            yield chal
 
+        pagination = (data.get("meta") or {}).get("pagination") or {}
+        next_page = pagination.get("next")
+        if not next_page or next_page in seen_pages:
+            break
+        seen_pages.add(next_page)
+        page = next_page
+    log(f"[+] Через API найдено задач: {total}")
 
 
-def extract_title(soup: BeautifulSoup) -> str:
-    candidates = soup.select(
-        '.challenge-name, .challenge-title, h1.challenge-name, h1.challenge-title'
-    )
-    for el in candidates:
-        text = el.get_text(strip=True)
-        if text:
-            return text
+async def api_list_challenges(
+    client: httpx.AsyncClient,
+    any_url_on_site: str,
+) -> List[Dict[str, Any]]:
+    """
+    /api/v1/challenges — основной способ получить список задач.
+    Собирает все страницы в список; для потоковой обработки —
+    iter_api_challenges.
+    """
+    return [chal async for chal in iter_api_challenges(client, any_url_on_site)]
 
-    h1 = soup.find("h1")
-    if h1 and h1.get_text(strip=True):
-        return h1.get_text(strip=True)
 
-    if soup.title and soup.title.string:
-        return soup.title.string.strip()
+TITLE_CLASSES = ("challenge-name", "challenge-title")
+DESC_SELECTORS = [
+    ".challenge-desc",
+    ".challenge-description",
+    ".challenge-description-body",
+    ".challenge-text",
+    "#challenge-desc",
+]
+FILE_CONTAINER_CLASSES = ("challenge-files", "challenge-file", "files", "attachments")
+# теги, текст которых BeautifulSoup.get_text не учитывает
+NON_TEXT_TAGS = ("script", "style", "template")
+DEFAULT_DESCRIPTION = "Описание не найдено автоматически."
 
-    return "challenge"
 
+def extract_title(soup: BeautifulSoup) -> str:
+    return _extract_page_info_soup(soup, "")["title"]
 
-def extract_description(soup: BeautifulSoup) -> str:
-    desc_selectors = [
-        ".challenge-desc",
-        ".challenge-description",
-        ".challenge-description-body",
-        ".challenge-text",
-        "#challenge-desc",
-    ]
-    for sel in desc_selectors:
-        el = soup.select_one(sel)
-        if el:
-            text = el.get_text("\n", strip=True)
-            if text:
-                return text
 
-    paragraphs = soup.find_all(["p", "div"])
-    best = ""
-    for p in paragraphs:
-        text = p.get_text(" ", strip=True)
-        if len(text) > len(best) and len(text) > 40:
-            best = text
-    return best or "Описание не найдено автоматически."
+def extract_description(soup: BeautifulSoup) -> str:
+    return _extract_page_info_soup(soup, "")["description"]
 
 
+def html_to_text(markup: str) -> str:
+    """Текст описания из HTML, который отдаёт API."""
+    return make_soup(markup).get_text("\n", strip=True)
 
 
-def extract_file_links(soup: BeautifulSoup, base_url: str):
+def build_file_links(
+    links: List[tuple[Optional[str], Optional[str], str]],
+    base_url: str,
+) -> List[tuple[str, str]]:
+    """
+    (href, download, текст ссылки) -> [(имя файла, абсолютный URL)] без дублей.
+    """
     file_links = []
-
-    file_containers = soup.select(
-        ".challenge-files, .challenge-file, .files, .attachments"
-    )
-    if not file_containers:
-        candidates = soup.find_all("a", attrs={"download": True})
-        if not candidates:
-            candidates = soup.find_all("a", href=True)
-        links = candidates
-    else:
-        links = []
-        for cont in file_containers:
-            links.extend(cont.find_all("a", href=True))
-
     seen = set()
-    for a in links:
-        href = a.get("href")
+    for href, download, text in links:
         if not href:
             continue
         abs_url = urljoin(base_url, href).split("#", 1)[0]
@@ -204,11 +854,7 @@ def extract_file_links(soup: BeautifulSoup, base_url: str):
             continue
         seen.add(abs_url)
 
-        fname = (
-            a.get("download")
-            or a.get_text(strip=True)
-            or os.path.basename(urlparse(abs_url).path)
-        )
+        fname = download or text or os.path.basename(urlparse(abs_url).path)
         fname = safe_name(
             fname, default=os.path.basename(urlparse(abs_url).path) or "file"
         )
@@ -219,6 +865,1626 @@ def extract_file_links(soup: BeautifulSoup, base_url: str):
     return file_links
 
 
+def unique_file_names(files: List[tuple[str, str]]) -> List[tuple[str, str]]:
+    """
+    Делает имена вложений уникальными внутри задачи. CTFd хранит файлы как
+    /files/<hash>/<имя>, и два разных libc.so иначе писались бы в один
+    files/libc.so. Первый файл сохраняет своё имя, следующие получают
+    суффикс из папки-хеша (libc_<hash>.so) или счётчик. Ссылки, отличающиеся
+    только ?token=, схлопываются в одну.
+    """
+    result = []
+    seen_urls = set()
+    taken = set()
+    for fname, f_url in files:
+        key = file_url_key(f_url)
+        if key in seen_urls:
+            continue
+        seen_urls.add(key)
+
+        name = fname
+        if name.lower() in taken:
+            stem, ext = os.path.splitext(fname)
+            parent = os.path.basename(os.path.dirname(urlparse(f_url).path))
+            suffix = safe_name(parent, default="")[:16]
+            name = f"{stem}_{suffix}{ext}" if suffix else fname
+            n = 2
+            while name.lower() in taken:
+                name = f"{stem}_{n}{ext}"
+                n += 1
+        taken.add(name.lower())
+        result.append((name, f_url))
+    return result
+
+
+def extract_file_links(soup: BeautifulSoup, base_url: str) -> List[tuple[str, str]]:
+    return _extract_page_info_soup(soup, base_url)["files"]
+
+
+def extract_page_info(html_text: str, base_url: str) -> Dict[str, Any]:
+    """
+    Заголовок, описание и ссылки на файлы за один разбор и один обход
+    документа. Бэкенд — HTML_PARSER (selectolax, lxml или html.parser);
+    extract_title / extract_description / extract_file_links — то же
+    самое по уже разобранному BeautifulSoup.
+    """
+    if HTML_PARSER == "selectolax":
+        return _extract_page_info_lexbor(html_text, base_url)
+    return _extract_page_info_soup(make_soup(html_text), base_url)
+
+
+def _extract_page_info_soup(soup: BeautifulSoup, base_url: str) -> Dict[str, Any]:
+    title_candidates: List[Tag] = []
+    first_h1: Optional[Tag] = None
+    first_title: Optional[Tag] = None
+    desc_hits: Dict[str, Tag] = {}
+    container_ids: set = set()
+    container_links: List[Tag] = []
+    download_links: List[Tag] = []
+    href_links: List[Tag] = []
+    best: Optional[Tag] = None
+    best_key = (40, 0)
+
+    # первый (pre-order) проход по стеку: классы/теги; второй визит того же
+    # узла (post-order) — накопление длин текста снизу вверх
+    sums: Dict[int, List[int]] = {}
+    order = 0
+    stack: List[tuple] = [(soup, False, 0)]
+    while stack:
+        node, visited, node_order = stack.pop()
+        if not visited:
+            order += 1
+            stack.append((node, True, order))
+            for child in reversed(node.contents):
+                if isinstance(child, Tag):
+                    stack.append((child, False, 0))
+
+            classes = node.get("class") or []
+            name = node.name
+            if any(c in TITLE_CLASSES for c in classes):
+                title_candidates.append(node)
+            if name == "h1" and first_h1 is None:
+                first_h1 = node
+            elif name == "title" and first_title is None:
+                first_title = node
+            for sel in DESC_SELECTORS:
+                if sel in desc_hits:
+                    continue
+                if (sel[0] == "." and sel[1:] in classes) or (
+                    sel[0] == "#" and node.get("id") == sel[1:]
+                ):
+                    desc_hits[sel] = node
+            if any(c in FILE_CONTAINER_CLASSES for c in classes):
+                container_ids.add(id(node))
+            if name == "a":
+                if node.has_attr("href"):
+                    href_links.append(node)
+                    if container_ids and any(id(p) in container_ids for p in node.parents):
+                        container_links.append(node)
+                if node.has_attr("download"):
+                    download_links.append(node)
+            continue
+
+        total = count = 0
+        for child in node.contents:
+            if isinstance(child, Tag):
+                child_total, child_count = sums[id(child)]
+                total += child_total
+                count += child_count
+            elif type(child) in (NavigableString, CData):
+                text = child.strip()
+                if text:
+                    total += len(text)
+                    count += 1
+        sums[id(node)] = [total, count]
+        if node.name in ("p", "div") and count:
+            key = (total + count - 1, -node_order)
+            if key > best_key:
+                best, best_key = node, key
+
+    def has_text(el: Tag) -> bool:
+        return sums[id(el)][1] > 0
+
+    title = next((el.get_text(strip=True) for el in title_candidates if has_text(el)), "")
+    if not title and first_h1 is not None and has_text(first_h1):
+        title = first_h1.get_text(strip=True)
+    if not title and first_title is not None and first_title.string:
+        title = first_title.string.strip()
+
+    desc = ""
+    for sel in DESC_SELECTORS:
+        el = desc_hits.get(sel)
+        if el is not None and has_text(el):
+            desc = el.get_text("\n", strip=True)
+            break
+    if not desc:
+        desc = best.get_text(" ", strip=True) if best is not None else DEFAULT_DESCRIPTION
+
+    if container_ids:
+        links = container_links
+    else:
+        links = download_links or href_links
+    files = build_file_links(
+        [(a.get("href"), a.get("download"), a.get_text(strip=True)) for a in links],
+        base_url,
+    )
+    return {"title": title or "challenge", "description": desc, "files": files}
+
+
+def _lexbor_text(node: Any, separator: str) -> str:
+    """
+    Аналог get_text(separator, strip=True) для узла selectolax: node.text()
+    захватывает и содержимое <script>/<style>, а bs4 — нет.
+    """
+    parts = []
+    stack = [node]
+    while stack:
+        cur = stack.pop()
+        if cur.tag == "-text":
+            text = (cur.text_content or "").strip()
+            if text:
+                parts.append(text)
+            continue
+        if cur.tag in NON_TEXT_TAGS or cur.tag.startswith("_"):
+            continue
+        children = []
+        child = cur.child
+        while child is not None:
+            children.append(child)
+            child = child.next
+        stack.extend(reversed(children))
+    return separator.join(parts)
+
+
+def _extract_page_info_lexbor(html_text: str, base_url: str) -> Dict[str, Any]:
+    tree = LexborHTMLParser(html_text)
+    title_candidates: list = []
+    first_h1 = None
+    first_title = None
+    desc_hits: Dict[str, Any] = {}
+    container_ids: set = set()
+    container_links: list = []
+    download_links: list = []
+    href_links: list = []
+    best = None
+    best_key = (40, 0)
+    sums: Dict[int, List[int]] = {}
+    parents: Dict[int, int] = {}
+
+    order = 0
+    stack: List[tuple] = [(tree.root, False, 0, None)]
+    while stack:
+        node, visited, node_order, parent_id = stack.pop()
+        if not visited:
+            order += 1
+            node_id = node.mem_id
+            parents[node_id] = parent_id
+            stack.append((node, True, order, parent_id))
+            children = []
+            child = node.child
+            while child is not None:
+                if not child.tag.startswith(("_", "-")):
+                    children.append(child)
+                child = child.next
+            for child in reversed(children):
+                stack.append((child, False, 0, node_id))
+
+            attrs = node.attributes
+            classes = (attrs.get("class") or "").split()
+            name = node.tag
+            if any(c in TITLE_CLASSES for c in classes):
+                title_candidates.append(node)
+            if name == "h1" and first_h1 is None:
+                first_h1 = node
+            elif name == "title" and first_title is None:
+                first_title = node
+            for sel in DESC_SELECTORS:
+                if sel in desc_hits:
+                    continue
+                if (sel[0] == "." and sel[1:] in classes) or (
+                    sel[0] == "#" and attrs.get("id") == sel[1:]
+                ):
+                    desc_hits[sel] = node
+            if any(c in FILE_CONTAINER_CLASSES for c in classes):
+                container_ids.add(node_id)
+            if name == "a":
+                if "href" in attrs:
+                    href_links.append(node)
+                    pid = parent_id
+                    while pid is not None and container_ids:
+                        if pid in container_ids:
+                            container_links.append(node)
+                            break
+                        pid = parents.get(pid)
+                if "download" in attrs:
+                    download_links.append(node)
+            continue
+
+        total = count = 0
+        if node.tag not in NON_TEXT_TAGS:
+            child = node.child
+            while child is not None:
+                if child.tag == "-text":
+                    text = (child.text_content or "").strip()
+                    if text:
+                        total += len(text)
+                        count += 1
+                elif child.mem_id in sums:
+                    child_total, child_count = sums[child.mem_id]
+                    total += child_total
+                    count += child_count
+                child = child.next
+        sums[node.mem_id] = [total, count]
+        if node.tag in ("p", "div") and count:
+            key = (total + count - 1, -node_order)
+            if key > best_key:
+                best, best_key = node, key
+
+    def has_text(node) -> bool:
+        return sums.get(node.mem_id, [0, 0])[1] > 0
+
+    title = next(
+        (_lexbor_text(el, "") for el in title_candidates if has_text(el)), ""
+    )
+    if not title and first_h1 is not None and has_text(first_h1):
+        title = _lexbor_text(first_h1, "")
+    if not title and first_title is not None:
+        title = first_title.text(strip=False).strip()
+
+    desc = ""
+    for sel in DESC_SELECTORS:
+        el = desc_hits.get(sel)
+        if el is not None and has_text(el):
+            desc = _lexbor_text(el, "\n")
+            break
+    if not desc:
+        desc = _lexbor_text(best, " ") if best is not None else DEFAULT_DESCRIPTION
+
+    if container_ids:
+        links = container_links
+    else:
+        links = download_links or href_links
+    files = build_file_links(
+        [
+            (a.attributes.get("href"), a.attributes.get("download"), _lexbor_text(a, ""))
+            for a in links
+        ],
+        base_url,
+    )
+    return {"title": title or "challenge", "description": desc, "files": files}
+
+
+def format_size(num_bytes: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
+FSYNC_POLICIES = ("none", "file", "full")
+
+
+def remove_if_exists(path: str) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class DiskWriter:
+    """
+    Вся работа с диском из async-кода идёт через ограниченный пул потоков,
+    чтобы медленный том (NFS) не останавливал event loop и вместе с ним
+    все сетевые закачки.
+      - max_workers — потоков в пуле; 0 — выполнять прямо в event loop
+        (старое поведение, удобно для отладки);
+      - batch_bytes — запись файла копится в буфере и уходит в поток
+        кусками не меньше batch_bytes;
+      - fsync: "none" — полагаемся на ОС, "file" — fsync файла перед
+        переименованием в итоговое имя, "full" — ещё и fsync каталога.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        batch_bytes: int = 4 * DOWNLOAD_CHUNK_SIZE,
+        fsync: str = "none",
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: {fsync}")
+        self.max_workers = max(0, max_workers)
+        self.batch_bytes = max(1, batch_bytes)
+        self.fsync = fsync
+        self._executor = (
+            ThreadPoolExecutor(self.max_workers, thread_name_prefix="ctfd-disk")
+            if self.max_workers
+            else None
+        )
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+        if self._executor is None:
+            fut = asyncio.get_running_loop().create_future()
+            try:
+                fut.set_result(fn(*args))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        # контекст (журнал прогона, метрики задачи) переезжает в поток вместе с вызовом
+        ctx = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self._executor, ctx.run, fn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await self.submit(fn, *args)
+
+    async def makedirs(self, path: str) -> None:
+        await self.run(lambda: os.makedirs(path, exist_ok=True))
+
+    async def write_text(
+        self, path: str, text: str, hashes: tuple[str, ...] = ()
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Атомарно записывает текстовый файл (через <path>.part). С hashes
+        возвращает {"path", "size", <хэши>} — посчитанные по тем же байтам.
+        """
+        return await self.run(self._write_file, path, text.encode("utf-8"), hashes)
+
+    def _write_file(
+        self, path: str, data: bytes, hashes: tuple[str, ...] = ()
+    ) -> Optional[Dict[str, Any]]:
+        tmp_path = path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            self.sync_file(f)
+        os.replace(tmp_path, path)
+        self.sync_dir(path)
+        return {"path": path, **digest_bytes(data, hashes)} if hashes else None
+
+    def sync_file(self, f: Any) -> None:
+        if self.fsync != "none":
+            f.flush()
+            os.fsync(f.fileno())
+
+    def sync_fd(self, fd: int) -> None:
+        if self.fsync != "none":
+            os.fsync(fd)
+
+    def sync_dir(self, path: str) -> None:
+        if self.fsync != "full" or not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    async def open(self, path: str, mode: str = "wb") -> "DiskFile":
+        f = await self.run(open, path, mode)
+        return DiskFile(self, f)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+class DiskFile:
+    """
+    Файл, открытый через DiskWriter.open: write() копит данные и отдаёт
+    их в пул пачками. Пока одна пачка пишется, следующая уже набирается
+    из сети — ждём предыдущую запись только перед отправкой новой.
+    """
+
+    def __init__(self, writer: DiskWriter, f: Any):
+        self.writer = writer
+        self.f = f
+        self._buf = bytearray()
+        self._pending: Optional[asyncio.Future] = None
+
+    async def write(self, data: bytes) -> None:
+        self._buf += data
+        if len(self._buf) >= self.writer.batch_bytes:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if self._buf:
+            data = bytes(self._buf)
+            self._buf.clear()
+            self._pending = self.writer.submit(self.f.write, data)
+
+    async def close(self) -> None:
+        """Дописывает буфер, делает fsync по политике и закрывает файл."""
+        try:
+            await self._flush()
+            if self._pending is not None:
+                await self._pending
+                self._pending = None
+            await self.writer.run(self.writer.sync_file, self.f)
+        finally:
+            await self.writer.run(self.f.close)
+
+    async def abort(self) -> None:
+        """
+        Закрывает файл после ошибки. Уже полученные байты дописываются:
+        недокачанный файл может пригодиться для докачки.
+        """
+        with contextlib.suppress(Exception):
+            await self._flush()
+            if self._pending is not None:
+                await self._pending
+        self._pending = None
+        await self.writer.run(self.f.close)
+
+
+def cpu_count() -> int:
+    """Сколько ядер доступно процессу (с учётом affinity и cgroup cpuset)."""
+    if hasattr(os, "process_cpu_count"):
+        return os.process_cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def _init_cpu_worker(html_parser: str) -> None:
+    # дочерний процесс импортирует модуль заново — бэкенд HTML берём у родителя
+    set_html_parser(html_parser)
+
+
+def _run_cpu_batch(calls: List[tuple]) -> List[tuple]:
+    """Выполняет пачку вызовов в дочернем процессе: [(ok, результат | ошибка)]."""
+    results = []
+    for fn, args in calls:
+        try:
+            results.append((True, fn(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class CpuPool:
+    """
+    Пул процессов для работы, упирающейся в CPU: разбор HTML, хэши
+    файлов, deflate при сборке архива. В event loop остаётся только сеть.
+      - workers — процессов в пуле; 0 — выполнять прямо в event loop
+        (старое поведение), см. cpu_count() для «все ядра»;
+      - batch_size — вызовы run(), пришедшие за одну итерацию event loop,
+        уходят в процесс пачками до batch_size штук: на мелких задачах
+        (описание одной задачи) пересылка дороже самой работы.
+    Функции и аргументы должны быть picklable: только функции уровня модуля.
+    """
+
+    def __init__(self, workers: int = 0, batch_size: int = 16):
+        self.workers = max(0, workers)
+        self.batch_size = max(1, batch_size)
+        self._executor = (
+            ProcessPoolExecutor(
+                self.workers,
+                # spawn: у родителя уже крутятся потоки (DiskWriter, uvicorn),
+                # fork из такого процесса небезопасен
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_cpu_worker,
+                initargs=(HTML_PARSER,),
+            )
+            if self.workers
+            else None
+        )
+        self._queue: List[tuple] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "concurrent.futures.Future[Any]":
+        """Синхронная отправка одного вызова — для кода, работающего в потоке."""
+        if self._executor is None:
+            fut: concurrent.futures.Future = concurrent.futures.Future()
+            try:
+                fut.set_result(fn(*args))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        return self._executor.submit(fn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._queue.append((fn, args, fut))
+        if len(self._queue) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_soon(self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queue = self._queue, []
+        if not batch:
+            return
+        calls = [(fn, args) for fn, args, _ in batch]
+        waiters = [fut for _, _, fut in batch]
+        done = asyncio.wrap_future(self._executor.submit(_run_cpu_batch, calls))
+
+        def deliver(done: "asyncio.Future[List[tuple]]") -> None:
+            if done.cancelled() or done.exception() is not None:
+                error = done.exception() if not done.cancelled() else asyncio.CancelledError()
+                for fut in waiters:
+                    if not fut.done():
+                        fut.set_exception(error)
+                return
+            for fut, (ok, value) in zip(waiters, done.result()):
+                if fut.done():
+                    continue
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+
+        done.add_done_callback(deliver)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+PART_STATE_SUFFIX = ".part.json"
+
+# с какого размера файл можно качать в несколько соединений (segments > 1)
+SEGMENT_THRESHOLD = 64 * 1024 * 1024
+
+
+def pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def preallocate(fd: int, size: int) -> None:
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass  # ФС без fallocate (например, часть NFS) — хватит и truncate
+    os.ftruncate(fd, size)
+
+
+HASH_ALGORITHMS = ("sha256", "blake3")
+
+
+def hash_algorithms(use_blake3: bool = False) -> tuple[str, ...]:
+    """Какие хэши считать: sha256 всегда, BLAKE3 — если просили и есть пакет blake3."""
+    if use_blake3 and blake3 is None:
+        log("[!] Для BLAKE3 нужен пакет blake3 (pip install blake3), считаю только sha256")
+    return ("sha256", "blake3") if use_blake3 and blake3 is not None else ("sha256",)
+
+
+class FileDigest:
+    """
+    Несколько хэшей одного потока байт за один проход: куски, которые
+    уже есть в памяти (тело ответа, текст описания), второй раз с диска
+    не читаются.
+    """
+
+    def __init__(self, algorithms: tuple[str, ...] = ("sha256",)):
+        self.hashers = {}
+        for name in algorithms:
+            if name == "blake3":
+                # max_threads: большие куски blake3 хэширует на нескольких ядрах
+                self.hashers[name] = blake3.blake3(max_threads=blake3.blake3.AUTO)
+            else:
+                self.hashers[name] = hashlib.new(name)
+        self.size = 0
+
+    def update(self, data: bytes) -> None:
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        self.size += len(data)
+
+    def hexdigests(self) -> Dict[str, str]:
+        return {name: hasher.hexdigest() for name, hasher in self.hashers.items()}
+
+
+def file_hashes(info: Dict[str, Any]) -> Dict[str, str]:
+    """Хэши из результата download_file и т.п.: {"sha256": ..., ["blake3": ...]}."""
+    return {name: info[name] for name in HASH_ALGORITHMS if info.get(name)}
+
+
+def digest_bytes(data: bytes, algorithms: tuple[str, ...] = ("sha256",)) -> Dict[str, Any]:
+    digest = FileDigest(algorithms)
+    digest.update(data)
+    return {"size": digest.size, **digest.hexdigests()}
+
+
+def digest_file(
+    path: str, algorithms: tuple[str, ...] = ("sha256", "md5")
+) -> tuple[int, Dict[str, str]]:
+    """(размер, {алгоритм: hex}) файла за одно чтение."""
+    digest = FileDigest(algorithms)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.size, digest.hexdigests()
+
+
+class RangeNotSatisfiable(Exception):
+    """Сервер отверг Range для докачки (416): .part сброшен, качаем заново."""
+
+
+def resume_validator(validators: Dict[str, Any]) -> Optional[str]:
+    """
+    Значение для If-Range: только сильный ETag или Last-Modified —
+    слабый ETag (W/...) для докачки по Range использовать нельзя.
+    """
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("last_modified")
+
+
+def load_part_state(out_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Состояние недокачанного <out_path>.part из <out_path>.part.json:
+    валидаторы ответа, с которого он качался, и сколько байт уже есть.
+    """
+    state_path = out_path + PART_STATE_SUFFIX
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        offset = os.path.getsize(out_path + ".part")
+    except (OSError, ValueError):
+        return None
+    if not offset or not resume_validator(state):
+        return None
+    if state.get("total") and offset >= state["total"]:
+        return None
+    state["offset"] = offset
+    return state
+
+
+def discard_part(out_path: str) -> None:
+    remove_if_exists(out_path + ".part")
+    remove_if_exists(out_path + PART_STATE_SUFFIX)
+
+
+def hash_file_prefix(
+    path: str, length: int, algorithms: tuple[str, ...] = ("sha256",)
+) -> FileDigest:
+    """Хэши первых length байт файла — чтобы продолжить их при докачке."""
+    digest = FileDigest(algorithms)
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise OSError(f"{path} короче ожидаемых {length} байт")
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest
+
+
+def parse_content_range(value: Optional[str]) -> Optional[tuple[int, Optional[int]]]:
+    """'bytes 100-199/1000' -> (100, 1000); total '*' -> None."""
+    m = re.fullmatch(r"\s*bytes\s+(\d+)-\d+/(\d+|\*)\s*", value or "")
+    if not m:
+        return None
+    return int(m.group(1)), (int(m.group(2)) if m.group(2) != "*" else None)
+
+
+async def download_file(
+    client: httpx.AsyncClient,
+    url: str,
+    out_path: str,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    validators: Optional[Dict[str, Any]] = None,
+    on_event: Optional[EventCallback] = None,
+    timeout: Optional[httpx.Timeout] = None,
+    writer: Optional[DiskWriter] = None,
+    segments: int = 1,
+    segment_threshold: int = SEGMENT_THRESHOLD,
+    limiter: Optional["DownloadLimiter"] = None,
+    cpu: Optional[CpuPool] = None,
+    hashes: tuple[str, ...] = ("sha256",),
+) -> Dict[str, Any]:
+    """
+    Потоково скачивает файл на диск, не держа его целиком в памяти:
+      - тело читается кусками по chunk_size байт,
+      - пишется во временный <out_path>.part рядом с целевым файлом,
+      - после успешной докачки атомарно переименовывается в out_path.
+    Если сервер отдаёт Accept-Ranges: bytes и сильный валидатор, рядом
+    с .part лежит .part.json с валидаторами: при обрыве недокачанный .part
+    остаётся, и следующая попытка (в этом же прогоне или в следующем)
+    продолжает его запросом Range + If-Range. Файл на сервере поменялся —
+    сервер ответит 200 целиком, и качаем заново.
+    Если переданы validators (etag/last_modified из манифеста) и файл уже
+    лежит на диске, запрос делается условным; на 304 файл не трогаем.
+    Возвращает размер, хэши (hashes: sha256 и, если задан, blake3 —
+    считаются на лету по мере прихода тела, без повторного чтения),
+    валидаторы ответа и скорость скачивания.
+    Прогресс (file_progress) шлётся не чаще раза в PROGRESS_INTERVAL.
+    timeout — отдельные таймауты для файлов (обычно с длинным read).
+    writer — через него идёт вся запись на диск (по умолчанию прямо в
+    event loop, без пула потоков).
+    segments > 1 — файлы от segment_threshold байт, которые можно качать
+    по Range, качаются в несколько соединений (download_segmented);
+    дополнительные соединения берут слоты limiter; итоговый хэш такого
+    файла считается в cpu (CpuPool), если он задан.
+    """
+    if writer is None:
+        writer = DiskWriter(max_workers=0)
+    name = os.path.basename(out_path)
+    tmp_path = out_path + ".part"
+    started = time.monotonic()
+    size = 0
+    transferred = 0
+    digest = FileDigest(hashes)
+    exists = await writer.run(os.path.isfile, out_path)
+    headers = conditional_headers(validators) if exists else {}
+    part_state = await writer.run(load_part_state, out_path)
+    if part_state is not None:
+        headers["Range"] = f"bytes={part_state['offset']}-"
+        headers["If-Range"] = resume_validator(part_state)
+    resumable = False
+    total: Optional[int] = None
+    out_f: Optional[DiskFile] = None
+    try:
+        stream_kwargs: Dict[str, Any] = {"headers": headers}
+        if timeout is not None:
+            stream_kwargs["timeout"] = timeout
+        async with client.stream("GET", url, **stream_kwargs) as r:
+            if r.status_code == 304:
+                log(f"[=]   Файл не изменился: {os.path.basename(out_path)}")
+                return {
+                    "path": out_path,
+                    "not_modified": True,
+                    **(validators or {}),
+                }
+            if r.status_code == 416 and part_state is not None:
+                # .part не сходится с файлом на сервере — начинаем с нуля
+                await writer.run(discard_part, out_path)
+                part_state = None
+                raise RangeNotSatisfiable()
+            r.raise_for_status()
+            new_validators = response_validators(r)
+            content_range = parse_content_range(r.headers.get("Content-Range"))
+            if (
+                r.status_code == 206
+                and part_state is not None
+                and content_range is not None
+                and content_range[0] == part_state["offset"]
+            ):
+                size = part_state["offset"]
+                total = content_range[1]
+                digest = await writer.run(hash_file_prefix, tmp_path, size, hashes)
+                out_f = await writer.open(tmp_path, "ab")
+                log(f"[+]   Докачиваю {name} с {format_size(size)}")
+            elif r.status_code == 206:
+                raise httpx.HTTPStatusError(
+                    f"Неожиданный Content-Range: {r.headers.get('Content-Range')}",
+                    request=r.request,
+                    response=r,
+                )
+            else:
+                total = int(r.headers.get("Content-Length") or 0) or None
+
+            # со сжатием (Content-Encoding) Range и длины относятся к сжатому телу
+            encoded = r.headers.get("Content-Encoding", "identity").lower() != "identity"
+            if encoded:
+                total = None
+            resumable = bool(
+                not encoded
+                and resume_validator(new_validators)
+                and (r.status_code == 206 or r.headers.get("Accept-Ranges", "").lower() == "bytes")
+            )
+            segmented = bool(
+                segments > 1
+                and r.status_code == 200
+                and resumable
+                and total is not None
+                and total >= segment_threshold
+                and hasattr(os, "pwrite")
+            )
+            if resumable and not segmented:
+                await writer.write_text(
+                    out_path + PART_STATE_SUFFIX,
+                    json.dumps({"url": url, "total": total, **new_validators}),
+                )
+            else:
+                await writer.run(remove_if_exists, out_path + PART_STATE_SUFFIX)
+            # при segmented тело этого ответа не читаем: соединение закроется
+            # на выходе, а файл качает download_segmented
+            if not segmented:
+                if out_f is None:
+                    out_f = await writer.open(tmp_path)
+                emit_event(
+                    on_event, "file_started",
+                    url=url, name=name, total=total, resumed=size,
+                )
+                last_emit = started
+                async for chunk in r.aiter_bytes(chunk_size):
+                    await out_f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    transferred += len(chunk)
+                    now = time.monotonic()
+                    if now - last_emit >= PROGRESS_INTERVAL:
+                        last_emit = now
+                        emit_event(
+                            on_event, "file_progress",
+                            url=url, name=name, bytes=size, total=total,
+                        )
+                done_f, out_f = out_f, None
+                await done_f.close()
+        if segmented:
+            return await download_segmented(
+                client, url, out_path, total, new_validators,
+                segments=segments,
+                limiter=limiter,
+                chunk_size=chunk_size,
+                on_event=on_event,
+                timeout=timeout,
+                writer=writer,
+                cpu=cpu,
+                hashes=hashes,
+            )
+        if total is not None and size != total:
+            raise httpx.RemoteProtocolError(
+                f"{name}: получено {size} байт вместо {total}", request=r.request
+            )
+        await writer.run(os.replace, tmp_path, out_path)
+        await writer.run(remove_if_exists, out_path + PART_STATE_SUFFIX)
+        await writer.run(writer.sync_dir, out_path)
+    except RangeNotSatisfiable:
+        return await download_file(
+            client, url, out_path, chunk_size, validators, on_event, timeout, writer,
+            segments=segments,
+            segment_threshold=segment_threshold,
+            limiter=limiter,
+            cpu=cpu,
+            hashes=hashes,
+        )
+    except BaseException:
+        if out_f is not None:
+            await out_f.abort()
+        if resumable and size:
+            log(f"[!]   {name}: оборвалось на {format_size(size)}, .part оставлен для докачки")
+        else:
+            await writer.run(discard_part, out_path)
+        raise
+
+    add_metric("bytes_downloaded", transferred)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    speed = transferred / elapsed
+    log(
+        f"[+]   Сохранён файл {name}: "
+        f"{format_size(size)} за {elapsed:.2f} с ({format_size(speed)}/с)"
+    )
+    emit_event(
+        on_event, "file_finished",
+        url=url, name=name, bytes=size, seconds=elapsed, bytes_per_sec=speed,
+    )
+    return {
+        "path": out_path,
+        "not_modified": False,
+        "size": size,
+        **digest.hexdigests(),
+        "etag": new_validators["etag"],
+        "last_modified": new_validators["last_modified"],
+        "seconds": elapsed,
+        "bytes_per_sec": speed,
+    }
+
+async def download_segmented(
+    client: httpx.AsyncClient,
+    url: str,
+    out_path: str,
+    total: int,
+    validators: Dict[str, Any],
+    segments: int = 4,
+    limiter: Optional["DownloadLimiter"] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    on_event: Optional[EventCallback] = None,
+    timeout: Optional[httpx.Timeout] = None,
+    writer: Optional[DiskWriter] = None,
+    cpu: Optional[CpuPool] = None,
+    hashes: tuple[str, ...] = ("sha256",),
+) -> Dict[str, Any]:
+    """
+    Качает файл размера total в несколько соединений: делит его на
+    segments диапазонов и пишет их позиционно (os.pwrite) в заранее
+    выделенный <out_path>.part. Каждый запрос — Range + If-Range, так что
+    файл, поменявшийся посреди закачки, не склеится из разных версий.
+
+    Первое соединение идёт в слоте, который уже держит вызывающий код,
+    остальные сначала берут слот limiter: при занятом лимитере все куски
+    по очереди качает первое соединение, и остальным закачкам хватает
+    места. В конце проверяются размер и, если ETag похож на обычный MD5
+    (как у S3 для однокусковой загрузки), MD5 содержимого.
+    """
+    if writer is None:
+        writer = DiskWriter(max_workers=0)
+    name = os.path.basename(out_path)
+    tmp_path = out_path + ".part"
+    if_range = resume_validator(validators)
+    started = time.monotonic()
+    seg_size = max(chunk_size, -(-total // max(1, segments)))
+    ranges = collections.deque(
+        (start, min(start + seg_size, total) - 1) for start in range(0, total, seg_size)
+    )
+    n_ranges = len(ranges)
+    progress = {"bytes": 0, "last": started}
+    finished = [0]
+    all_done = asyncio.Event()
+    stream_kwargs: Dict[str, Any] = {}
+    if timeout is not None:
+        stream_kwargs["timeout"] = timeout
+
+    log(f"[+]   {name}: {format_size(total)}, качаю в {min(segments, n_ranges)} соединения")
+    emit_event(on_event, "file_started", url=url, name=name, total=total, resumed=0)
+
+    async def fetch_range(start: int, end: int, fd: int) -> None:
+        headers = {"Range": f"bytes={start}-{end}"}
+        if if_range:
+            headers["If-Range"] = if_range
+        async with client.stream("GET", url, headers=headers, **stream_kwargs) as r:
+            r.raise_for_status()
+            content_range = parse_content_range(r.headers.get("Content-Range"))
+            if r.status_code != 206 or content_range != (start, total):
+                raise httpx.HTTPStatusError(
+                    f"{name}: файл поменялся во время закачки "
+                    f"(HTTP {r.status_code}, Content-Range {r.headers.get('Content-Range')})",
+                    request=r.request,
+                    response=r,
+                )
+            pos = start
+            buf = bytearray()
+            async for chunk in r.aiter_bytes(chunk_size):
+                buf += chunk
+                progress["bytes"] += len(chunk)
+                if len(buf) >= writer.batch_bytes:
+                    await writer.run(pwrite_all, fd, bytes(buf), pos)
+                    pos += len(buf)
+                    buf.clear()
+                now = time.monotonic()
+                if now - progress["last"] >= PROGRESS_INTERVAL:
+                    progress["last"] = now
+                    emit_event(
+                        on_event, "file_progress",
+                        url=url, name=name, bytes=progress["bytes"], total=total,
+                    )
+            if buf:
+                await writer.run(pwrite_all, fd, bytes(buf), pos)
+                pos += len(buf)
+        if pos != end + 1:
+            raise httpx.RemoteProtocolError(
+                f"{name}: кусок {start}-{end} оборвался на {pos}", request=r.request
+            )
+
+    async def worker(extra: bool, fd: int) -> None:
+        slot = (
+            limiter.slot(url)
+            if extra and limiter is not None
+            else contextlib.nullcontext()
+        )
+        async with slot:
+            while ranges:
+                start, end = ranges.popleft()
+                await fetch_range(start, end, fd)
+                finished[0] += 1
+                if finished[0] == n_ranges:
+                    all_done.set()
+
+    fd = await writer.run(os.open, tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            await writer.run(preallocate, fd, total)
+            tasks = [
+                asyncio.ensure_future(worker(i > 0, fd))
+                for i in range(min(segments, n_ranges))
+            ]
+            waiter = asyncio.ensure_future(all_done.wait())
+            try:
+                while not all_done.is_set():
+                    await asyncio.wait([waiter, *tasks], return_when=asyncio.FIRST_COMPLETED)
+                    for task in tasks:
+                        if task.done() and not task.cancelled() and task.exception():
+                            raise task.exception()
+                    if not all_done.is_set() and all(task.done() for task in tasks):
+                        raise RuntimeError(f"{name}: не все куски скачаны")
+            finally:
+                # лишние соединения могли так и не дождаться слота
+                for task in (waiter, *tasks):
+                    task.cancel()
+                await asyncio.gather(waiter, *tasks, return_exceptions=True)
+            await writer.run(writer.sync_fd, fd)
+        finally:
+            await writer.run(os.close, fd)
+
+        # куски пришли не по порядку — хэшируем файл целиком, в пуле
+        # процессов, если он есть, иначе в потоке записи
+        hasher = cpu.run if cpu is not None and cpu.workers else writer.run
+        size, digests = await hasher(digest_file, tmp_path, (*hashes, "md5"))
+        md5 = digests.pop("md5")
+        if size != total:
+            raise RuntimeError(f"{name}: {size} байт вместо {total}")
+        etag = (validators.get("etag") or "").strip('"')
+        if re.fullmatch(r"[0-9a-f]{32}", etag) and etag != md5:
+            raise RuntimeError(f"{name}: MD5 {md5} не совпал с ETag {etag}")
+        await writer.run(os.replace, tmp_path, out_path)
+        await writer.run(remove_if_exists, out_path + PART_STATE_SUFFIX)
+        await writer.run(writer.sync_dir, out_path)
+    except BaseException:
+        await writer.run(discard_part, out_path)
+        raise
+
+    add_metric("bytes_downloaded", total)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    speed = total / elapsed
+    log(
+        f"[+]   Сохранён файл {name}: "
+        f"{format_size(total)} за {elapsed:.2f} с ({format_size(speed)}/с, {n_ranges} кусков)"
+    )
+    emit_event(
+        on_event, "file_finished",
+        url=url, name=name, bytes=total, seconds=elapsed, bytes_per_sec=speed,
+    )
+    return {
+        "path": out_path,
+        "not_modified": False,
+        "size": total,
+        **digests,
+        "etag": validators.get("etag"),
+        "last_modified": validators.get("last_modified"),
+        "seconds": elapsed,
+        "bytes_per_sec": speed,
+    }
+
+
+def hash_payload(payload: Dict[str, Any]) -> str:
+    stable = {k: v for k, v in payload.items() if k not in VOLATILE_PAYLOAD_KEYS}
+    if isinstance(stable.get("files"), list):
+        stable["files"] = [
+            file_url_key(f) if isinstance(f, str) else f for f in stable["files"]
+        ]
+    raw = json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ScrapeManifest:
+    """
+    Манифест уже скачанного в <out_dir>/.ctfd_manifest.json:
+      - challenges: url задачи -> id, хэш ответа API, валидаторы, результат
+        и что было сохранено (saved: files/desc/html);
+      - files: локальный путь файла -> url, размер, ETag/Last-Modified,
+        sha256 (и blake3, если считался); кроме вложений здесь же
+        description.txt и page.html — с url задачи.
+    Пути хранятся относительно out_dir, чтобы дамп можно было переносить.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, MANIFEST_NAME)
+        self.challenges: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, root: str) -> "ScrapeManifest":
+        manifest = cls(root)
+        if os.path.isfile(manifest.path):
+            try:
+                with open(manifest.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                manifest.challenges = data.get("challenges") or {}
+                manifest.files = data.get("files") or {}
+            except (OSError, ValueError) as e:
+                log(f"[!] Не удалось прочитать манифест {manifest.path}: {e}")
+        return manifest
+
+    def save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": 1, "challenges": self.challenges, "files": self.files},
+                f,
+                ensure_ascii=False,
+                indent=1,
+            )
+        os.replace(tmp_path, self.path)
+
+    def rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def abs(self, rel_path: str) -> str:
+        return os.path.normpath(os.path.join(self.root, rel_path))
+
+    def file_validators(self, url: str, out_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Валидаторы для условного запроса — только если файл на месте и того же размера.
+        URL сравниваются без одноразового токена (file_url_key).
+        """
+        entry = self.files.get(self.rel(out_path))
+        if not entry or file_url_key(entry.get("url") or "") != file_url_key(url):
+            return None
+        try:
+            if os.path.getsize(out_path) != entry.get("size"):
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def put_file(self, url: str, info: Dict[str, Any]) -> None:
+        if info.get("not_modified"):
+            return
+        self.files[self.rel(info["path"])] = {
+            "url": url,
+            "size": info["size"],
+            "etag": info.get("etag"),
+            "last_modified": info.get("last_modified"),
+            **file_hashes(info),
+        }
+
+    def challenge_is_intact(
+        self,
+        url: str,
+        save_files: bool = True,
+        save_desc: bool = True,
+        save_html: bool = False,
+    ) -> bool:
+        """
+        Задача уже есть в дампе: папка на месте, все её файлы нужного размера,
+        и прошлый проход сохранил всё, что просят сейчас (save_*). Записи без
+        "saved" (старые манифесты) не считаются полными.
+        """
+        entry = self.challenges.get(url)
+        if not entry or not os.path.isdir(self.abs(entry["dir"])):
+            return False
+        saved = entry.get("saved") or {}
+        wanted = {"files": save_files, "desc": save_desc, "html": save_html}
+        if any(want and not saved.get(kind) for kind, want in wanted.items()):
+            return False
+        for kind, name in (("desc", "description.txt"), ("html", "page.html")):
+            if wanted[kind] and not os.path.isfile(self.abs(os.path.join(entry["dir"], name))):
+                return False
+        for rel_path in entry.get("files") or []:
+            f_entry = self.files.get(rel_path)
+            f_path = self.abs(rel_path)
+            if not f_entry or not os.path.isfile(f_path):
+                return False
+            if os.path.getsize(f_path) != f_entry.get("size"):
+                return False
+        return True
+
+    def challenge_files(self, url: str) -> List[Dict[str, Any]]:
+        """Файлы задачи (текстовые и вложения) с размерами и хэшами — для экспорта."""
+        entry = self.challenges.get(url)
+        if not entry:
+            return []
+        rel_paths = [os.path.join(entry["dir"], name) for name in ("description.txt", "page.html")]
+        rel_paths.extend(entry.get("files") or [])
+        files = []
+        for rel_path in rel_paths:
+            f_entry = self.files.get(rel_path)
+            if f_entry:
+                files.append({"path": rel_path.replace(os.sep, "/"), **f_entry})
+        return files
+
+    def challenge_result(self, url: str) -> Dict[str, Any]:
+        entry = self.challenges[url]
+        return {
+            "url": url,
+            "title": entry["title"],
+            "dir": self.abs(entry["dir"]),
+            "files_count": entry.get("files_count", 0),
+            "category": entry.get("category") or "",
+        }
+
+
+class DownloadLimiter:
+    """
+    Общий планировщик закачки файлов: глобальный лимит одновременных
+    передач плюс отдельный лимит на каждый хост. Не зависит от
+    concurrency по задачам, так что тяжёлые по файлам задачи не
+    блокируют разбор остальных.
+    """
+
+    def __init__(self, max_total: int = 8, max_per_host: int = 4):
+        self.max_total = max(1, max_total)
+        self.max_per_host = max(1, max_per_host)
+        self._total = asyncio.Semaphore(self.max_total)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str):
+        host = urlparse(url).netloc
+        host_sem = self._hosts.get(host)
+        if host_sem is None:
+            host_sem = self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+        # сначала ждём слот хоста, чтобы не занимать глобальный слот впустую
+        async with host_sem:
+            async with self._total:
+                yield
+
+
+@dataclass
+class CachedPage:
+    url: str
+    html: str
+    _info: Optional[Dict[str, Any]] = field(default=None, repr=False)
+    _parsing: Optional[asyncio.Future] = field(default=None, repr=False)
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        # разбираем один раз, при первом обращении: дискавери нужен только текст
+        if self._info is None:
+            self._info = extract_page_info(self.html, self.url)
+        return self._info
+
+    async def parse(self, cpu: Optional[CpuPool] = None) -> Dict[str, Any]:
+        """То же, что info, но разбор идёт в пуле процессов — один на всех ждущих."""
+        if self._info is not None or cpu is None or not cpu.workers:
+            return self.info
+        if self._parsing is None:
+            self._parsing = asyncio.ensure_future(
+                cpu.run(extract_page_info, self.html, self.url)
+            )
+        self._info = await asyncio.shield(self._parsing)
+        return self._info
+
+
+class PageCache:
+    """
+    Кэш HTML-документов на время одного прогона, раздельно по хостам.
+    Все /challenges#-<id> — это один и тот же документ (фрагмент
+    обрабатывается в браузере), поэтому ключ — URL без фрагмента.
+    Одновременные запросы одного URL ждут один и тот же запрос
+    (single-flight); неудачная загрузка из кэша убирается, чтобы
+    повторная попытка задачи сходила в сеть заново.
+    """
+
+    def __init__(self):
+        self._hosts: Dict[str, Dict[str, asyncio.Future]] = {}
+        self.fetches = 0
+        self.hits = 0
+
+    async def get(self, client: httpx.AsyncClient, url: str) -> CachedPage:
+        key = url.split("#", 1)[0]
+        pages = self._hosts.setdefault(urlparse(key).netloc, {})
+        fut = pages.get(key)
+        if fut is None:
+            self.fetches += 1
+            fut = pages[key] = asyncio.ensure_future(self._load(client, key))
+            fut.add_done_callback(lambda f: self._forget_failed(pages, key, f))
+        else:
+            self.hits += 1
+        # shield: отмена одного ожидающего не должна отменять загрузку остальным
+        return await asyncio.shield(fut)
+
+    @staticmethod
+    async def _load(client: httpx.AsyncClient, url: str) -> CachedPage:
+        # запрос и его время — в метрики задачи, которая сходила в сеть;
+        # попадания в кэш и разбор страницы в html_seconds не входят
+        log(f"[+] GET {url} (HTML-страница)")
+        add_metric("html_requests")
+        started = time.monotonic()
+        try:
+            resp = await client.get(url)
+            resp.raise_for_status()
+            return CachedPage(url=url, html=resp.text)
+        finally:
+            add_metric("html_seconds", time.monotonic() - started)
+
+    @staticmethod
+    def _forget_failed(pages: Dict[str, asyncio.Future], key: str, fut: asyncio.Future) -> None:
+        if fut.cancelled() or fut.exception() is not None:
+            if pages.get(key) is fut:
+                del pages[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"fetches": self.fetches, "hits": self.hits}
+
+
+def reflink_file(src: str, dst: str) -> None:
+    if fcntl is None:
+        raise OSError("reflink не поддерживается на этой платформе")
+    try:
+        with open(src, "rb") as src_f, open(dst, "wb") as dst_f:
+            fcntl.ioctl(dst_f.fileno(), FICLONE, src_f.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+
+def link_file(src: str, dst: str) -> str:
+    """
+    Кладёт в dst то же содержимое, что в src, не копируя данные, если
+    получится: hardlink, затем reflink (FICLONE), и только потом обычная
+    копия. Замена атомарная, через <dst>.part. Возвращает способ.
+    Жёсткие ссылки безопасны: download_file никогда не пишет в готовый
+    файл, а подменяет его через os.replace.
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return "hardlink"
+    tmp_path = dst + ".part"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+        method = "hardlink"
+    except OSError:
+        try:
+            reflink_file(src, tmp_path)
+            method = "reflink"
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+            method = "copy"
+    os.replace(tmp_path, dst)
+    return method
+
+
+class FileStore:
+    """
+    Дедупликация вложений в пределах одного прогона. Организаторы часто
+    прикладывают один и тот же libc или образ VM к нескольким задачам:
+      - один URL (без одноразового ?token=) качается один раз
+        (single-flight): остальные задачи ждут ту же закачку и получают
+        ссылку на готовый файл в свою files/;
+      - файлы с разных URL, но с одинаковым sha256, после закачки тоже
+        заменяются ссылкой на первый экземпляр.
+    """
+
+    def __init__(self, writer: Optional[DiskWriter] = None):
+        self.writer = writer or DiskWriter(max_workers=0)
+        self._urls: Dict[str, asyncio.Future] = {}
+        self._hashes: Dict[str, str] = {}
+        self.downloads = 0
+        self.linked = 0
+        self.bytes_saved = 0
+
+    async def fetch(
+        self,
+        url: str,
+        out_path: str,
+        download: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        download() качает url в out_path и возвращает результат download_file.
+        Один и тот же файл с разными ?token= (file_url_key) качается один раз.
+        """
+        key = file_url_key(url)
+        fut = self._urls.get(key)
+        if fut is None:
+            self.downloads += 1
+            fut = self._urls[key] = asyncio.ensure_future(download())
+            fut.add_done_callback(lambda f: self._forget_failed(key, f))
+        info = await asyncio.shield(fut)
+
+        if info["path"] != out_path:
+            return await self._link(info, info["path"], out_path)
+
+        sha256 = info.get("sha256")
+        if sha256:
+            first = self._hashes.setdefault(sha256, out_path)
+            if first != out_path and await self.writer.run(os.path.isfile, first):
+                return await self._link(info, first, out_path)
+        return info
+
+    async def _link(self, info: Dict[str, Any], src: str, dst: str) -> Dict[str, Any]:
+        await self.writer.makedirs(os.path.dirname(dst) or ".")
+        method = await self.writer.run(link_file, src, dst)
+        size = await self.writer.run(os.path.getsize, dst)
+        self.linked += 1
+        if method != "copy":
+            self.bytes_saved += size
+        log(f"[=]   {os.path.basename(dst)}: уже скачан, {method} на {src}")
+        return {
+            "path": dst,
+            "not_modified": False,
+            "size": size,
+            **file_hashes(info),
+            "etag": info.get("etag"),
+            "last_modified": info.get("last_modified"),
+            "linked": method,
+        }
+
+    def _forget_failed(self, key: str, fut: asyncio.Future) -> None:
+        if fut.cancelled() or fut.exception() is not None:
+            if self._urls.get(key) is fut:
+                del self._urls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "downloads": self.downloads,
+            "linked": self.linked,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+class BlobStore:
+    """
+    Общее для всех дампов хранилище файлов по sha256:
+      <root>/objects/ab/abcdef... — сами файлы;
+      <root>/index.json — blobs: sha256 -> размер и время последнего
+      использования; urls: url -> sha256, ETag/Last-Modified.
+    Файлы в дампы кладутся жёсткими ссылками (link_file), так что число
+    ссылок на blob (st_nlink - 1) — это число дампов, где он лежит.
+    URL хранятся без одноразового ?token= (file_url_key).
+    При max_bytes > 0 save() выкидывает давно не использованные blobs,
+    на которые не ссылается ни один дамп, пока они не влезут в лимит:
+    удаление blob, жёстко связанного с дампом, места не освобождает.
+    Для экономии места хранилище должно быть на той же ФС, что и дампы.
+    """
+
+    INDEX_NAME = "index.json"
+
+    def __init__(self, root: str, max_bytes: int = 0):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max(0, max_bytes)
+        self.index_path = os.path.join(self.root, self.INDEX_NAME)
+        self.blobs: Dict[str, Dict[str, Any]] = {}
+        self.urls: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.stored = 0
+        # checkout/put вызываются из потоков DiskWriter
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, root: str, max_bytes: int = 0) -> "BlobStore":
+        store = cls(root, max_bytes)
+        os.makedirs(os.path.join(store.root, "objects"), exist_ok=True)
+        if os.path.isfile(store.index_path):
+            try:
+                with open(store.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                store.blobs = data.get("blobs") or {}
+                store.urls = data.get("urls") or {}
+            except (OSError, ValueError) as e:
+                log(f"[!] Не удалось прочитать индекс хранилища {store.index_path}: {e}")
+        return store
+
+    def save(self) -> None:
+        # хранилищем могут одновременно пользоваться несколько дампов:
+        # перед записью подмешиваем то, что они успели сохранить
+        on_disk = BlobStore.load(self.root)
+        for sha256, blob in on_disk.blobs.items():
+            mine = self.blobs.get(sha256)
+            if mine is None or mine["used"] < blob["used"]:
+                self.blobs[sha256] = blob
+        self.urls = {**on_disk.urls, **self.urls}
+        if self.max_bytes:
+            self.evict(self.max_bytes)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": 1, "blobs": self.blobs, "urls": self.urls},
+                f,
+                ensure_ascii=False,
+                indent=1,
+            )
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], sha256)
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Что хранилище знает про url: sha256, размер и валидаторы для
+        условного запроса. None, если blob уже выселен или повреждён.
+        """
+        entry = self.urls.get(file_url_key(url))
+        if not entry or not (entry.get("etag") or entry.get("last_modified")):
+            return None
+        path = self.blob_path(entry["sha256"])
+        try:
+            if os.path.getsize(path) != entry.get("size"):
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def checkout(self, entry: Dict[str, Any], out_path: str) -> None:
+        """Кладёт blob из entry в out_path (ссылкой, если получится)."""
+        with self._lock:
+            link_file(self.blob_path(entry["sha256"]), out_path)
+            self._touch(entry["sha256"], entry["size"])
+
+    def put(self, url: str, info: Dict[str, Any], hit: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Регистрирует результат download_file. Новое содержимое попадает в
+        хранилище, а уже известное заменяет out_path ссылкой на blob.
+        hit — запись lookup(), по которой файл был взят из хранилища
+        до условного запроса: на 304 это и есть результат.
+        """
+        with self._lock:
+            return self._put(url, info, hit)
+
+    def _put(self, url: str, info: Dict[str, Any], hit: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        out_path = info["path"]
+        if info.get("not_modified"):
+            if hit is None:
+                return info
+            self.hits += 1
+            log(f"[=]   {os.path.basename(out_path)}: взят из хранилища, не скачивая")
+            return {
+                "path": out_path,
+                "not_modified": False,
+                "size": hit["size"],
+                **file_hashes(hit),
+                "etag": hit.get("etag"),
+                "last_modified": hit.get("last_modified"),
+                "blob": "hit",
+            }
+
+        sha256 = info["sha256"]
+        path = self.blob_path(sha256)
+        if os.path.isfile(path) and os.path.getsize(path) == info["size"]:
+            link_file(path, out_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            link_file(out_path, path)
+            self.stored += 1
+        self._touch(sha256, info["size"])
+        self.urls[file_url_key(url)] = {
+            **file_hashes(info),
+            "size": info["size"],
+            "etag": info.get("etag"),
+            "last_modified": info.get("last_modified"),
+        }
+        return info
+
+    def _touch(self, sha256: str, size: int) -> None:
+        self.blobs[sha256] = {"size": size, "used": time.time()}
+
+    def refcount(self, sha256: str) -> int:
+        try:
+            return os.stat(self.blob_path(sha256)).st_nlink - 1
+        except OSError:
+            return 0
+
+    def evict(self, max_bytes: int) -> int:
+        """
+        LRU-выселение blobs без ссылок из дампов (refcount() == 0), пока
+        их суммарный размер не станет <= max_bytes. Blobs, лежащие в
+        дампах, не трогаются и в лимит не считаются: место они занимают
+        всё равно. Возвращает число удалённых blobs.
+        """
+        for sha256 in list(self.blobs):
+            if not os.path.isfile(self.blob_path(sha256)):
+                del self.blobs[sha256]
+        unreferenced = [
+            (sha256, blob) for sha256, blob in self.blobs.items() if self.refcount(sha256) == 0
+        ]
+        total = sum(blob["size"] for _, blob in unreferenced)
+        removed = 0
+        for sha256, blob in sorted(unreferenced, key=lambda kv: kv[1]["used"]):
+            if total <= max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.blob_path(sha256))
+            del self.blobs[sha256]
+            total -= blob["size"]
+            removed += 1
+        if removed:
+            live = set(self.blobs)
+            self.urls = {u: e for u, e in self.urls.items() if e["sha256"] in live}
+            log(f"[+] Из хранилища выселено blobs: {removed}")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "stored": self.stored,
+            "blobs": len(self.blobs),
+            "bytes": sum(b["size"] for b in self.blobs.values()),
+        }
+
+
 async def scrape_ctfd_challenge(
     client: httpx.AsyncClient,
     url: str,
@@ -226,103 +2492,186 @@ async def scrape_ctfd_challenge(
     save_files: bool = True,
     save_desc: bool = True,
     save_html: bool = False,
+    api_first: bool = True,
+    meta_limiter: Optional[asyncio.Semaphore] = None,
+    download_limiter: Optional[DownloadLimiter] = None,
+    manifest: Optional[ScrapeManifest] = None,
+    update: bool = False,
+    on_event: Optional[EventCallback] = None,
+    download_timeout: Optional[httpx.Timeout] = None,
+    descriptor: Optional[ChallengeDescriptor] = None,
+    page_cache: Optional[PageCache] = None,
+    file_store: Optional[FileStore] = None,
+    blob_store: Optional[BlobStore] = None,
+    writer: Optional[DiskWriter] = None,
+    segments: int = 1,
+    segment_threshold: int = SEGMENT_THRESHOLD,
+    cpu: Optional[CpuPool] = None,
+    hashes: tuple[str, ...] = ("sha256",),
 ) -> Optional[Dict[str, Any]]:
     """
     Скачивает одну задачу:
-      - ID берём из фрагмента #...-<id> или из пути /challenges/<id>
+      - ID берём из descriptor, фрагмента #...-<id> или пути /challenges/<id>
       - по ID идём в /api/v1/challenges/<id>
       - при проблемах с API падаем на HTML-разбор.
-    """
-    print(f"[+] GET {url} (страница задачи)")
-    # это будет /challenges#-id — сервер всё равно вернёт /challenges
-    resp = await client.get(url)
-    resp.raise_for_status()
 
-    html_text = resp.text
-    soup = BeautifulSoup(html_text, "html.parser")
+    Если descriptor пришёл из списка API и описание с файлами не нужны
+    (save_desc=False, save_files=False), детальный запрос не делается вовсе:
+    name/category/value берутся из списка.
+
+    При api_first=True HTML-страница запрашивается только если API не ответил,
+    в ответе API не хватает полей или включён save_html.
+
+    Если передан manifest, результат и файлы записываются в него. В режиме
+    update задача, чей ответ API не изменился (304 или тот же хэш) и чьи
+    файлы лежат на месте, пропускается, а файлы качаются условными запросами.
+
+    page_cache (общий на прогон) избавляет от повторной загрузки и разбора
+    одной и той же /challenges, когда HTML-фолбэк нужен многим задачам,
+    а file_store — от повторной закачки одинаковых вложений. С blob_store
+    файл, уже известный хранилищу, берётся оттуда: достаточно условного
+    запроса с его ETag, и на 304 тело не передаётся вовсе.
 
+    Запись на диск идёт через writer (DiskWriter, общий на прогон);
+    без него — прямо в event loop. segments/segment_threshold — закачка
+    больших файлов в несколько соединений (см. download_segmented).
+    cpu (CpuPool) — разбор HTML и описаний в пуле процессов.
+    hashes — какие хэши считать для вложений и текстовых файлов задачи
+    (см. hash_algorithms); они попадают в manifest.
+    """
+    if writer is None:
+        writer = DiskWriter(max_workers=0)
+    if cpu is None:
+        cpu = CpuPool(workers=0)
     p = urlparse(url)
     site_root = f"{p.scheme}://{p.netloc}"
 
-    # ---- достаём ID задачи ----
-    challenge_id: Optional[int] = None
+    # HTML-страницу задачи качаем лениво: /challenges#-id всё равно отдаёт
+    # общую страницу /challenges, и при живом API она почти никогда не нужна.
+    if page_cache is None:
+        page_cache = PageCache()
+
+    async def get_page() -> tuple[str, Dict[str, Any]]:
+        cached = await page_cache.get(client, url)
+        return cached.html, await cached.parse(cpu)
+
+    # слот метаданных держим только на время запросов к API/HTML,
+    # файлы качаются уже вне его, под отдельным лимитом
+    meta_slot = meta_limiter if meta_limiter is not None else contextlib.nullcontext()
+    async with meta_slot:
+        if not api_first or save_html:
+            await get_page()
 
-    # 1) сначала пробуем из фрагмента #...-<id>, например "#-23" или "#Скоростные-Пазлы-1-23"
-    frag = p.fragment or ""
-    if frag:
-        nums = re.findall(r"\d+", frag)
-        if nums:
+        # ---- достаём ID задачи ----
+        if descriptor is not None and descriptor.id is not None:
+            challenge_id: Optional[int] = descriptor.id
+        else:
+            challenge_id = parse_challenge_id(url)
+        listing = descriptor.listing if descriptor is not None else {}
+        # детали нужны только ради описания и файлов (или если в списке нет имени)
+        need_detail = save_desc or save_files or not listing.get("name")
+
+        api_data: Optional[Dict[str, Any]] = None
+        api_validators: Dict[str, Optional[str]] = {}
+        prev_entry: Optional[Dict[str, Any]] = None
+        if update and manifest is not None and await writer.run(
+            manifest.challenge_is_intact, url, save_files, save_desc, save_html
+        ):
+            prev_entry = manifest.challenges[url]
+
+        # ---- пробуем достать данные через API ----
+        if challenge_id is not None and not need_detail:
+            api_data = dict(listing)
+            log(f"[+] Задача {challenge_id}: хватает данных из списка, детали не запрашиваю")
+        elif challenge_id is not None:
+            api_root = get_api_root(url)
+            api_url = f"{api_root}/challenges/{challenge_id}"
+            api_started = time.monotonic()
             try:
-                challenge_id = int(nums[-1])
-            except ValueError:
-                challenge_id = None
+                add_metric("api_requests")
+                data, api_validators = await api_get_json_conditional(
+                    client, api_url, prev_entry.get("api") if prev_entry else None
+                )
+                add_metric("api_seconds", time.monotonic() - api_started)
+                if data is None and prev_entry is not None:
+                    add_metric("unchanged")
+                    log(f"[=] Задача {challenge_id} не изменилась (304), пропускаю")
+                    return manifest.challenge_result(url)
+                if data and data.get("success", False):
+                    api_data = data.get("data") or {}
+                    log(f"[+] Получены данные задачи через API: id={challenge_id}")
+                else:
+                    log(
+                        f"[!] API /challenges/{challenge_id} вернул success={data.get('success')}, "
+                        f"использую HTML."
+                    )
+            except Exception as e:
+                add_metric("api_seconds", time.monotonic() - api_started)
+                log(f"[!] Не удалось получить задачу {challenge_id} через API: {e}")
 
-    # 2) если с фрагментом не получилось — пробуем из пути /challenges/<id>
-    if challenge_id is None:
-        path_parts = [seg for seg in p.path.split("/") if seg]
-        if len(path_parts) >= 2 and path_parts[0] == "challenges" and path_parts[1].isdigit():
-            challenge_id = int(path_parts[1])
+        payload_hash = hash_payload(api_data) if api_data else None
+        if (
+            prev_entry is not None
+            and payload_hash is not None
+            and prev_entry.get("payload_hash") == payload_hash
+        ):
+            log(f"[=] Задача {challenge_id} не изменилась, пропускаю")
+            add_metric("unchanged")
+            prev_entry["api"] = api_validators
+            return manifest.challenge_result(url)
 
-    api_data: Optional[Dict[str, Any]] = None
+        # ---- формируем title/description/files ----
+        if api_data:
+            title_core = api_data.get("name")
+            if not title_core:
+                _, info = await get_page()
+                title_core = info["title"]
+            category = api_data.get("category") or ""
+            value = api_data.get("value")
 
-    # ---- пробуем достать данные через API ----
-    if challenge_id is not None:
-        api_root = get_api_root(url)
-        api_url = f"{api_root}/challenges/{challenge_id}"
-        try:
-            data = await api_get_json(client, api_url)
-            if data.get("success", False):
-                api_data = data.get("data") or {}
-                print(f"[+] Получены данные задачи через API: id={challenge_id}")
+            if category:
+                title = f"[{category}] {title_core}"
             else:
-                print(
-                    f"[!] API /challenges/{challenge_id} вернул success={data.get('success')}, "
-                    f"использую HTML."
-                )
-        except Exception as e:
-            print(f"[!] Не удалось получить задачу {challenge_id} через API: {e}")
+                title = title_core
 
-    # ---- формируем title/description/files ----
-    if api_data:
-        title_core = api_data.get("name") or extract_title(soup)
-        category = api_data.get("category") or ""
-        value = api_data.get("value")
+            desc_html = api_data.get("description") or ""
+            if desc_html:
+                desc = await cpu.run(html_to_text, desc_html)
+            elif save_desc:
+                _, info = await get_page()
+                desc = info["description"]
+            else:
+                desc = ""
 
-        if category:
-            title = f"[{category}] {title_core}"
-        else:
-            title = title_core
+            files: List[tuple[str, str]] = []
+            for rel in api_data.get("files") or []:
+                if not rel:
+                    continue
+                f_url = urljoin(site_root, rel)
+                fname = os.path.basename(urlparse(rel).path) or "file"
+                fname = safe_name(fname)
+                files.append((fname, f_url))
 
-        desc_html = api_data.get("description") or ""
-        if desc_html:
-            desc = BeautifulSoup(desc_html, "html.parser").get_text("\n", strip=True)
+            extra_meta_lines = []
+            if category:
+                extra_meta_lines.append(f"Category: {category}")
+            if value is not None:
+                extra_meta_lines.append(f"Points: {value}")
+            meta_header = "\n".join(extra_meta_lines)
         else:
-            desc = extract_description(soup)
-
-        files: List[tuple[str, str]] = []
-        for rel in api_data.get("files") or []:
-            if not rel:
-                continue
-            f_url = urljoin(site_root, rel)
-            fname = os.path.basename(urlparse(rel).path) or "file"
-            fname = safe_name(fname)
-            files.append((fname, f_url))
-
-        extra_meta_lines = []
-        if category:
-            extra_meta_lines.append(f"Category: {category}")
-        if value is not None:
-            extra_meta_lines.append(f"Points: {value}")
-        meta_header = "\n".join(extra_meta_lines)
-    else:
-        # API не сработал — пробуем выжать максимум из HTML
-        title = extract_title(soup)
-        desc = extract_description(soup)
-        files = extract_file_links(soup, url)
-        meta_header = ""
+            # API не сработал — пробуем выжать максимум из HTML,
+            # но имя и категорию из списка задач не теряем
+            _, info = await get_page()
+            category = listing.get("category") or ""
+            title_core = listing.get("name") or info["title"]
+            title = f"[{category}] {title_core}" if category else title_core
+            desc = info["description"]
+            files = info["files"]
+            meta_header = ""
 
     # ---- сохраняем на диск ----
     base_name = safe_name(title)
+    files = unique_file_names(files)
 
     # подпапка категории
     category_dir_name: Optional[str] = None
@@ -341,44 +2690,112 @@ async def scrape_ctfd_challenge(
             challenge_dir = base_name
 
 
-    os.makedirs(challenge_dir, exist_ok=True)
+    await writer.makedirs(challenge_dir)
 
     # HTML
     if save_html:
         html_path = os.path.join(challenge_dir, "page.html")
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(html_text)
+        html_text, _ = await get_page()
+        html_info = await writer.write_text(html_path, html_text, hashes)
+        if manifest is not None:
+            manifest.put_file(url, html_info)
 
     # Описание
     if save_desc:
         desc_path = os.path.join(challenge_dir, "description.txt")
-        with open(desc_path, "w", encoding="utf-8") as f:
-            f.write(f"URL: {url}\n")
-            if challenge_id is not None:
-                f.write(f"Challenge ID: {challenge_id}\n")
-            if api_data:
-                f.write(f"Title: {api_data.get('name') or title}\n")
-            else:
-                f.write(f"Title: {title}\n")
-            if meta_header:
-                f.write(meta_header + "\n")
-            f.write("\n")
-            f.write(desc or "Описание не найдено.")
+        lines = [f"URL: {url}\n"]
+        if challenge_id is not None:
+            lines.append(f"Challenge ID: {challenge_id}\n")
+        if api_data:
+            lines.append(f"Title: {api_data.get('name') or title}\n")
+        else:
+            lines.append(f"Title: {title}\n")
+        if meta_header:
+            lines.append(meta_header + "\n")
+        lines.append("\n")
+        lines.append(desc or "Описание не найдено.")
+        desc_info = await writer.write_text(desc_path, "".join(lines), hashes)
+        if manifest is not None:
+            manifest.put_file(url, desc_info)
 
     # Файлы
     saved_files_count = 0
     if save_files and files:
         files_dir = os.path.join(challenge_dir, "files")
-        os.makedirs(files_dir, exist_ok=True)
+        await writer.makedirs(files_dir)
 
-        for fname, f_url in files:
-            print(f"[+]   Скачиваю файл: {f_url}")
-            r = await client.get(f_url)
-            r.raise_for_status()
+        async def fetch_one(fname: str, f_url: str) -> None:
             out_path = os.path.join(files_dir, fname)
-            with open(out_path, "wb") as out_f:
-                out_f.write(r.content)
-            saved_files_count += 1
+
+            async def download() -> Dict[str, Any]:
+                slot = (
+                    download_limiter.slot(f_url)
+                    if download_limiter is not None
+                    else contextlib.nullcontext()
+                )
+                async with slot:
+                    log(f"[+]   Скачиваю файл: {f_url}")
+                    validators = (
+                        await writer.run(manifest.file_validators, f_url, out_path)
+                        if update and manifest is not None
+                        else None
+                    )
+                    hit = None
+                    if blob_store is not None and validators is None:
+                        hit = await writer.run(blob_store.lookup, f_url)
+                        if hit is not None:
+                            # сначала кладём известную версию, потом условный
+                            # запрос: на 304 она и остаётся, на 200 заменяется
+                            await writer.run(blob_store.checkout, hit, out_path)
+                            validators = hit
+                    info = await download_file(
+                        client,
+                        f_url,
+                        out_path,
+                        validators=validators,
+                        on_event=on_event,
+                        timeout=download_timeout,
+                        writer=writer,
+                        segments=segments,
+                        segment_threshold=segment_threshold,
+                        limiter=download_limiter,
+                        cpu=cpu,
+                        hashes=hashes,
+                    )
+                    if blob_store is not None:
+                        info = await writer.run(blob_store.put, f_url, info, hit)
+                    return info
+
+            # ожидание чужой закачки того же URL не занимает слот лимитера
+            if file_store is not None:
+                info = await file_store.fetch(f_url, out_path, download)
+            else:
+                info = await download()
+            add_metric("files")
+            add_metric("bytes", info.get("size") or 0)
+            if manifest is not None:
+                manifest.put_file(f_url, info)
+
+        await asyncio.gather(*(fetch_one(fname, f_url) for fname, f_url in files))
+        saved_files_count = len(files)
+
+    if manifest is not None:
+        manifest.challenges[url] = {
+            "id": challenge_id,
+            "title": title,
+            "category": category or "",
+            "dir": manifest.rel(challenge_dir),
+            "files_count": saved_files_count,
+            "files": (
+                [manifest.rel(os.path.join(challenge_dir, "files", fname)) for fname, _ in files]
+                if save_files
+                else []
+            ),
+            "payload_hash": payload_hash,
+            "api": api_validators,
+            # что сохранено: пропуск без скачивания — только если этого хватает
+            "saved": {"files": save_files, "desc": save_desc, "html": save_html},
+        }
 
     return {
         "url": url,
@@ -389,49 +2806,81 @@ async def scrape_ctfd_challenge(
     }
 
 
-async def discover_challenge_urls_from_list(
+async def iter_challenges_from_list(
     client: httpx.AsyncClient,
     list_url: str,
-) -> List[str]:
+    page_cache: Optional[PageCache] = None,
+) -> AsyncIterator[ChallengeDescriptor]:
     """
-    Пытается найти задачи:
-      1) сначала через /api/v1/challenges (JS вообще не нужен),
+    Потоково находит задачи:
+      1) сначала через /api/v1/challenges (JS вообще не нужен) — ссылки
+         отдаются по мере прихода страниц API, задачи можно качать сразу;
       2) если API не сработал — разбираем HTML-верстку /challenges как fallback.
 
     ВАЖНО: "красивые" ссылки делаем вида:
       https://host/challenges#-<id>
+    Данные из списка API едут дальше в ChallengeDescriptor.listing.
     """
     p = urlparse(list_url)
     base_root = f"{p.scheme}://{p.netloc}"
-    urls: List[str] = []
+    found = 0
 
     # ---------- 1) Пробуем API ----------
     try:
-        chals = await api_list_challenges(client, list_url)
-        for chal in chals:
-            cid = chal.get("id")
-            if isinstance(cid, int) or (isinstance(cid, str) and cid.isdigit()):
-                cid_str = str(cid)
-                # вот тут и делаем нужный формат
-                urls.append(f"{base_root}/challenges#-{cid_str}")
-        urls = sorted(set(urls))
-        if urls:
-            print(f"[+] Через API найдено задач: {len(urls)}")
-            for u in urls:
-                print(f"    - {u}")
-            return urls
-        else:
-            print("[!] API /challenges вернул пустой список, пробую HTML-разбор…")
+        async for chal in iter_api_challenges(client, list_url):
+            desc = ChallengeDescriptor.from_listing(base_root, chal)
+            if desc is not None:
+                found += 1
+                yield desc
+        if found:
+            return
+        log("[!] API /challenges вернул пустой список, пробую HTML-разбор…")
     except Exception as e:
-        print(f"[!] Ошибка при получении списка задач через API: {e}")
-        print("[!] Пытаюсь разобрать HTML-страницу /challenges…")
+        log(f"[!] Ошибка при получении списка задач через API: {e}")
+        log("[!] Пытаюсь разобрать HTML-страницу /challenges…")
 
     # ---------- 2) Fallback: HTML /challenges ----------
-    print(f"[+] Открываю страницу списка задач: {list_url}")
-    resp = await client.get(list_url)
-    resp.raise_for_status()
+    for u in await discover_challenge_urls_from_html(client, list_url, page_cache):
+        yield ChallengeDescriptor.from_url(u)
+
+
+async def iter_challenge_urls_from_list(
+    client: httpx.AsyncClient,
+    list_url: str,
+) -> AsyncIterator[str]:
+    async for desc in iter_challenges_from_list(client, list_url):
+        yield desc.url
+
+
+async def discover_challenge_urls_from_list(
+    client: httpx.AsyncClient,
+    list_url: str,
+) -> List[str]:
+    """
+    То же, что iter_challenge_urls_from_list, но сразу весь отсортированный список.
+    """
+    urls = sorted({u async for u in iter_challenge_urls_from_list(client, list_url)})
+    for u in urls:
+        log(f"    - {u}")
+    return urls
+
+
+async def discover_challenge_urls_from_html(
+    client: httpx.AsyncClient,
+    list_url: str,
+    page_cache: Optional[PageCache] = None,
+) -> List[str]:
+    """
+    HTML-фолбэк: ищем ссылки и кнопки задач в верстке /challenges.
+    С page_cache скачанная страница потом достаётся задачам бесплатно.
+    """
+    p = urlparse(list_url)
+    log(f"[+] Открываю страницу списка задач: {list_url}")
+    if page_cache is None:
+        page_cache = PageCache()
+    page = await page_cache.get(client, list_url)
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = make_soup(page.html)
     base_host = p.netloc
 
     url_set: set[str] = set()
@@ -489,9 +2938,9 @@ async def discover_challenge_urls_from_list(
             url_set.add(candidate)
 
     urls = sorted(url_set)
-    print(f"[+] Найдено задач на странице (HTML): {len(urls)}")
+    log(f"[+] Найдено задач на странице (HTML): {len(urls)}")
     for u in urls:
-        print(f"    - {u}")
+        log(f"    - {u}")
     return urls
 
 
@@ -502,54 +2951,920 @@ def is_challenge_list_url(url: str) -> bool:
 
 
 
-def write_index_md(results: List[Dict[str, Any]], out_root: Optional[str]) -> str:
-    if not results:
+# сколько записей журнала сортируется в памяти за раз при сборке INDEX.md
+INDEX_SORT_CHUNK = 10000
+
+
+def index_sort_key(info: Dict[str, Any]) -> str:
+    return info["title"].lower()
+
+
+def external_sort(
+    records: Iterable[Dict[str, Any]],
+    key: Callable[[Dict[str, Any]], Any],
+    chunk_size: int = INDEX_SORT_CHUNK,
+    tmp_dir: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Сортировка записей, которые не обязаны помещаться в память: куски по
+    chunk_size сортируются и сбрасываются во временные JSONL-файлы, потом
+    сливаются heapq.merge. Порядок равных ключей — как у sorted().
+    Влезло в один кусок — обходится без временных файлов.
+    """
+    spills: List[str] = []
+    chunk: List[Dict[str, Any]] = []
+    try:
+        for rec in records:
+            chunk.append(rec)
+            if len(chunk) >= chunk_size:
+                spills.append(_spill_sorted(chunk, key, tmp_dir))
+                chunk = []
+        if not spills:
+            yield from sorted(chunk, key=key)
+            return
+        if chunk:
+            spills.append(_spill_sorted(chunk, key, tmp_dir))
+            chunk = []
+        with contextlib.ExitStack() as stack:
+            streams = [
+                (json.loads(line) for line in stack.enter_context(open(path, "r", encoding="utf-8")))
+                for path in spills
+            ]
+            yield from heapq.merge(*streams, key=key)
+    finally:
+        for path in spills:
+            remove_if_exists(path)
+
+
+def _spill_sorted(
+    chunk: List[Dict[str, Any]],
+    key: Callable[[Dict[str, Any]], Any],
+    tmp_dir: Optional[str],
+) -> str:
+    fd, path = tempfile.mkstemp(prefix="ctfd-sort-", suffix=".jsonl", dir=tmp_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for rec in sorted(chunk, key=key):
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    return path
+
+
+def iter_journal(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Записи журнала задач (challenges.jsonl, см. DumpExport). Недописанная
+    последняя строка — после обрыва прогона — пропускается.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def write_index_md(results: Iterable[Dict[str, Any]], out_root: Optional[str]) -> str:
+    """INDEX.md по результатам scrape_ctfd_challenge, отсортированным по заголовку."""
+    return write_index_rows(sorted(results, key=index_sort_key), out_root)
+
+
+def write_index_from_journal(
+    journal_path: str,
+    out_root: Optional[str],
+    chunk_size: int = INDEX_SORT_CHUNK,
+    index_name: str = INDEX_MD_NAME,
+) -> str:
+    """
+    INDEX.md из журнала задач, не загружая его в память целиком
+    (external_sort). Годится и для журнала прерванного прогона: в индекс
+    попадут задачи, которые успели сохраниться (run_scrape пишет его в
+    index_name=PARTIAL_INDEX_NAME, чтобы не затереть полный INDEX.md).
+    """
+    root = out_root or "."
+    if not os.path.isfile(journal_path):
         return ""
+    rows = (
+        {**rec, "dir": os.path.join(root, rec["dir"])}
+        for rec in iter_journal(journal_path)
+        if rec.get("status") != "failed" and rec.get("dir")
+    )
+    return write_index_rows(
+        external_sort(rows, index_sort_key, chunk_size, tmp_dir=root), out_root, index_name
+    )
 
+
+def write_index_rows(
+    rows: Iterable[Dict[str, Any]],
+    out_root: Optional[str],
+    index_name: str = INDEX_MD_NAME,
+) -> str:
+    """
+    Пишет INDEX.md по уже отсортированным строкам, не собирая его в памяти.
+    Файл заменяется атомарно; нет ни одной строки — остаётся прежний.
+    """
     root = out_root or "."
     os.makedirs(root, exist_ok=True)
-    index_path = os.path.join(root, "INDEX.md")
+    index_path = os.path.join(root, index_name)
+    tmp_path = index_path + ".part"
+
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("# CTF Dump Index\n\n\n")
+        f.write("| # | Category | Title | URL | Local path | Files |\n")
+        f.write("|---|----------|-------|-----|-----------|-------|\n")
+
+        for i, info in enumerate(rows, start=1):
+            rel_path = os.path.relpath(info["dir"], root)
+            title = info["title"].replace("|", "\\|")
+            category = (info.get("category") or "").replace("|", "\\|")
+            url = info["url"]
+            files_count = info["files_count"]
+            f.write(f"| {i} | {category} | {title} | {url} | `{rel_path}` | {files_count} |\n")
+            count = i
+
+    if not count:
+        remove_if_exists(tmp_path)
+        return ""
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class DumpExport:
+    """
+    Машиночитаемый индекс дампа. В отличие от INDEX.md он пополняется по
+    мере готовности задач, а не собирается в конце:
+      - <out_dir>/challenges.jsonl — строка на каждую задачу этого прогона
+        (метрики, каталог, файлы с размерами и хэшами). Во время прогона
+        строки дописываются в challenges.jsonl.part (journal_path), и только
+        законченный прогон заменяет им журнал прошлого: прерванный журнал
+        полного не затирает;
+      - SQLite (по умолчанию <out_dir>/dump.sqlite) — таблицы runs,
+        challenges и files с индексами по хосту/ID, названию, категории,
+        sha256 и URL файла. Базу можно сделать одной на много дампов
+        (db_path): прогоны различаются по run_id, пути в challenges.dir и
+        files.path — относительно runs.out_dir.
+    add() вызывается из потоков DiskWriter, поэтому всё под замком.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        out_dir TEXT NOT NULL,
+        base_urls TEXT NOT NULL,
+        started REAL NOT NULL,
+        finished REAL,
+        status TEXT NOT NULL,
+        challenges INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS challenges (
+        run_id TEXT NOT NULL REFERENCES runs(run_id),
+        url TEXT NOT NULL,
+        host TEXT,
+        challenge_id INTEGER,
+        title TEXT,
+        category TEXT,
+        dir TEXT,
+        status TEXT NOT NULL,
+        attempts INTEGER,
+        error TEXT,
+        seconds REAL,
+        api_seconds REAL,
+        html_seconds REAL,
+        bytes INTEGER,
+        files_count INTEGER,
+        PRIMARY KEY (run_id, url)
+    );
+    CREATE INDEX IF NOT EXISTS challenges_host_id ON challenges (host, challenge_id);
+    CREATE INDEX IF NOT EXISTS challenges_title ON challenges (title);
+    CREATE INDEX IF NOT EXISTS challenges_category ON challenges (category);
+    CREATE TABLE IF NOT EXISTS files (
+        run_id TEXT NOT NULL REFERENCES runs(run_id),
+        challenge_url TEXT NOT NULL,
+        path TEXT NOT NULL,
+        url TEXT,
+        size INTEGER,
+        sha256 TEXT,
+        blake3 TEXT,
+        PRIMARY KEY (run_id, path)
+    );
+    CREATE INDEX IF NOT EXISTS files_challenge ON files (run_id, challenge_url);
+    CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+    CREATE INDEX IF NOT EXISTS files_url ON files (url);
+    """
+
+    def __init__(self, out_dir: str, run_id: str, db_path: Optional[str] = None):
+        self.out_dir = os.path.abspath(out_dir)
+        self.run_id = run_id
+        self.jsonl_path = os.path.join(self.out_dir, EXPORT_JSONL_NAME)
+        self.journal_path = self.jsonl_path + ".part"
+        self.db_path = os.path.abspath(db_path or os.path.join(self.out_dir, EXPORT_DB_NAME))
+        self.count = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._f = open(self.journal_path, "w", encoding="utf-8")
+        # timeout: базу могут одновременно писать несколько дампов
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+    @classmethod
+    def open(
+        cls,
+        out_dir: str,
+        run_id: str,
+        base_urls: List[str],
+        db_path: Optional[str] = None,
+    ) -> "DumpExport":
+        os.makedirs(out_dir, exist_ok=True)
+        export = cls(out_dir, run_id, db_path)
+        with export._db:
+            export._db.execute(
+                "INSERT OR REPLACE INTO runs (run_id, out_dir, base_urls, started, status)"
+                " VALUES (?, ?, ?, ?, 'running')",
+                (run_id, export.out_dir, json.dumps(base_urls), time.time()),
+            )
+        return export
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """
+        Задача готова (или окончательно упала): record — метрики задачи
+        из run_scrape плюс "dir" и "files" (см. ScrapeManifest.challenge_files).
+        """
+        line = json.dumps({"run": self.run_id, **record}, ensure_ascii=False, default=str)
+        files = record.get("files") or []
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO challenges VALUES"
+                    " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self.run_id,
+                        record["url"],
+                        record.get("host"),
+                        record.get("id"),
+                        record.get("title"),
+                        record.get("category"),
+                        record.get("dir"),
+                        record["status"],
+                        record.get("attempts"),
+                        record.get("error"),
+                        record.get("seconds"),
+                        record.get("api_seconds"),
+                        record.get("html_seconds"),
+                        record.get("bytes"),
+                        record.get("files_count"),
+                    ),
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            self.run_id,
+                            record["url"],
+                            f["path"],
+                            f.get("url"),
+                            f.get("size"),
+                            f.get("sha256"),
+                            f.get("blake3"),
+                        )
+                        for f in files
+                    ],
+                )
+            self.count += 1
+            if record["status"] == "failed":
+                self.failed += 1
 
-    results_sorted = sorted(results, key=lambda r: r["title"].lower())
+    def finish_journal(self) -> None:
+        """
+        Все задачи прогона записаны: журнал заменяет challenges.jsonl
+        прошлого прогона. Вызывается до сборки ZIP, чтобы в архив попал
+        журнал этого прогона; база остаётся открытой до close().
+        """
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.close()
+            os.replace(self.journal_path, self.jsonl_path)
+
+    def close(self, status: str = "finished") -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not self._f.closed:
+                self._f.close()
+                if status == "finished":
+                    os.replace(self.journal_path, self.jsonl_path)
+            with self._db:
+                self._db.execute(
+                    "UPDATE runs SET finished = ?, status = ?, challenges = ?, failed = ?"
+                    " WHERE run_id = ?",
+                    (time.time(), status, self.count, self.failed, self.run_id),
+                )
+            self._db.close()
 
-    lines = []
-    lines.append("# CTF Dump Index\n")
-    lines.append("")
-    lines.append("| # | Category | Title | URL | Local path | Files |")
-    lines.append("|---|----------|-------|-----|-----------|-------|")
 
+def write_checksums(manifest: ScrapeManifest) -> str:
+    """
+    Пишет рядом с INDEX.md контрольные суммы всех файлов дампа, которые
+    знает манифест (вложения, description.txt, page.html):
+      - SHA256SUMS — в формате sha256sum, проверяется `sha256sum -c`;
+      - B3SUMS — то же для b3sum, если BLAKE3 посчитан для всех файлов;
+      - checksums.json — размеры, URL и все хэши, его читает verify_dump.
+    Хэши берутся из манифеста (их посчитали при закачке), сами файлы
+    не перечитываются — только stat. Возвращает путь к checksums.json.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    for rel_path, entry in sorted(manifest.files.items()):
+        if not entry.get("sha256") or not os.path.isfile(manifest.abs(rel_path)):
+            continue
+        entries[rel_path.replace(os.sep, "/")] = {
+            "size": entry.get("size"),
+            "url": entry.get("url"),
+            **file_hashes(entry),
+        }
+    algorithms = [
+        name for name in HASH_ALGORITHMS
+        if entries and all(name in e for e in entries.values())
+    ]
 
-    for i, info in enumerate(results_sorted, start=1):
-        rel_path = os.path.relpath(info["dir"], root)
-        title = info["title"].replace("|", "\\|")
-        category = (info.get("category") or "").replace("|", "\\|")
-        url = info["url"]
-        files_count = info["files_count"]
-        lines.append(
-            f"| {i} | {category} | {title} | {url} | `{rel_path}` | {files_count} |"
+    os.makedirs(manifest.root, exist_ok=True)
+    json_path = os.path.join(manifest.root, CHECKSUMS_JSON_NAME)
+    with open(json_path + ".part", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": 1,
+                "created": datetime.now(timezone.utc).isoformat(),
+                "algorithms": algorithms,
+                "files": entries,
+            },
+            f,
+            ensure_ascii=False,
+            indent=1,
         )
+    os.replace(json_path + ".part", json_path)
 
+    for name, algorithm in ((CHECKSUMS_NAME, "sha256"), (B3SUMS_NAME, "blake3")):
+        sums_path = os.path.join(manifest.root, name)
+        if algorithm not in algorithms:
+            remove_if_exists(sums_path)
+            continue
+        with open(sums_path + ".part", "w", encoding="utf-8") as f:
+            for rel_path, entry in entries.items():
+                f.write(f"{entry[algorithm]}  {rel_path}\n")
+        os.replace(sums_path + ".part", sums_path)
+    return json_path
 
-    content = "\n".join(lines) + "\n"
 
-    with open(index_path, "w", encoding="utf-8") as f:
-        f.write(content)
+def load_checksums(root: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Ожидаемые хэши дампа: из checksums.json, а если его нет —
+    из SHA256SUMS (тогда без размеров).
+    """
+    json_path = os.path.join(root, CHECKSUMS_JSON_NAME)
+    if os.path.isfile(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("files") or {}
+    sums_path = os.path.join(root, CHECKSUMS_NAME)
+    if not os.path.isfile(sums_path):
+        raise FileNotFoundError(f"В {root} нет ни {CHECKSUMS_JSON_NAME}, ни {CHECKSUMS_NAME}")
+    entries: Dict[str, Dict[str, Any]] = {}
+    with open(sums_path, "r", encoding="utf-8") as f:
+        for line in f:
+            sha256, sep, rel_path = line.rstrip("\n").partition("  ")
+            if sep:
+                entries[rel_path.lstrip("*")] = {"sha256": sha256}
+    return entries
 
-    return index_path
 
+def verify_dump(root: str, workers: int = 0, quick: bool = False) -> Dict[str, Any]:
+    """
+    Перепроверяет дамп по checksums.json (или SHA256SUMS). Файлы читаются
+    параллельно в workers потоках (0 — по числу ядер): hashlib и blake3
+    отпускают GIL, так что упираемся в диск, а не в один поток. Если
+    записан BLAKE3 и установлен пакет blake3, проверяется он — он быстрее
+    sha256. quick=True — только наличие и размеры, без чтения файлов.
+    """
+    root = os.path.abspath(root)
+    started = time.monotonic()
+    entries = load_checksums(root)
+    algorithm = "sha256"
+    if blake3 is not None and entries and all(e.get("blake3") for e in entries.values()):
+        algorithm = "blake3"
+
+    def check(item: tuple[str, Dict[str, Any]]) -> tuple[str, str, int]:
+        rel_path, entry = item
+        path = os.path.join(root, *rel_path.split("/"))
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return rel_path, "missing", 0
+        if entry.get("size") is not None and size != entry["size"]:
+            return rel_path, "size_mismatch", 0
+        if quick:
+            return rel_path, "ok", 0
+        size, digests = digest_file(path, (algorithm,))
+        return rel_path, "ok" if digests[algorithm] == entry[algorithm] else "hash_mismatch", size
+
+    # крупные файлы — вперёд, чтобы в конце не ждать один длинный
+    items = sorted(entries.items(), key=lambda kv: -(kv[1].get("size") or 0))
+    report: Dict[str, Any] = {
+        "root": root,
+        "algorithm": None if quick else algorithm,
+        "checked": len(items),
+        "ok": 0,
+        "missing": [],
+        "size_mismatch": [],
+        "hash_mismatch": [],
+        "bytes": 0,
+    }
+    with ThreadPoolExecutor(workers or cpu_count(), thread_name_prefix="ctfd-verify") as pool:
+        for rel_path, status, size in pool.map(check, items):
+            report["bytes"] += size
+            if status == "ok":
+                report["ok"] += 1
+            else:
+                report[status].append(rel_path)
+    for key in ("missing", "size_mismatch", "hash_mismatch"):
+        report[key].sort()
+    report["seconds"] = round(time.monotonic() - started, 3)
+    bad = len(items) - report["ok"]
+    if bad:
+        log(f"[!] Проверка {root}: {bad} из {len(items)} файлов не сходятся")
+    else:
+        log(f"[+] Проверка {root}: все {len(items)} файлов на месте ({format_size(report['bytes'])})")
+    return report
+
+
+# расширения, которые уже сжаты: повторный deflate только тратит CPU
+STORED_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".txz", ".zst", ".7z", ".rar",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4", ".mkv",
+    ".apk", ".jar", ".docx", ".xlsx", ".pptx", ".pcapng.gz",
+}
+ARCHIVE_TS_RE = re.compile(r"\d{8}_\d{6}\.zip")
+
+
+def zip_compress_type(path: str) -> int:
+    name = path.lower()
+    if any(name.endswith(ext) for ext in STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_dump_files(root: str) -> Iterator[tuple[str, str]]:
+    """
+    Файлы дампа для архива: (абсолютный путь, имя внутри архива).
+    Служебные файлы (манифест, журнал прогона, база SQLite экспорта,
+    недокачанные .part и их .part.json) пропускаются.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.startswith((MANIFEST_NAME, RUN_LOG_NAME, EXPORT_DB_NAME)) or fname.endswith(
+                (".part", PART_STATE_SUFFIX)
+            ):
+                continue
+            path = os.path.join(dirpath, fname)
+            yield path, os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def find_previous_archive(root: str) -> Optional[str]:
+    root = os.path.abspath(root)
+    base_dir = os.path.dirname(root)
+    prefix = os.path.basename(root) + "_"
+    try:
+        names = os.listdir(base_dir)
+    except OSError:
+        return None
+    candidates = sorted(
+        n for n in names if n.startswith(prefix) and ARCHIVE_TS_RE.fullmatch(n[len(prefix):])
+    )
+    return os.path.join(base_dir, candidates[-1]) if candidates else None
+
+
+def copy_zip_member_raw(
+    src_zf: zipfile.ZipFile,
+    src_info: zipfile.ZipInfo,
+    dst_zf: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+) -> None:
+    """
+    Переносит уже сжатые данные члена архива src_zf в dst_zf без
+    распаковки и повторного сжатия. zipfile не даёт публичного API для
+    этого, поэтому локальный заголовок пишем сами и регистрируем запись
+    в центральном каталоге dst_zf вручную. dst_zf должен писаться в
+    обычный (seekable) файл.
+    """
+    copy_zip_data_raw(src_zf.fp, src_info, dst_zf, zinfo)
+
+
+def copy_zip_data_raw(
+    src_fp: Any,
+    src_info: zipfile.ZipInfo,
+    dst_zf: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+) -> None:
+    """
+    То же, что copy_zip_member_raw, но читает из открытого файла архива:
+    так можно копировать и из архива, который сейчас пишется (src_info —
+    уже записанный член dst_zf).
+    """
+    src_fp.seek(src_info.header_offset)
+    header = src_fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Битый локальный заголовок: {src_info.filename}")
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    src_fp.seek(src_info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+
+    zinfo.compress_type = src_info.compress_type
+    zinfo.CRC = src_info.CRC
+    zinfo.compress_size = src_info.compress_size
+    zinfo.file_size = src_info.file_size
+    zinfo.header_offset = dst_zf.fp.tell()
+    dst_zf.fp.write(zinfo.FileHeader())
+
+    remaining = src_info.compress_size
+    while remaining > 0:
+        chunk = src_fp.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Обрезанные данные: {src_info.filename}")
+        dst_zf.fp.write(chunk)
+        remaining -= len(chunk)
 
+    dst_zf.filelist.append(zinfo)
+    dst_zf.NameToInfo[zinfo.filename] = zinfo
+    dst_zf.start_dir = dst_zf.fp.tell()
+    dst_zf._didModify = True
 
-def make_zip_archive(root: str) -> str:
+
+ZIP_BATCH_BYTES = 32 * 1024 * 1024
+ZIP_BATCH_FILES = 256
+
+
+def compress_zip_batch(members: List[tuple[str, str]], batch_path: str) -> str:
+    """
+    Сжимает пачку файлов дампа во временный архив batch_path. Выполняется
+    в дочернем процессе CpuPool; make_zip_archive потом переносит готовые
+    сжатые данные в итоговый архив без повторного deflate.
+    """
+    with zipfile.ZipFile(batch_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in members:
+            zf.write(path, arcname, compress_type=zip_compress_type(path))
+    return batch_path
+
+
+def make_zip_archive(
+    root: str,
+    previous: Optional[str] = None,
+    reuse: bool = True,
+    progress: Optional[Callable[[int, int], None]] = None,
+    cpu: Optional[CpuPool] = None,
+) -> str:
+    """
+    Собирает <root>_YYYYmmdd_HHMMSS.zip. Синхронная и тяжёлая по CPU —
+    из async-кода вызывать через asyncio.to_thread.
+
+      - уже сжатые форматы (zip, gz, 7z, png, ...) кладутся без сжатия;
+      - члены предыдущего архива, у которых совпали размер и mtime,
+        копируются как есть, без повторного deflate.
+      - жёсткие ссылки на один файл (дедупликация вложений FileStore)
+        сжимаются один раз, остальные копии берут готовые сжатые данные.
+      - с cpu (CpuPool с процессами) сжимаемые файлы пачками по
+        ZIP_BATCH_BYTES/ZIP_BATCH_FILES уходят в дочерние процессы
+        (compress_zip_batch), а сюда возвращаются уже сжатыми: deflate
+        идёт на всех ядрах, порядок членов архива не меняется.
+    progress(done, total) вызывается после каждого файла — из того же потока.
+    """
     root = os.path.abspath(root)
     base_dir = os.path.dirname(root)
     base_name = os.path.basename(root)
 
+    if reuse and previous is None:
+        previous = find_previous_archive(root)
+
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    archive_base = os.path.join(base_dir, f"{base_name}_{ts}")
-    archive_path = shutil.make_archive(archive_base, "zip", root_dir=root)
+    archive_path = os.path.join(base_dir, f"{base_name}_{ts}.zip")
+    tmp_path = archive_path + ".tmp"
+
+    prev_zf: Optional[zipfile.ZipFile] = None
+    prev_infos: Dict[str, zipfile.ZipInfo] = {}
+    if reuse and previous and os.path.isfile(previous):
+        try:
+            prev_zf = zipfile.ZipFile(previous)
+            prev_infos = {i.filename: i for i in prev_zf.infolist()}
+        except (OSError, zipfile.BadZipFile) as e:
+            log(f"[!] Предыдущий архив {previous} не читается, собираю с нуля: {e}")
+
+    members = list(iter_dump_files(root))
+    # план: что делать с каждым членом, решается до записи, чтобы
+    # сжатие пачек в процессах шло параллельно с их сборкой здесь
+    plan: List[tuple[str, Any]] = []
+    batches: List[List[tuple[str, str]]] = []
+    batch_bytes = 0
+    first_links: Dict[tuple[int, int], str] = {}
+    parallel = cpu is not None and cpu.workers > 0
+    for path, arcname in members:
+        st = os.stat(path)
+        mtime = zipfile.ZipInfo.from_file(path, arcname).date_time
+        old = prev_infos.get(arcname)
+        if (
+            old is not None
+            and old.file_size == st.st_size
+            # в ZIP время хранится с точностью до 2 секунд
+            and old.date_time[:5] == mtime[:5]
+            and old.date_time[5] // 2 == mtime[5] // 2
+            and old.compress_type == zip_compress_type(path)
+            and not old.flag_bits & 0x01  # зашифрованные не трогаем
+        ):
+            plan.append(("reuse", old))
+            continue
+        inode = (st.st_dev, st.st_ino)
+        if st.st_nlink > 1 and inode in first_links:
+            plan.append(("link", first_links[inode]))
+            continue
+        if st.st_nlink > 1:
+            first_links[inode] = arcname
+        if not parallel or zip_compress_type(path) == zipfile.ZIP_STORED:
+            plan.append(("write", None))
+            continue
+        if not batches or batch_bytes >= ZIP_BATCH_BYTES or len(batches[-1]) >= ZIP_BATCH_FILES:
+            batches.append([])
+            batch_bytes = 0
+        batches[-1].append((path, arcname))
+        batch_bytes += st.st_size
+        plan.append(("batch", len(batches) - 1))
+
+    # пачки отправляются с опережением не больше двух на процесс:
+    # временные архивы не должны накопиться на диске все сразу
+    batch_paths = [f"{tmp_path}.{i}" for i in range(len(batches))]
+    futures: Dict[int, "concurrent.futures.Future[str]"] = {}
+    window = max(1, cpu.workers * 2) if parallel else 0
+
+    def submit_batches(upto: int) -> None:
+        for i in range(len(futures), min(upto, len(batches))):
+            futures[i] = cpu.submit(compress_zip_batch, batches[i], batch_paths[i])
+
+    reused = 0
+    deduped = 0
+    batch_zf: Optional[zipfile.ZipFile] = None
+    batch_index = -1
+    try:
+        submit_batches(window)
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for done, ((path, arcname), (action, arg)) in enumerate(zip(members, plan), start=1):
+                if progress is not None and done > 1:
+                    progress(done - 1, len(members))
+                zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                if action == "reuse":
+                    try:
+                        copy_zip_member_raw(prev_zf, arg, zf, zinfo)
+                        reused += 1
+                        continue
+                    except (OSError, zipfile.BadZipFile, struct.error) as e:
+                        log(f"[!] Не удалось переиспользовать {arcname}: {e}")
+                    action = "write"
+                if action == "link":
+                    zf.fp.flush()
+                    with open(tmp_path, "rb") as self_fp:
+                        copy_zip_data_raw(self_fp, zf.getinfo(arg), zf, zinfo)
+                    deduped += 1
+                elif action == "batch":
+                    if arg != batch_index:
+                        if batch_zf is not None:
+                            batch_zf.close()
+                            remove_if_exists(batch_paths[batch_index])
+                        batch_index = arg
+                        batch_zf = zipfile.ZipFile(futures[arg].result())
+                        submit_batches(arg + 1 + window)
+                    copy_zip_member_raw(batch_zf, batch_zf.getinfo(arcname), zf, zinfo)
+                else:
+                    zf.write(path, arcname, compress_type=zip_compress_type(path))
+        if progress is not None:
+            progress(len(members), len(members))
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        for fut in futures.values():
+            fut.cancel()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if batch_zf is not None:
+            batch_zf.close()
+        for fut in futures.values():
+            with contextlib.suppress(Exception):
+                fut.result()
+        for batch_path in batch_paths:
+            remove_if_exists(batch_path)
+        if prev_zf is not None:
+            prev_zf.close()
+
+    if reused:
+        log(f"[+] Из предыдущего архива переиспользовано файлов: {reused}")
+    if deduped:
+        log(f"[+] Одинаковых файлов сжато один раз: {deduped}")
+    if batches:
+        log(f"[+] Сжато в {cpu.workers} процессах: пачек {len(batches)}")
     return archive_path
 
 
+class _ZipStreamBuffer(io.RawIOBase):
+    """
+    Несикаемый приёмник для zipfile: накапливает записанные байты,
+    пока генератор их не заберёт.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip_stream(root: str) -> Iterator[bytes]:
+    """
+    ZIP всего дампа в виде потока байтов — без временного файла на диске.
+    Генератор синхронный: Starlette сама гоняет такие в тредпуле.
+    """
+    root = os.path.abspath(root)
+    buf = _ZipStreamBuffer()
+
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in iter_dump_files(root):
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = zip_compress_type(path)
+            with open(path, "rb") as src, zf.open(zinfo, "w") as dst:
+                while True:
+                    chunk = src.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = buf.drain()
+                    if data:
+                        yield data
+            data = buf.drain()
+            if data:
+                yield data
+    tail = buf.drain()
+    if tail:
+        yield tail
+
+
+@dataclass
+class HostCredentials:
+    """Как входить на конкретный хост: токен, cookie и/или логин по форме."""
+
+    username: str = ""
+    password: str = ""
+    api_token: str = ""
+    cookie: str = ""
+    login_url: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HostCredentials":
+        unknown = set(data) - {"username", "password", "api_token", "cookie", "login_url"}
+        if unknown:
+            raise ValueError(f"Неизвестные поля учётных данных: {', '.join(sorted(unknown))}")
+        return cls(**{k: str(v or "") for k, v in data.items()})
+
+
+def host_key(url_or_host: str) -> str:
+    """'https://ctf.example.org/challenges' или 'ctf.example.org' -> 'ctf.example.org'."""
+    value = url_or_host.strip()
+    if "://" not in value:
+        value = "//" + value
+    return urlparse(value).netloc.lower()
+
+
+def parse_host_credentials(
+    data: Optional[Dict[str, Any]],
+) -> Dict[str, HostCredentials]:
+    """
+    {хост или URL: {"api_token": ..., "username": ..., ...}} -> {netloc: HostCredentials}.
+    """
+    creds: Dict[str, HostCredentials] = {}
+    for key, value in (data or {}).items():
+        if isinstance(value, HostCredentials):
+            creds[host_key(key)] = value
+        elif isinstance(value, dict):
+            creds[host_key(key)] = HostCredentials.from_dict(value)
+        else:
+            raise ValueError(f"Учётные данные для {key} должны быть объектом")
+    return creds
+
+
+class HostSession:
+    """
+    Всё, что относится к одному хосту: свой AsyncClient со своим пулом
+    соединений, заголовками и cookies, свой адаптивный лимитер и логин.
+    Общие на весь прогон только бюджет повторов и лимиты задач/файлов.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        creds: HostCredentials,
+        client: httpx.AsyncClient,
+        limiter: Optional[AdaptiveLimitTransport] = None,
+    ):
+        self.root = root
+        self.host = urlparse(root).netloc
+        self.creds = creds
+        self.client = client
+        self.limiter = limiter
+        self._login: Optional[asyncio.Future] = None
+
+    async def login(self) -> None:
+        """Логин по форме, если заданы имя и пароль; выполняется один раз."""
+        if not (self.creds.username and self.creds.password):
+            return
+        if self._login is None:
+            login_url = self.creds.login_url or f"{self.root}/login"
+            self._login = asyncio.ensure_future(
+                login_ctfd(self.client, login_url, self.creds.username, self.creds.password)
+            )
+        await asyncio.shield(self._login)
+
+
+class MetricsSummary:
+    """
+    Сводка по метрикам задач, которая копится по одной записи: по каждому
+    хосту — число задач и упавших, суммарное время, средняя задержка
+    API/HTML, байты и повторы; плюс slowest самых долгих задач. Память не
+    растёт с числом задач — хранится только куча из slowest записей.
+    """
+
+    KEYS = (
+        "seconds", "api_requests", "api_seconds", "html_requests", "html_seconds",
+        "files", "bytes", "bytes_downloaded", "http_retries",
+    )
+
+    def __init__(self, slowest: int = 10):
+        self.slowest = slowest
+        self.hosts: Dict[str, Dict[str, Any]] = {}
+        self._worst: List[tuple] = []
+        self._count = 0
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        h = self.hosts.setdefault(rec.get("host", ""), {
+            "challenges": 0, "failed": 0, "seconds": 0.0,
+            "api_requests": 0, "api_seconds": 0.0,
+            "html_requests": 0, "html_seconds": 0.0,
+            "files": 0, "bytes": 0, "bytes_downloaded": 0, "http_retries": 0,
+        })
+        h["challenges"] += 1
+        h["failed"] += rec.get("status") == "failed"
+        for key in self.KEYS:
+            h[key] += rec.get(key, 0)
+        # при равном времени раньше пришедшая задача считается медленнее
+        self._count += 1
+        item = (
+            rec.get("seconds", 0),
+            -self._count,
+            {"url": rec["url"], "seconds": rec.get("seconds", 0), "status": rec.get("status")},
+        )
+        if len(self._worst) < self.slowest:
+            heapq.heappush(self._worst, item)
+        elif self.slowest:
+            heapq.heappushpop(self._worst, item)
+
+    def result(self) -> Dict[str, Any]:
+        hosts = {}
+        for host, totals in self.hosts.items():
+            h = dict(totals)
+            h["api_latency"] = round(h["api_seconds"] / h["api_requests"], 3) if h["api_requests"] else None
+            h["html_latency"] = round(h["html_seconds"] / h["html_requests"], 3) if h["html_requests"] else None
+            for key in ("seconds", "api_seconds", "html_seconds"):
+                h[key] = round(h[key], 3)
+            hosts[host] = h
+        return {
+            "hosts": hosts,
+            "slowest": [entry for _, _, entry in sorted(self._worst, reverse=True)],
+        }
+
+
+def summarize_metrics(records: Iterable[Dict[str, Any]], slowest: int = 10) -> Dict[str, Any]:
+    """Сводка по готовому набору метрик задач (см. MetricsSummary)."""
+    summary = MetricsSummary(slowest)
+    for rec in records:
+        summary.add(rec)
+    return summary.result()
+
 
 async def run_scrape(
     base_urls: List[str],
@@ -560,93 +3875,577 @@ async def run_scrape(
     login_url: str = "",
     out_dir: str = "./ctf_dump",
     concurrency: int = 5,
+    file_concurrency: int = 8,
+    file_per_host: int = 4,
     no_files: bool = False,
     no_desc: bool = False,
     save_html: bool = False,
+    api_first: bool = True,
+    update: bool = False,
+    make_zip: bool = True,
+    on_event: Optional[EventCallback] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    retry_budget: int = 200,
+    challenge_attempts: int = 3,
+    adaptive: bool = True,
+    max_concurrency: int = 32,
+    max_rps: float = 0.0,
+    http2: bool = False,
+    pool_size: Optional[int] = None,
+    keepalive_expiry: float = 30.0,
+    connect_timeout: float = 10.0,
+    api_timeout: float = 20.0,
+    download_timeout: float = 300.0,
+    pool_timeout: float = 60.0,
+    blob_store_dir: Optional[str] = None,
+    blob_store_max_bytes: int = 0,
+    disk_workers: int = 4,
+    fsync: str = "none",
+    segments: int = 1,
+    segment_threshold: int = SEGMENT_THRESHOLD,
+    host_credentials: Optional[Dict[str, Any]] = None,
+    cpu_workers: int = 0,
+    use_blake3: bool = False,
+    export_db: Optional[str] = None,
+    keep_results: bool = True,
 ) -> Dict[str, Any]:
     """
     Главная функция: делает всё и возвращает результат для веба.
-    """
-    cookie_str = cookie or None
-    cookies = parse_cookie_header(cookie_str)
 
-    headers = {
-        "User-Agent": "ctfd-async-scraper-httpx/web",
-        "Accept-Language": "ru,en;q=0.8",
-    }
-    if api_token:
-        headers["Authorization"] = f"Token {api_token.strip()}"
+    update=True — инкрементальный режим: по манифесту в out_dir пропускаются
+    неизменившиеся задачи, а файлы перепроверяются условными запросами.
+    make_zip=False — не собирать ZIP на диске (например, если веб отдаёт
+    архив потоково через iter_zip_stream).
+    on_event — колбэк для событий прогресса (см. emit_event); вызывается
+    из event loop, в том числе для прогресса сборки архива.
+
+    Все GET идут через RetryTransport (retry_policy, общий лимит retry_budget
+    повторов на прогон). Задача, упавшая целиком, перезапускается до
+    challenge_attempts раз с паузой вне семафора; окончательно упавшие
+    возвращаются в "failed".
+
+    adaptive=True — число одновременных запросов к каждому хосту подбирается
+    само (AIMD, см. HostController): concurrency задаёт стартовое значение,
+    max_concurrency — потолок. max_rps > 0 дополнительно ограничивает
+    запросы в секунду на хост. adaptive=False — фиксированный concurrency.
+
+    Пул соединений: pool_size (по умолчанию — сколько запросов может идти
+    одновременно: лимит задач + лимит файлов), keepalive_expiry, http2
+    (нужен пакет h2). Таймауты раздельные: connect_timeout, api_timeout
+    (чтение ответов API/HTML), download_timeout (чтение файлов),
+    pool_timeout (ожидание свободного соединения).
+
+    blob_store_dir — общее для всех дампов хранилище файлов (BlobStore):
+    уже виденные файлы берутся оттуда по ETag без передачи тела, а
+    одинаковые файлы разных дампов занимают место один раз.
+    blob_store_max_bytes > 0 — предел размера хранилища (LRU-выселение).
+
+    Диск: запись идёт в пуле из disk_workers потоков (DiskWriter), fsync —
+    "none", "file" или "full" (см. FSYNC_POLICIES).
+
+    segments > 1 — файлы от segment_threshold байт качаются в столько
+    соединений (если сервер поддерживает Range); лишние соединения
+    занимают слоты file_concurrency/file_per_host наравне с другими файлами.
 
+    Несколько хостов в base_urls обрабатываются одновременно, у каждого
+    своя сессия (HostSession): клиент, пул, cookies, заголовки и логин.
+    host_credentials — {хост: {"api_token", "cookie", "username",
+    "password", "login_url"}}; хостам без записи достаются общие
+    api_token/cookie, а общие username/password — только первому хосту
+    (или хосту login_url): остальным логин задаётся в host_credentials.
+    Лимиты задач и файлов и бюджет повторов общие на прогон, pool_size —
+    на каждый хост. Задачи каждого хоста пишутся в <out_dir>/<хост>/.
+    Хост, который не удалось обойти, попадает в "failed", остальные
+    продолжают; ошибка поднимается, только если не ответил ни один.
+
+    cpu_workers > 0 — разбор HTML и описаний, хэши больших файлов и deflate
+    при сборке ZIP идут в пуле из стольких процессов (CpuPool; все ядра —
+    cpu_count()); 0 — всё в одном процессе, как раньше.
+
+    Для каждого файла на лету считается sha256 (и BLAKE3 при use_blake3 и
+    установленном пакете blake3); в конце рядом с INDEX.md пишутся
+    SHA256SUMS/B3SUMS и checksums.json (write_checksums), путь к последнему —
+    в "checksums_path". Проверить дамп потом — verify_dump.
+
+    Каждая готовая задача сразу дописывается в машиночитаемый индекс
+    (DumpExport): <out_dir>/challenges.jsonl и SQLite — по умолчанию
+    <out_dir>/dump.sqlite, export_db задаёт общую базу для многих дампов.
+    Пути к ним — в "export_path" и "export_db". Этот же challenges.jsonl —
+    журнал результатов: INDEX.md собирается из него внешней сортировкой
+    (write_index_from_journal). Прерванный прогон INDEX.md и challenges.jsonl
+    прошлого не трогает: успевшие сохраниться задачи попадают в
+    INDEX.partial.md, журнал остаётся в challenges.jsonl.part.
+    По умолчанию результаты и метрики задач ещё и копятся в памяти (O(N)).
+    keep_results=False — не держать их ("results" и "metrics"["challenges"]
+    пустые, число задач — в "results_count"): для очень больших дампов.
+
+    Всё, что печатается через log(), события и метрики каждой задачи
+    (время, задержки API/HTML, байты, файлы, повторы, причина падения)
+    дописываются в <out_dir>/run_log.jsonl (RunLog). Метрики и сводка по
+    хостам возвращаются в "metrics", путь к журналу — в "log_path".
+    """
     urls = [u.strip() for u in base_urls if u.strip()]
+    default_creds = HostCredentials(
+        username=username, password=password, api_token=api_token, cookie=cookie
+    )
+    creds_by_host = parse_host_credentials(host_credentials)
+    # хосты в порядке появления в base_urls и их URL
+    urls_by_host: Dict[str, List[str]] = {}
+    for u in urls:
+        urls_by_host.setdefault(host_key(u), []).append(u)
+    if login_url and host_key(login_url) in urls_by_host:
+        creds = creds_by_host.get(host_key(login_url)) or default_creds
+        if not creds.login_url:
+            creds_by_host[host_key(login_url)] = HostCredentials(
+                **{**creds.__dict__, "login_url": login_url}
+            )
+    # общие логин/пароль уходят только первому хосту (или хосту login_url),
+    # как и раньше: пароль одного CTF не должен отправляться на все остальные
+    login_host = (
+        host_key(login_url)
+        if login_url and host_key(login_url) in urls_by_host
+        else next(iter(urls_by_host), "")
+    )
+    shared_creds = HostCredentials(api_token=api_token, cookie=cookie)
+
+    def host_creds(host: str) -> HostCredentials:
+        if host in creds_by_host:
+            return creds_by_host[host]
+        if host == login_host:
+            return default_creds
+        if username or password:
+            log(f"[!] Общие логин/пароль не отправляю на {host}: задайте его в host_credentials")
+        return shared_creds
+
     effective_out_dir = out_dir or "./ctf_dump"
 
-    async with httpx.AsyncClient(
-        cookies=cookies,
-        headers=headers,
-        follow_redirects=True,
-        timeout=20.0,
-    ) as client:
-
-        # логин по форме, если надо
-        if username and password and urls:
-            if login_url:
-                login_url_eff = login_url
-            else:
-                p = urlparse(urls[0])
-                login_url_eff = f"{p.scheme}://{p.netloc}/login"
-            await login_ctfd(client, login_url_eff, username, password)
-
-        # получаем список URL задач
-        challenge_urls: List[str] = []
-        for u in urls:
-            if is_challenge_list_url(u):
-                discovered = await discover_challenge_urls_from_list(client, u)
-                challenge_urls.extend(discovered)
-            else:
-                challenge_urls.append(u)
+    run_log = await asyncio.to_thread(RunLog.open, effective_out_dir)
+    log_token = current_run_log.set(run_log)
+    listener = on_event
+    challenge_metrics: List[Dict[str, Any]] = []
+    summary = MetricsSummary()
 
-        # unique
-        seen = set()
-        uniq_challenge_urls: List[str] = []
-        for u in challenge_urls:
-            if u not in seen:
-                seen.add(u)
-                uniq_challenge_urls.append(u)
+    def on_event(event: Dict[str, Any]) -> None:
+        # в журнал — всё, кроме частого прогресса
+        if not event["type"].endswith("_progress"):
+            run_log.write({"kind": "event", **event})
+        if listener is not None:
+            listener(event)
 
-        if not uniq_challenge_urls:
-            return {
-                "results": [],
-                "index_path": "",
-                "zip_path": "",
+    def finish_metrics(
+        metrics: Dict[str, Any],
+        status: str,
+        started: float,
+        info: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        metrics["status"] = status
+        metrics["seconds"] = round(time.monotonic() - started, 3)
+        for key in ("api_seconds", "html_seconds"):
+            if key in metrics:
+                metrics[key] = round(metrics[key], 3)
+        if info:
+            metrics["title"] = info.get("title", "")
+            metrics["category"] = info.get("category", "")
+        summary.add(metrics)
+        if keep_results:
+            challenge_metrics.append(metrics)
+        run_log.write({"kind": "challenge", **metrics})
+
+    def metrics_summary() -> Dict[str, Any]:
+        totals = summary.result()
+        run_log.write({"kind": "summary", **totals})
+        return {"challenges": challenge_metrics, **totals}
+
+    hashes = hash_algorithms(use_blake3)
+    cpu: Optional[CpuPool] = None
+    export: Optional[DumpExport] = None
+    export_status = "failed"
+    try:
+        cpu = CpuPool(cpu_workers)
+        # общая база export_db может быть занята другим дампом или недоступна
+        # на запись — это ошибка прогона, журнал при этом закрывается как обычно
+        export = await asyncio.to_thread(
+            DumpExport.open, effective_out_dir, run_log.run_id, urls, export_db
+        )
+        retry_policy = retry_policy or RetryPolicy()
+        budget = RetryBudget(retry_budget)
+        if http2 and importlib.util.find_spec("h2") is None:
+            log("[!] Для HTTP/2 нужен пакет h2 (pip install 'httpx[http2]'), использую HTTP/1.1")
+            http2 = False
+
+        request_slots = max(concurrency, max_concurrency) if adaptive else concurrency
+        if not pool_size or pool_size <= 0:
+            pool_size = request_slots + max(1, file_concurrency)
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=keepalive_expiry,
+        )
+        api_timeouts = httpx.Timeout(
+            connect=connect_timeout,
+            read=api_timeout,
+            write=api_timeout,
+            pool=pool_timeout,
+        )
+        file_timeouts = httpx.Timeout(
+            connect=connect_timeout,
+            read=download_timeout,
+            write=api_timeout,
+            pool=pool_timeout,
+        )
+
+        def open_session(root: str, creds: HostCredentials) -> HostSession:
+            transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(
+                limits=limits,
+                http2=http2,
+            )
+            limiter_transport: Optional[AdaptiveLimitTransport] = None
+            if adaptive or max_rps > 0:
+                limiter_transport = AdaptiveLimitTransport(
+                    transport,
+                    initial=concurrency,
+                    max_limit=max(concurrency, max_concurrency) if adaptive else concurrency,
+                    max_rps=max_rps,
+                )
+                transport = limiter_transport
+            # ретраи снаружи лимитера: пауза перед повтором не держит слот хоста
+            transport = RetryTransport(transport, retry_policy, budget)
+
+            headers = {
+                "User-Agent": "ctfd-async-scraper-httpx/web",
+                "Accept-Language": "ru,en;q=0.8",
             }
+            if creds.api_token:
+                headers["Authorization"] = f"Token {creds.api_token.strip()}"
+            client = httpx.AsyncClient(
+                cookies=parse_cookie_header(creds.cookie or None),
+                headers=headers,
+                follow_redirects=True,
+                timeout=api_timeouts,
+                transport=transport,
+            )
+            return HostSession(root, creds, client, limiter_transport)
 
-        semaphore = asyncio.Semaphore(concurrency)
-        results: List[Dict[str, Any]] = []
+        def hosts_snapshot() -> Dict[str, Any]:
+            snapshot: Dict[str, Any] = {}
+            for session in sessions.values():
+                if session.limiter is not None:
+                    snapshot.update(session.limiter.snapshot())
+            return snapshot
 
-        async def worker(ch_url: str):
-            async with semaphore:
+        def host_out_dir(url: str) -> str:
+            # у разных CTF совпадают категории и названия задач — при
+            # нескольких хостах каждый пишется в свой подкаталог
+            if len(urls_by_host) < 2:
+                return effective_out_dir
+            return os.path.join(effective_out_dir, safe_name(host_key(url), default="host"))
+
+        sessions: Dict[str, HostSession] = {}
+        async with contextlib.AsyncExitStack() as stack:
+            for host, host_urls in urls_by_host.items():
+                p = urlparse(host_urls[0])
+                session = open_session(
+                    f"{p.scheme}://{p.netloc}",
+                    host_creds(host),
+                )
+                stack.push_async_callback(session.client.aclose)
+                sessions[host] = session
+
+            # в адаптивном режиме реальный темп задаёт контроллер хоста,
+            # семафор лишь не даёт открыть больше max_concurrency задач сразу
+            semaphore = asyncio.Semaphore(request_slots)
+            download_limiter = DownloadLimiter(file_concurrency, file_per_host)
+            page_cache = PageCache()
+            writer = DiskWriter(disk_workers, fsync=fsync)
+            file_store = FileStore(writer)
+            blob_store = (
+                await writer.run(BlobStore.load, blob_store_dir, blob_store_max_bytes)
+                if blob_store_dir
+                else None
+            )
+            manifest = await writer.run(ScrapeManifest.load, effective_out_dir)
+            results: List[Dict[str, Any]] = []
+            results_count = 0
+            failed: List[Dict[str, Any]] = []
+
+            async def export_challenge(metrics: Dict[str, Any], info: Optional[Dict[str, Any]]) -> None:
+                entry = manifest.challenges.get(metrics["url"]) if info else None
+                record = {k: v for k, v in metrics.items() if k != "files"}
+                record["files_count"] = (info or {}).get("files_count", 0)
+                record["dir"] = entry["dir"].replace(os.sep, "/") if entry else ""
+                record["files"] = manifest.challenge_files(metrics["url"]) if entry else []
                 try:
-                    info = await scrape_ctfd_challenge(
-                        client=client,
+                    await writer.run(export.add, record)
+                except (OSError, sqlite3.Error) as e:
+                    log(f"[!] Не удалось записать {metrics['url']} в экспорт: {e}")
+
+            async def worker(desc: ChallengeDescriptor):
+                nonlocal results_count
+                ch_url = desc.url
+                # метрики задачи видны всем слоям ниже через current_metrics
+                metrics: Dict[str, Any] = {
+                    "url": ch_url,
+                    "host": urlparse(ch_url).netloc,
+                    "id": desc.id,
+                }
+                current_metrics.set(metrics)
+                started = time.monotonic()
+                emit_event(on_event, "challenge_started", url=ch_url)
+                for attempt in range(1, max(1, challenge_attempts) + 1):
+                    metrics["attempts"] = attempt
+                    try:
+                        info = await scrape_ctfd_challenge(
+                            client=sessions[host_key(ch_url)].client,
+                            url=ch_url,
+                            out_root=host_out_dir(ch_url),
+                            save_files=not no_files,
+                            save_desc=not no_desc,
+                            save_html=save_html,
+                            api_first=api_first,
+                            meta_limiter=semaphore,
+                            download_limiter=download_limiter,
+                            manifest=manifest,
+                            update=update,
+                            on_event=on_event,
+                            download_timeout=file_timeouts,
+                            descriptor=desc,
+                            page_cache=page_cache,
+                            file_store=file_store,
+                            blob_store=blob_store,
+                            writer=writer,
+                            segments=segments,
+                            segment_threshold=segment_threshold,
+                            cpu=cpu,
+                            hashes=hashes,
+                        )
+                    except Exception as e:
+                        metrics["error"] = f"{type(e).__name__}: {e}"
+                        if attempt < challenge_attempts and budget.take():
+                            # пауза вне семафора — остальные задачи тем временем идут
+                            delay = retry_policy.backoff(attempt + 1)
+                            log(
+                                f"[!] Ошибка при обработке {ch_url}: {e}; "
+                                f"повтор {attempt + 1}/{challenge_attempts} через {delay:.1f} с"
+                            )
+                            emit_event(
+                                on_event, "challenge_retry",
+                                url=ch_url, attempt=attempt + 1, error=str(e),
+                            )
+                            await asyncio.sleep(delay)
+                            continue
+                        log(f"[!] Задача окончательно не скачалась {ch_url}: {e}")
+                        failed.append({"url": ch_url, "error": str(e), "attempts": attempt})
+                        emit_event(on_event, "challenge_failed", url=ch_url, error=str(e))
+                        finish_metrics(metrics, "failed", started)
+                        await export_challenge(metrics, None)
+                        return
+
+                    if info:
+                        results_count += 1
+                        if keep_results:
+                            results.append(info)
+                    metrics.pop("error", None)
+                    finish_metrics(
+                        metrics, "unchanged" if metrics.get("unchanged") else "ok", started, info
+                    )
+                    await export_challenge(metrics, info)
+                    emit_event(
+                        on_event, "challenge_finished",
                         url=ch_url,
-                        out_root=effective_out_dir,
-                        save_files=not no_files,
-                        save_desc=not no_desc,
-                        save_html=save_html,
+                        title=(info or {}).get("title", ""),
+                        files_count=(info or {}).get("files_count", 0),
                     )
-                    if info:
-                        results.append(info)
+                    return
+
+            host_errors: List[BaseException] = []
+
+            async def discover_host(
+                session: HostSession,
+                host_urls: List[str],
+                queue: "asyncio.Queue[Optional[ChallengeDescriptor]]",
+            ) -> None:
+                try:
+                    await session.login()
+                    for u in host_urls:
+                        if is_challenge_list_url(u):
+                            async for desc in iter_challenges_from_list(
+                                session.client, u, page_cache
+                            ):
+                                await queue.put(desc)
+                        else:
+                            await queue.put(ChallengeDescriptor.from_url(u))
                 except Exception as e:
-                    print(f"[!] Ошибка при обработке {ch_url}: {e}")
+                    log(f"[!] Хост {session.host} пропущен: {e}")
+                    host_errors.append(e)
+                    failed.append({"url": session.root, "error": str(e), "attempts": 1})
 
-        tasks = [asyncio.create_task(worker(u)) for u in uniq_challenge_urls]
-        await asyncio.gather(*tasks)
+            async def challenge_stream() -> AsyncIterator[ChallengeDescriptor]:
+                # все хосты логинятся и обходятся одновременно, задачи
+                # приходят в общую очередь по мере обнаружения
+                queue: "asyncio.Queue[Optional[ChallengeDescriptor]]" = asyncio.Queue(
+                    maxsize=max(1, request_slots) * 4
+                )
+                producers = [
+                    asyncio.create_task(discover_host(sessions[host], host_urls, queue))
+                    for host, host_urls in urls_by_host.items()
+                ]
 
-    index_path = write_index_md(results, effective_out_dir)
-    zip_path = make_zip_archive(effective_out_dir)
+                async def close_queue() -> None:
+                    await asyncio.gather(*producers)
+                    await queue.put(None)
 
-    return {
-        "results": results,
-        "index_path": index_path,
-        "zip_path": zip_path,
-    }
+                closer = asyncio.create_task(close_queue())
+                try:
+                    while (desc := await queue.get()) is not None:
+                        yield desc
+                finally:
+                    for task in (closer, *producers):
+                        task.cancel()
+                    await asyncio.gather(closer, *producers, return_exceptions=True)
+                if host_errors and len(host_errors) == len(urls_by_host):
+                    raise host_errors[0]
+
+            # задачи стартуют сразу по мере обнаружения; pending ограничивает,
+            # сколько их может быть запущено, но ещё не завершено
+            pending = asyncio.Semaphore(max(1, request_slots) * 4)
+            tasks: set = set()
+            seen: set = set()
+            discovered = 0
+            last_discovered_emit = 0.0
+
+            async def run_worker(desc: ChallengeDescriptor) -> None:
+                try:
+                    await worker(desc)
+                finally:
+                    pending.release()
+
+            try:
+                async for desc in challenge_stream():
+                    if desc.key in seen:
+                        continue
+                    seen.add(desc.key)
+                    discovered += 1
+                    now = time.monotonic()
+                    if now - last_discovered_emit >= PROGRESS_INTERVAL:
+                        last_discovered_emit = now
+                        emit_event(on_event, "discovered", count=discovered, done=False)
+
+                    await pending.acquire()
+                    task = asyncio.create_task(run_worker(desc))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                emit_event(on_event, "discovered", count=discovered, done=True)
+                if tasks:
+                    await asyncio.gather(*list(tasks))
+            except BaseException:
+                for task in list(tasks):
+                    task.cancel()
+                await asyncio.gather(*list(tasks), return_exceptions=True)
+                raise
+            finally:
+                # ждём хвост записи, манифест и хранилище (evict обходит
+                # все blobs) сохраняем вне event loop
+                await asyncio.to_thread(writer.close)
+                await asyncio.to_thread(manifest.save)
+                if blob_store is not None:
+                    await asyncio.to_thread(blob_store.save)
+
+            if not discovered:
+                export_status = "finished"
+                emit_event(on_event, "finished", count=0)
+                return {
+                    "results": [],
+                    "results_count": 0,
+                    "failed": failed,
+                    "retries": budget.used,
+                    "hosts": hosts_snapshot(),
+                    "pages": page_cache.stats(),
+                    "dedup": file_store.stats(),
+                    "blobs": blob_store.stats() if blob_store is not None else {},
+                    "metrics": metrics_summary(),
+                    "log_path": run_log.path,
+                    "index_path": "",
+                    "checksums_path": "",
+                    "export_path": export.jsonl_path,
+                    "export_db": export.db_path,
+                    "zip_path": "",
+                }
+
+        index_path = await asyncio.to_thread(
+            write_index_from_journal, export.journal_path, effective_out_dir
+        )
+        # индекс прошлого прерванного прогона больше не нужен
+        remove_if_exists(os.path.join(effective_out_dir, PARTIAL_INDEX_NAME))
+        checksums_path = await asyncio.to_thread(write_checksums, manifest)
+        # журнал этого прогона должен попасть в архив
+        await asyncio.to_thread(export.finish_journal)
+        zip_path = ""
+        if make_zip:
+            loop = asyncio.get_running_loop()
+            last_progress = [0.0]
+
+            def archive_progress(done: int, total: int) -> None:
+                # вызывается из потока архивации — переносим событие в event loop
+                now = time.monotonic()
+                if done < total and now - last_progress[0] < PROGRESS_INTERVAL:
+                    return
+                last_progress[0] = now
+                loop.call_soon_threadsafe(
+                    lambda: emit_event(on_event, "archive_progress", done=done, total=total)
+                )
+
+            emit_event(on_event, "archive_started")
+            # сжатие в отдельном потоке, чтобы не блокировать event loop веба
+            zip_path = await asyncio.to_thread(
+                make_zip_archive,
+                effective_out_dir,
+                progress=archive_progress if on_event is not None else None,
+                cpu=cpu,
+            )
+            emit_event(on_event, "archive_finished", path=zip_path)
+
+        export_status = "finished"
+        emit_event(on_event, "finished", count=results_count)
+
+        return {
+            "results": results,
+            "results_count": results_count,
+            "failed": failed,
+            "retries": budget.used,
+            "hosts": hosts_snapshot(),
+            "pages": page_cache.stats(),
+            "dedup": file_store.stats(),
+            "blobs": blob_store.stats() if blob_store is not None else {},
+            "metrics": metrics_summary(),
+            "log_path": run_log.path,
+            "index_path": index_path,
+            "checksums_path": checksums_path,
+            "export_path": export.jsonl_path,
+            "export_db": export.db_path,
+            "zip_path": zip_path,
+        }
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        export_status = "interrupted"
+        raise
+    finally:
+        if cpu is not None:
+            await asyncio.to_thread(cpu.close)
+        if export is not None:
+            await asyncio.to_thread(export.close, export_status)
+        if export is not None and export_status != "finished":
+            # прогон оборвался: индекс того, что успело сохраниться, — рядом,
+            # полный INDEX.md прошлого прогона не уменьшаем
+            with contextlib.suppress(OSError):
+                if await asyncio.to_thread(
+                    write_index_from_journal,
+                    export.journal_path,
+                    effective_out_dir,
+                    index_name=PARTIAL_INDEX_NAME,
+                ):
+                    log(
+                        f"[!] Прогон прерван, INDEX.md не тронут; сохранённые задачи "
+                        f"({export.count}) — в {PARTIAL_INDEX_NAME}"
+                    )
+        current_run_log.reset(log_token)
+        await asyncio.to_thread(run_log.close)
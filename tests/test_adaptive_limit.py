@@ -0,0 +1,55 @@
+"""
+AdaptiveLimitTransport/HostController: лимит одновременных запросов к хосту
+соблюдается, растёт на быстрых ответах и уменьшается на перегрузке.
+"""
+import asyncio
+
+import httpx
+
+from scraper_core import AdaptiveLimitTransport, HostController
+
+
+def test_limit_grows_on_fast_responses_and_halves_on_overload():
+    async def run():
+        ctl = HostController(4, max_limit=16)
+        for _ in range(20):
+            await ctl.acquire()
+            await ctl.release(0.01, overloaded=False)
+        grown = ctl.limit
+        await ctl.acquire()
+        await ctl.release(None, overloaded=True)
+        after_overload = ctl.limit
+        # вторая волна ошибок сразу следом лимит больше не режет
+        await ctl.acquire()
+        await ctl.release(None, overloaded=True)
+        return grown, after_overload, ctl
+
+    grown, after_overload, ctl = asyncio.run(run())
+    assert grown > 4
+    assert after_overload == grown * 0.5
+    assert ctl.limit == after_overload
+    assert ctl.overloads == 2 and ctl.inflight == 0
+
+
+def test_transport_keeps_inflight_under_limit_and_backs_off_on_503():
+    state = {"inflight": 0, "peak": 0, "calls": 0}
+
+    async def handler(request):
+        state["inflight"] += 1
+        state["peak"] = max(state["peak"], state["inflight"])
+        await asyncio.sleep(0.01)
+        state["inflight"] -= 1
+        state["calls"] += 1
+        return httpx.Response(503 if state["calls"] == 10 else 200)
+
+    async def run():
+        limiter = AdaptiveLimitTransport(httpx.MockTransport(handler), initial=2, max_limit=2)
+        async with httpx.AsyncClient(transport=limiter) as client:
+            await asyncio.gather(*(client.get(f"http://ctf.test/files/{i}") for i in range(10)))
+        return limiter.snapshot()["ctf.test"]
+
+    snapshot = asyncio.run(run())
+    assert state["peak"] == 2
+    assert snapshot["requests"] == 10
+    assert snapshot["overloads"] == 1
+    assert snapshot["limit"] == 1
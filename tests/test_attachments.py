@@ -0,0 +1,65 @@
+"""
+Вложения с одинаковым именем в разных папках-хешах CTFd
+(/files/<hash>/libc.so) не должны писаться в один и тот же файл.
+"""
+import asyncio
+
+import httpx
+
+from scraper_core import ScrapeManifest, scrape_ctfd_challenge, unique_file_names
+
+BASE = "http://ctf.test"
+BODIES = {
+    "/files/0a1b/libc.so": b"libc-2.31" * 512,
+    "/files/9f8e/libc.so": b"libc-2.35" * 512,
+}
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if path == "/api/v1/challenges/1":
+        return httpx.Response(200, json={"success": True, "data": {
+            "id": 1,
+            "name": "Echo",
+            "category": "Pwn",
+            "description": "<p>pwn me</p>",
+            "files": [f"{p}?token=1" for p in BODIES],
+        }})
+    if path in BODIES:
+        return httpx.Response(200, content=BODIES[path])
+    return httpx.Response(404)
+
+
+def test_unique_file_names():
+    files = [
+        ("libc.so", f"{BASE}/files/0a1b/libc.so?token=1"),
+        ("libc.so", f"{BASE}/files/9f8e/libc.so?token=2"),
+        ("libc.so", f"{BASE}/files/0a1b/libc.so?token=3"),
+        ("libc.so", f"{BASE}/files/9f8e/libc.so?v=2"),
+    ]
+    assert [name for name, _ in unique_file_names(files)] == [
+        "libc.so",
+        "libc_9f8e.so",
+        "libc_2.so",
+    ]
+
+
+def test_same_basename_in_different_hash_dirs(tmp_path):
+    manifest = ScrapeManifest(str(tmp_path))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scrape_ctfd_challenge(
+                client, f"{BASE}/challenges#-1", str(tmp_path), manifest=manifest
+            )
+
+    asyncio.run(run())
+    files_dir = tmp_path / "Pwn" / "Pwn_Echo" / "files"
+    assert (files_dir / "libc.so").read_bytes() == BODIES["/files/0a1b/libc.so"]
+    assert (files_dir / "libc_9f8e.so").read_bytes() == BODIES["/files/9f8e/libc.so"]
+
+    entry = next(iter(manifest.challenges.values()))
+    assert sorted(entry["files"]) == [
+        "Pwn/Pwn_Echo/files/libc.so",
+        "Pwn/Pwn_Echo/files/libc_9f8e.so",
+    ]
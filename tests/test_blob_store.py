@@ -0,0 +1,51 @@
+import hashlib
+import os
+
+from scraper_core import BlobStore
+
+
+def put_blob(store, dump_dir, name, data, url):
+    os.makedirs(dump_dir, exist_ok=True)
+    out_path = os.path.join(dump_dir, name)
+    with open(out_path, "wb") as f:
+        f.write(data)
+    store.put(url, {
+        "path": out_path,
+        "not_modified": False,
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "etag": f'"{name}"',
+    })
+    return out_path
+
+
+def test_lookup_ignores_file_token(tmp_path):
+    store = BlobStore(str(tmp_path / "store"))
+    put_blob(store, str(tmp_path / "dump"), "libc.so", b"libc", "http://ctf.test/files/ab/libc.so?token=1")
+    entry = store.lookup("http://ctf.test/files/ab/libc.so?token=2")
+    assert entry is not None
+    assert entry["sha256"] == hashlib.sha256(b"libc").hexdigest()
+
+
+def test_evict_keeps_blobs_referenced_by_dumps(tmp_path):
+    store = BlobStore(str(tmp_path / "store"))
+    kept = put_blob(store, str(tmp_path / "dump"), "kept.bin", b"a" * 100, "http://ctf.test/files/aa/kept.bin")
+    gone = put_blob(store, str(tmp_path / "old"), "gone.bin", b"b" * 100, "http://ctf.test/files/bb/gone.bin")
+    os.remove(gone)
+
+    assert store.evict(0) == 1
+    assert os.path.isfile(store.blob_path(hashlib.sha256(b"a" * 100).hexdigest()))
+    assert not os.path.exists(store.blob_path(hashlib.sha256(b"b" * 100).hexdigest()))
+    assert store.lookup("http://ctf.test/files/aa/kept.bin") is not None
+    assert store.lookup("http://ctf.test/files/bb/gone.bin") is None
+    assert os.path.isfile(kept)
+
+
+def test_evict_counts_only_unreferenced_bytes(tmp_path):
+    store = BlobStore(str(tmp_path / "store"))
+    put_blob(store, str(tmp_path / "dump"), "big.bin", b"a" * 1000, "http://ctf.test/files/aa/big.bin")
+    old = put_blob(store, str(tmp_path / "old"), "small.bin", b"b" * 10, "http://ctf.test/files/bb/small.bin")
+    os.remove(old)
+
+    assert store.evict(100) == 0
+    assert os.path.isfile(store.blob_path(hashlib.sha256(b"b" * 10).hexdigest()))
@@ -0,0 +1,36 @@
+import asyncio
+
+from scraper_core import FileStore
+
+
+def test_same_file_with_different_tokens_is_fetched_once(tmp_path):
+    calls = []
+
+    async def run():
+        store = FileStore()
+
+        def downloader(out_path):
+            async def download():
+                calls.append(out_path)
+                await asyncio.sleep(0.01)
+                with open(out_path, "wb") as f:
+                    f.write(b"image")
+                return {"path": out_path, "not_modified": False, "size": 5, "sha256": "x"}
+            return download
+
+        paths = []
+        for i in range(3):
+            d = tmp_path / f"task{i}"
+            d.mkdir()
+            paths.append(str(d / "disk.img"))
+        return await asyncio.gather(*(
+            store.fetch(f"http://ctf.test/files/ab/disk.img?token={i}", p, downloader(p))
+            for i, p in enumerate(paths)
+        )), paths
+
+    infos, paths = asyncio.run(run())
+    assert len(calls) == 1
+    assert [info["path"] for info in infos] == paths
+    for p in paths:
+        with open(p, "rb") as f:
+            assert f.read() == b"image"
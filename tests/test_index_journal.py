@@ -0,0 +1,45 @@
+import os
+
+from scraper_core import (
+    EXPORT_JSONL_NAME,
+    PARTIAL_INDEX_NAME,
+    DumpExport,
+    write_index_from_journal,
+)
+
+
+def record(i):
+    return {
+        "url": f"http://ctf.test/challenges#-{i}",
+        "status": "ok",
+        "title": f"Task {i}",
+        "category": "Misc",
+        "dir": f"Misc/Task_{i}",
+        "files_count": 0,
+    }
+
+
+def index_rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [line for line in f if line.startswith("| ") and not line.startswith("| #")]
+
+
+def test_interrupted_run_keeps_full_index_and_journal(tmp_path):
+    out = str(tmp_path)
+    export = DumpExport.open(out, "run1", ["http://ctf.test"])
+    for i in range(3):
+        export.add(record(i))
+    index_path = write_index_from_journal(export.journal_path, out)
+    export.close("finished")
+    journal = (tmp_path / EXPORT_JSONL_NAME).read_text()
+    assert len(index_rows(index_path)) == 3
+
+    export = DumpExport.open(out, "run2", ["http://ctf.test"])
+    export.add(record(0))
+    export.close("interrupted")
+    partial = write_index_from_journal(export.journal_path, out, index_name=PARTIAL_INDEX_NAME)
+
+    assert len(index_rows(index_path)) == 3
+    assert (tmp_path / EXPORT_JSONL_NAME).read_text() == journal
+    assert os.path.basename(partial) == PARTIAL_INDEX_NAME
+    assert len(index_rows(partial)) == 1
@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+
+from scraper_core import MetricsSummary, PageCache, current_metrics
+
+
+def test_cached_page_counts_one_request_and_its_time():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, text="<html><body>challenges</body></html>")
+
+    async def run():
+        cache = PageCache()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            async def task(i):
+                metrics = {"url": f"http://ctf.test/challenges#-{i}", "host": "ctf.test"}
+                current_metrics.set(metrics)
+                await cache.get(client, metrics["url"])
+                await asyncio.sleep(0.05)
+                return metrics
+
+            return cache, await asyncio.gather(*(task(i) for i in range(4)))
+
+    cache, all_metrics = asyncio.run(run())
+    assert cache.stats() == {"fetches": 1, "hits": 3}
+    fetched = [m for m in all_metrics if m.get("html_requests")]
+    assert len(fetched) == 1 and fetched[0]["html_requests"] == 1
+    assert 0.04 < fetched[0]["html_seconds"] < 0.1
+    assert all("html_seconds" not in m for m in all_metrics if m is not fetched[0])
+
+    summary = MetricsSummary()
+    for m in all_metrics:
+        summary.add({**m, "status": "ok", "seconds": 0.1})
+    assert summary.result()["hosts"]["ctf.test"]["html_latency"] < 0.1
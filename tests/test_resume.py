@@ -0,0 +1,110 @@
+"""
+Докачка download_file по Range + If-Range: обрыв оставляет .part, следующая
+попытка продолжает его (206), поменявшийся файл качается заново (200),
+а на 416 .part сбрасывается.
+"""
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+from scraper_core import PART_STATE_SUFFIX, download_file
+
+URL = "http://ctf.test/files/ab/disk.img"
+
+
+class Dropped(httpx.AsyncByteStream):
+    """Тело, которое обрывается после первых байт."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+        raise httpx.ReadError("connection dropped")
+
+
+class RangeServer:
+    def __init__(self, body: bytes, etag: str = '"v1"'):
+        self.body = body
+        self.etag = etag
+        self.drop_at = None
+        self.range_status = None
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        headers = {"ETag": self.etag, "Accept-Ranges": "bytes"}
+        rng = request.headers.get("Range")
+        if rng and request.headers.get("If-Range") == self.etag:
+            if self.range_status is not None:
+                return httpx.Response(self.range_status, headers=headers)
+            start = int(rng.split("=")[1].split("-")[0])
+            return httpx.Response(206, content=self.body[start:], headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{len(self.body) - 1}/{len(self.body)}",
+            })
+        if self.drop_at is not None:
+            drop_at, self.drop_at = self.drop_at, None
+            return httpx.Response(200, stream=Dropped(self.body[:drop_at]), headers={
+                **headers, "Content-Length": str(len(self.body)),
+            })
+        return httpx.Response(200, content=self.body, headers=headers)
+
+
+def fetch(server, out_path):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server.handler)) as client:
+            return await download_file(client, URL, str(out_path), chunk_size=1024)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def dropped(tmp_path):
+    """Первая попытка обрывается на 40%: на диске остаются .part и .part.json."""
+    server = RangeServer(bytes(range(256)) * 200)
+    server.drop_at = 20480
+    out_path = tmp_path / "disk.img"
+    with pytest.raises(httpx.ReadError):
+        fetch(server, out_path)
+    assert (tmp_path / "disk.img.part").stat().st_size == 20480
+    assert (tmp_path / ("disk.img" + PART_STATE_SUFFIX)).is_file()
+    return server, out_path
+
+
+def assert_saved(info, out_path, body):
+    assert out_path.read_bytes() == body
+    assert info["size"] == len(body)
+    assert info["sha256"] == hashlib.sha256(body).hexdigest()
+    assert not out_path.with_name(out_path.name + ".part").exists()
+    assert not out_path.with_name(out_path.name + PART_STATE_SUFFIX).exists()
+
+
+def test_truncated_download_resumes_with_range(dropped):
+    server, out_path = dropped
+    info = fetch(server, out_path)
+    resume = server.requests[-1]
+    assert resume.headers["Range"] == "bytes=20480-"
+    assert resume.headers["If-Range"] == '"v1"'
+    assert_saved(info, out_path, server.body)
+
+
+def test_changed_file_is_fetched_whole_when_if_range_fails(dropped):
+    server, out_path = dropped
+    server.body = b"new build" * 3000
+    server.etag = '"v2"'
+    info = fetch(server, out_path)
+    assert server.requests[-1].headers["If-Range"] == '"v1"'
+    assert info["etag"] == '"v2"'
+    assert_saved(info, out_path, server.body)
+
+
+def test_416_discards_part_and_starts_over(dropped):
+    server, out_path = dropped
+    server.range_status = 416
+    info = fetch(server, out_path)
+    assert "Range" in server.requests[-2].headers
+    assert "Range" not in server.requests[-1].headers
+    assert_saved(info, out_path, server.body)
@@ -0,0 +1,77 @@
+"""
+RetryTransport: повторы на 429/5xx с учётом Retry-After, без повторов для POST.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+import scraper_core
+from scraper_core import RetryBudget, RetryPolicy, RetryTransport, parse_retry_after
+
+URL = "http://ctf.test/api/v1/challenges"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+
+    monkeypatch.setattr(scraper_core.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def flaky(responses):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses.pop(0) if responses else httpx.Response(200, json={"ok": True})
+
+    return calls, httpx.MockTransport(handler)
+
+
+def request(transport, method="GET", budget=None):
+    async def run():
+        retry = RetryTransport(transport, RetryPolicy(base_delay=0.01), budget or RetryBudget())
+        async with httpx.AsyncClient(transport=retry) as client:
+            return await client.request(method, URL)
+
+    return asyncio.run(run())
+
+
+def test_503_with_retry_after_is_retried_after_the_given_delay(sleeps):
+    calls, transport = flaky([
+        httpx.Response(503, headers={"Retry-After": "7"}),
+        httpx.Response(429, headers={"Retry-After": "2"}),
+    ])
+    resp = request(transport)
+    assert resp.status_code == 200
+    assert len(calls) == 3
+    assert sleeps[0] >= 7 and sleeps[1] >= 2
+
+
+def test_post_is_not_retried(sleeps):
+    calls, transport = flaky([httpx.Response(503, headers={"Retry-After": "1"})])
+    resp = request(transport, method="POST")
+    assert resp.status_code == 503
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_retries_stop_when_budget_is_spent(sleeps):
+    budget = RetryBudget(1)
+    calls, transport = flaky([httpx.Response(503)] * 3)
+    resp = request(transport, budget=budget)
+    assert resp.status_code == 503
+    assert len(calls) == 2
+    assert budget.used == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
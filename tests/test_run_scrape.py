@@ -0,0 +1,139 @@
+"""
+run_scrape целиком против мини-CTFd на httpx.MockTransport.
+"""
+import asyncio
+import json
+import os
+import zipfile
+
+import httpx
+import pytest
+
+import scraper_core
+from scraper_core import EXPORT_JSONL_NAME, run_scrape
+
+BASE = "http://ctf.test"
+
+
+class MiniCTFd:
+    def __init__(self, count=3):
+        self.count = count
+
+    def challenge(self, i):
+        return {
+            "id": i,
+            "name": f"Task {i}",
+            "category": "Misc",
+            "description": f"<p>task {i}</p>",
+            "files": [f"/files/{i:04x}/data{i}.txt?token=1"],
+        }
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/api/v1/challenges":
+            return httpx.Response(200, json={"success": True, "data": [
+                {"id": i, "name": f"Task {i}", "category": "Misc"}
+                for i in range(1, self.count + 1)
+            ]})
+        if path.startswith("/api/v1/challenges/"):
+            i = int(path.rsplit("/", 1)[1])
+            return httpx.Response(200, json={"success": True, "data": self.challenge(i)})
+        if path.startswith("/files/"):
+            return httpx.Response(200, content=path.encode() * 10)
+        if path == "/challenges":
+            return httpx.Response(200, text="<html><body><h1>Challenges</h1></body></html>")
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    ctfd = MiniCTFd()
+    monkeypatch.setattr(
+        scraper_core.httpx,
+        "AsyncHTTPTransport",
+        lambda **kwargs: httpx.MockTransport(ctfd.handler),
+    )
+    return ctfd
+
+
+def scrape(out_dir, **kwargs):
+    return asyncio.run(run_scrape([f"{BASE}/challenges"], out_dir=str(out_dir), **kwargs))
+
+
+def test_zip_contains_journal_of_this_run(tmp_path, server):
+    out = tmp_path / "dump"
+    runs = []
+    for _ in range(2):
+        res = scrape(out, make_zip=True)
+        with zipfile.ZipFile(res["zip_path"]) as zf:
+            lines = zf.read(EXPORT_JSONL_NAME).decode().splitlines()
+        runs.append({json.loads(line)["run"] for line in lines})
+        assert len(lines) == server.count
+        assert (out / EXPORT_JSONL_NAME).read_text().splitlines() == lines
+        # у архивов секундная метка: убираем архив, чтобы второй прогон
+        # собирал свой, а не переиспользовал члены этого
+        os.replace(res["zip_path"], tmp_path / f"run{len(runs)}.zip")
+    assert len(runs[0]) == len(runs[1]) == 1
+    assert runs[0] != runs[1]
+
+
+def test_shared_password_goes_only_to_first_host(tmp_path, monkeypatch):
+    ctfd = MiniCTFd(count=1)
+    logins = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/login":
+            if request.method == "POST":
+                logins.append((request.url.host, request.content.decode()))
+                return httpx.Response(200, text="ok")
+            return httpx.Response(200, text=(
+                '<form method="post"><input name="name"><input name="password"></form>'
+            ))
+        return ctfd.handler(request)
+
+    monkeypatch.setattr(
+        scraper_core.httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(handler)
+    )
+    res = asyncio.run(run_scrape(
+        ["http://a.test/challenges", "http://b.test/challenges"],
+        out_dir=str(tmp_path / "dump"),
+        username="alice",
+        password="secret",
+        make_zip=False,
+    ))
+    assert res["results_count"] == 2
+    assert [host for host, _ in logins] == ["a.test"]
+    assert "secret" in logins[0][1]
+
+
+def test_host_failure_reported_when_nothing_discovered(tmp_path, monkeypatch):
+    empty = MiniCTFd(count=0)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "down.test":
+            return httpx.Response(404)
+        return empty.handler(request)
+
+    monkeypatch.setattr(
+        scraper_core.httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(handler)
+    )
+    res = asyncio.run(run_scrape(
+        ["http://down.test/challenges", "http://empty.test/challenges"],
+        out_dir=str(tmp_path / "dump"),
+        make_zip=False,
+    ))
+    assert res["results_count"] == 0
+    assert [f["url"] for f in res["failed"]] == ["http://down.test"]
+
+
+def test_unwritable_export_db_still_closes_run_log(tmp_path, server, monkeypatch):
+    closed = []
+    close = scraper_core.RunLog.close
+    monkeypatch.setattr(
+        scraper_core.RunLog, "close", lambda self: (closed.append(self.path), close(self))
+    )
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    with pytest.raises(OSError):
+        scrape(tmp_path / "dump", export_db=str(blocker / "shared.sqlite"), make_zip=False)
+    assert closed == [str(tmp_path / "dump" / scraper_core.RUN_LOG_NAME)]
@@ -0,0 +1,76 @@
+"""
+Закачка в несколько соединений (download_segmented через download_file):
+файл собирается из Range-кусков, а смена файла посреди закачки не даёт
+склеить разные версии.
+"""
+import asyncio
+import hashlib
+import os
+
+import httpx
+import pytest
+
+from scraper_core import PART_STATE_SUFFIX, download_file
+
+URL = "http://ctf.test/files/ab/disk.img"
+BODY = os.urandom(30000)
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "pwrite"), reason="нужен os.pwrite")
+
+
+class SegmentServer:
+    def __init__(self):
+        self.body = BODY
+        self.etag = '"' + hashlib.md5(BODY).hexdigest() + '"'
+        self.change_after = None
+        self.ranges = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        headers = {"ETag": self.etag, "Accept-Ranges": "bytes"}
+        rng = request.headers.get("Range")
+        if rng is None:
+            return httpx.Response(200, content=self.body, headers=headers)
+        self.ranges.append(rng)
+        if self.change_after is not None and len(self.ranges) > self.change_after:
+            self.body = b"rebuilt" * 5000
+            self.etag = '"v2"'
+            headers["ETag"] = self.etag
+        if request.headers.get("If-Range") != self.etag:
+            return httpx.Response(200, content=self.body, headers=headers)
+        start, end = (int(x) for x in rng.split("=")[1].split("-"))
+        return httpx.Response(206, content=self.body[start:end + 1], headers={
+            **headers, "Content-Range": f"bytes {start}-{end}/{len(self.body)}",
+        })
+
+
+def fetch(server, out_path):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server.handler)) as client:
+            return await download_file(
+                client, URL, str(out_path),
+                chunk_size=1024, segments=3, segment_threshold=1024,
+            )
+
+    return asyncio.run(run())
+
+
+def test_large_file_is_fetched_in_three_ranges(tmp_path):
+    server = SegmentServer()
+    out_path = tmp_path / "disk.img"
+    info = fetch(server, out_path)
+    assert sorted(server.ranges) == ["bytes=0-9999", "bytes=10000-19999", "bytes=20000-29999"]
+    assert out_path.read_bytes() == BODY
+    assert info["size"] == len(BODY)
+    assert info["sha256"] == hashlib.sha256(BODY).hexdigest()
+    assert not (tmp_path / "disk.img.part").exists()
+
+
+def test_etag_change_mid_download_fails_without_mixing_versions(tmp_path):
+    server = SegmentServer()
+    server.change_after = 1
+    out_path = tmp_path / "disk.img"
+    with pytest.raises(httpx.HTTPStatusError, match="поменялся"):
+        fetch(server, out_path)
+    assert not out_path.exists()
+    assert not (tmp_path / "disk.img.part").exists()
+    assert not (tmp_path / ("disk.img" + PART_STATE_SUFFIX)).exists()
@@ -0,0 +1,63 @@
+"""
+Инкрементальный режим не должен пропускать задачу, если прошлый проход
+сохранял меньше, чем просят сейчас (save_files/save_desc/save_html).
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from scraper_core import ScrapeManifest, scrape_ctfd_challenge
+
+BASE = "http://ctf.test"
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if path == "/api/v1/challenges/1":
+        return httpx.Response(200, json={"success": True, "data": {
+            "id": 1,
+            "name": "Echo",
+            "category": "Pwn",
+            "description": "<p>pwn me</p>",
+            "files": ["/files/0a1b/libc.so?token=1"],
+        }})
+    if path == "/files/0a1b/libc.so":
+        return httpx.Response(200, content=b"libc")
+    if path == "/challenges":
+        return httpx.Response(200, text="<html><title>Echo</title><body>pwn me</body></html>")
+    return httpx.Response(404)
+
+
+def scrape(manifest, out_dir, **options):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scrape_ctfd_challenge(
+                client, f"{BASE}/challenges#-1", str(out_dir), manifest=manifest, update=True, **options
+            )
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("option, path", [
+    ("save_files", "files/libc.so"),
+    ("save_desc", "description.txt"),
+    ("save_html", "page.html"),
+])
+def test_enabling_option_later_fetches_missing_parts(tmp_path, option, path):
+    manifest = ScrapeManifest(str(tmp_path))
+    scrape(manifest, tmp_path, **{option: False})
+    challenge_dir = tmp_path / "Pwn" / "Pwn_Echo"
+    assert not (challenge_dir / path).exists()
+
+    result = scrape(manifest, tmp_path, **{option: True})
+    assert (challenge_dir / path).is_file()
+    if option == "save_files":
+        assert result["files_count"] == 1
+
+
+def test_narrower_pass_still_skips(tmp_path):
+    manifest = ScrapeManifest(str(tmp_path))
+    scrape(manifest, tmp_path)
+    assert manifest.challenge_is_intact(f"{BASE}/challenges#-1", save_files=False)
+    assert not manifest.challenge_is_intact(f"{BASE}/challenges#-1", save_html=True)
@@ -0,0 +1,89 @@
+"""
+Инкрементальный режим на CTFd, который подписывает ссылки на файлы
+одноразовым ?token=: повторный проход не должен перекачивать вложения.
+"""
+import asyncio
+import itertools
+
+import httpx
+
+from scraper_core import ScrapeManifest, file_url_key, hash_payload, scrape_ctfd_challenge
+
+BASE = "http://ctf.test"
+FILE_BODY = b"\x7fELF" + b"x" * 4096
+
+
+class RotatingTokenCTFd:
+    """Мини-CTFd: ответ API без ETag, в каждом ответе новый token у ссылки на файл."""
+
+    def __init__(self):
+        self.tokens = itertools.count(1)
+        self.description = "<p>pwn me</p>"
+        self.file_requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/api/v1/challenges/1":
+            return httpx.Response(200, json={"success": True, "data": {
+                "id": 1,
+                "name": "Echo",
+                "category": "Pwn",
+                "value": 100,
+                "description": self.description,
+                "files": [f"/files/0a1b/libc.so?token={next(self.tokens)}"],
+            }})
+        if path == "/files/0a1b/libc.so":
+            self.file_requests.append(request)
+            if request.headers.get("If-None-Match") == '"libc-v1"':
+                return httpx.Response(304, headers={"ETag": '"libc-v1"'})
+            return httpx.Response(200, content=FILE_BODY, headers={"ETag": '"libc-v1"'})
+        return httpx.Response(404)
+
+
+def scrape(server: RotatingTokenCTFd, manifest: ScrapeManifest, out_dir: str):
+    async def run():
+        transport = httpx.MockTransport(server.handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await scrape_ctfd_challenge(
+                client,
+                f"{BASE}/challenges#-1",
+                str(out_dir),
+                manifest=manifest,
+                update=True,
+            )
+
+    return asyncio.run(run())
+
+
+def test_file_url_key_drops_token_only():
+    assert file_url_key("/files/ab/x.txt?token=1#frag") == "/files/ab/x.txt"
+    assert file_url_key(f"{BASE}/files/ab/x.txt?v=2&token=3") == f"{BASE}/files/ab/x.txt?v=2"
+
+
+def test_payload_hash_ignores_file_token():
+    a = {"id": 1, "files": ["/files/ab/x.txt?token=1"]}
+    b = {"id": 1, "files": ["/files/ab/x.txt?token=2"]}
+    assert hash_payload(a) == hash_payload(b)
+
+
+def test_unchanged_pass_skips_files_despite_new_token(tmp_path):
+    server = RotatingTokenCTFd()
+    manifest = ScrapeManifest(str(tmp_path))
+    scrape(server, manifest, tmp_path)
+    assert len(server.file_requests) == 1
+
+    scrape(server, manifest, tmp_path)
+    assert len(server.file_requests) == 1
+
+
+def test_changed_challenge_revalidates_file_with_new_token(tmp_path):
+    server = RotatingTokenCTFd()
+    manifest = ScrapeManifest(str(tmp_path))
+    scrape(server, manifest, tmp_path)
+
+    server.description = "<p>pwn me, v2</p>"
+    scrape(server, manifest, tmp_path)
+    assert len(server.file_requests) == 2
+    assert server.file_requests[1].headers.get("If-None-Match") == '"libc-v1"'
+    path = tmp_path / "Pwn" / "Pwn_Echo" / "files" / "libc.so"
+    assert path.read_bytes() == FILE_BODY
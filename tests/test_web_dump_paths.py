@@ -0,0 +1,31 @@
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import web_app
+from scraper_core import MANIFEST_NAME
+
+
+@pytest.fixture
+def client():
+    return TestClient(web_app.app)
+
+
+@pytest.mark.parametrize("route", ["/download_stream", "/verify"])
+def test_rejects_directories_without_manifest(client, tmp_path, route):
+    (tmp_path / "secret.txt").write_text("do not serve")
+    for path in ("/", str(tmp_path)):
+        assert client.get(route, params={"path": path}).status_code == 404
+
+
+def test_streams_dump_directory(client, tmp_path):
+    dump = tmp_path / "dump"
+    (dump / "Web" / "Login").mkdir(parents=True)
+    (dump / "Web" / "Login" / "description.txt").write_text("login")
+    (dump / MANIFEST_NAME).write_text("{}")
+    resp = client.get("/download_stream", params={"path": str(dump)})
+    assert resp.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        assert zf.namelist() == ["Web/Login/description.txt"]
@@ -0,0 +1,47 @@
+import asyncio
+
+import web_app
+
+
+def test_jobs_with_same_out_dir_run_one_at_a_time(tmp_path, monkeypatch):
+    running = {}
+    overlaps = []
+
+    async def fake_run_scrape(out_dir, on_event=None, **params):
+        key = web_app.os.path.abspath(out_dir)
+        if running.get(key):
+            overlaps.append(key)
+        running[key] = running.get(key, 0) + 1
+        await asyncio.sleep(0.02)
+        running[key] -= 1
+        return {"results": []}
+
+    monkeypatch.setattr(web_app, "run_scrape", fake_run_scrape)
+    monkeypatch.setattr(web_app, "MAX_CONCURRENT_SCRAPES", 3)
+    monkeypatch.setattr(web_app, "jobs", {})
+    monkeypatch.setattr(web_app, "job_queue", None)
+    monkeypatch.setattr(web_app, "job_workers", [])
+    monkeypatch.setattr(web_app, "busy_out_dirs", {})
+
+    async def run():
+        same = str(tmp_path / "dump")
+        submitted = [
+            web_app.submit_job({"out_dir": same}),
+            web_app.submit_job({"out_dir": str(tmp_path / "." / "dump")}),
+            web_app.submit_job({"out_dir": str(tmp_path / "other")}),
+            web_app.submit_job({"out_dir": same}),
+        ]
+        await web_app.job_queue.join()
+        while any(job["status"] != "done" for job in submitted):
+            await asyncio.sleep(0.01)
+        for task in web_app.job_workers:
+            task.cancel()
+        return submitted
+
+    submitted = asyncio.run(run())
+    assert overlaps == []
+    same_dir = [submitted[i] for i in (0, 1, 3)]
+    starts = sorted(job["started_at"] for job in same_dir)
+    ends = sorted(job["finished_at"] for job in same_dir)
+    assert all(end <= start for end, start in zip(ends, starts[1:]))
+    assert submitted[2]["started_at"] < submitted[1]["started_at"]
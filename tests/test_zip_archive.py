@@ -0,0 +1,87 @@
+"""
+make_zip_archive копирует сжатые данные членов напрямую (copy_zip_member_raw,
+copy_zip_data_raw), в обход публичного API zipfile. Проверяем, что архив
+остаётся корректным при сборке, пересборке с переиспользованием прошлого
+архива, жёстких ссылках и сжатии пачками в процессах.
+"""
+import os
+import zipfile
+
+import pytest
+
+import scraper_core
+from scraper_core import CpuPool, make_zip_archive
+
+
+def build_dump(root):
+    files = {
+        "Web/Login/description.txt": b"login form, sql injection\n" * 200,
+        "Web/Login/files/source.py": b"import flask\n" * 3000,
+        "Web/Login/files/screen.png": os.urandom(5000),
+        "Pwn/Echo/description.txt": b"echo server\n" * 50,
+        "Pwn/Echo/files/libc.so": b"\x7fELF" + bytes(range(256)) * 400,
+        "Crypto/RSA/files/output.txt": b"n = 1234567\n" * 700,
+        "INDEX.md": b"# CTF Dump Index\n",
+    }
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    # FileStore кладёт одинаковые вложения разных задач жёсткими ссылками
+    shared = root / "Pwn" / "Heap" / "files" / "libc.so"
+    shared.parent.mkdir(parents=True)
+    os.link(root / "Pwn" / "Echo" / "files" / "libc.so", shared)
+    files["Pwn/Heap/files/libc.so"] = files["Pwn/Echo/files/libc.so"]
+    return files
+
+
+def check_archive(path, files):
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(files)
+        for name, data in files.items():
+            assert zf.read(name) == data
+        assert zf.getinfo("Web/Login/files/screen.png").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("Web/Login/files/source.py").compress_type == zipfile.ZIP_DEFLATED
+        echo = zf.getinfo("Pwn/Echo/files/libc.so")
+        heap = zf.getinfo("Pwn/Heap/files/libc.so")
+        assert (echo.CRC, echo.compress_size) == (heap.CRC, heap.compress_size)
+
+
+def archive_as_previous(path, root):
+    # у архивов секундная метка времени: уводим первый в прошлое,
+    # чтобы пересборка нашла его через find_previous_archive
+    previous = os.path.join(os.path.dirname(path), f"{root.name}_20000101_000000.zip")
+    os.replace(path, previous)
+    return previous
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_build_rebuild_and_reuse(tmp_path, monkeypatch, capsys, workers):
+    monkeypatch.setattr(scraper_core, "ZIP_BATCH_FILES", 2)
+    root = tmp_path / "dump"
+    files = build_dump(root)
+    cpu = CpuPool(workers)
+    try:
+        first = make_zip_archive(str(root), cpu=cpu)
+        check_archive(first, files)
+        out = capsys.readouterr().out
+        assert "Одинаковых файлов сжато один раз: 1" in out
+        if workers:
+            assert "пачек 3" in out
+
+        previous = archive_as_previous(first, root)
+        changed = root / "Crypto" / "RSA" / "files" / "output.txt"
+        files["Crypto/RSA/files/output.txt"] = b"n = 7654321\n" * 900
+        changed.write_bytes(files["Crypto/RSA/files/output.txt"])
+        files["Misc/New/description.txt"] = b"new challenge\n" * 100
+        (root / "Misc" / "New").mkdir(parents=True)
+        (root / "Misc" / "New" / "description.txt").write_bytes(files["Misc/New/description.txt"])
+
+        second = make_zip_archive(str(root), cpu=cpu)
+        check_archive(second, files)
+        out = capsys.readouterr().out
+        assert previous != second
+        assert "переиспользовано файлов: 7" in out
+    finally:
+        cpu.close()
@@ -1,11 +1,31 @@
 # web_app.py
 import os
+import asyncio
+import html as html_lib
+import json
+import time
+import uuid
+from collections import deque
+from typing import Optional, List, Dict, Any
 from urllib.parse import parse_qs, quote
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, FileResponse
-
-from scraper_core import run_scrape  # импортируем нашу логику
+from fastapi.responses import (
+    HTMLResponse,
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
+
+from scraper_core import (  # импортируем нашу логику
+    MANIFEST_NAME,
+    cpu_count,
+    iter_zip_stream,
+    parse_host_credentials,
+    run_scrape,
+    verify_dump,
+)
 
 app = FastAPI(title="CTFd Scraper Web")
 
@@ -445,6 +465,22 @@ https://ctf.example.com/challenges/web/123"
               <input type="text" name="login_url" placeholder="по умолчанию: https://host/login" />
             </div>
 
+            <div class="field">
+              <div class="field-label">
+                <span>Доступы по хостам</span>
+                <small>опционально, JSON</small>
+              </div>
+              <textarea
+                name="host_credentials"
+                rows="3"
+                placeholder='{"ctf.example.org": {"api_token": "..."}, "other.ctf": {"username": "u", "password": "p"}}'
+              ></textarea>
+              <p class="field-note">
+                Поля: username, password, api_token, cookie, login_url. Хостам без записи
+                достаются общие токен и cookie; общие логин и пароль — только первому хосту.
+              </p>
+            </div>
+
             <div class="field">
               <div class="field-label">
                 <span>Каталог для сохранения</span>
@@ -458,9 +494,28 @@ https://ctf.example.com/challenges/web/123"
             <div class="field">
               <div class="field-label">
                 <span>Параллелизм</span>
-                <small>сколько задач качать одновременно</small>
+                <small>стартовое число одновременных запросов к хосту</small>
               </div>
               <input type="text" name="concurrency" value="5" />
+              <p class="field-note">
+                По умолчанию подстраивается сам: растёт, пока CTFd отвечает быстро, и падает на 429/5xx.
+              </p>
+            </div>
+
+            <div class="field">
+              <div class="field-label">
+                <span>Лимит запросов в секунду</span>
+                <small>опционально, на каждый хост</small>
+              </div>
+              <input type="text" name="max_rps" placeholder="без ограничения" />
+            </div>
+
+            <div class="field">
+              <div class="field-label">
+                <span>Параллельные файлы</span>
+                <small>сколько файлов качать одновременно (всего)</small>
+              </div>
+              <input type="text" name="file_concurrency" value="8" />
             </div>
 
             <div class="field">
@@ -481,6 +536,31 @@ https://ctf.example.com/challenges/web/123"
                   <input type="checkbox" name="save_html" />
                   <span>Сохранять HTML каждой задачи в <code>page.html</code>.</span>
                 </label>
+
+                <label class="checkbox-row">
+                  <input type="checkbox" name="update" />
+                  <span>Режим update: пропускать неизменившиеся задачи и файлы из прошлого дампа.</span>
+                </label>
+
+                <label class="checkbox-row">
+                  <input type="checkbox" name="fixed_concurrency" />
+                  <span>Фиксированный параллелизм (без автоподстройки).</span>
+                </label>
+
+                <label class="checkbox-row">
+                  <input type="checkbox" name="http2" />
+                  <span>HTTP/2 (нужен пакет <code>h2</code>).</span>
+                </label>
+
+                <label class="checkbox-row">
+                  <input type="checkbox" name="use_blake3" />
+                  <span>Считать BLAKE3 вдобавок к sha256 (нужен пакет <code>blake3</code>).</span>
+                </label>
+
+                <label class="checkbox-row">
+                  <input type="checkbox" name="stream_zip" />
+                  <span>Не собирать ZIP на диске — отдавать архив потоково при скачивании.</span>
+                </label>
               </div>
             </div>
           </div>
@@ -507,55 +587,9 @@ https://ctf.example.com/challenges/web/123"
     """
 
 
-@app.post("/run", response_class=HTMLResponse)
-async def run(request: Request):
-    body_bytes = await request.body()
-    body_str = body_bytes.decode("utf-8", errors="ignore")
-    data = parse_qs(body_str)
-
-    def g(key: str, default: str = "") -> str:
-        return data.get(key, [default])[0]
-
-    base_url = g("base_url")
-    username = g("username")
-    password = g("password")
-    api_token = g("api_token")
-    cookie = g("cookie")
-    login_url = g("login_url")
-    out_dir = g("out_dir") or "./ctf_dump"
-    concurrency_str = g("concurrency", "5")
-
-    no_files = "no_files" in data
-    no_desc = "no_desc" in data
-    save_html = "save_html" in data
-
-    try:
-        concurrency = int(concurrency_str)
-        if concurrency <= 0:
-            concurrency = 1
-    except ValueError:
-        concurrency = 5
-
-    urls = [u.strip() for u in base_url.split() if u.strip()]
-
-    # вызываем ядро
-    try:
-        result = await run_scrape(
-            base_urls=urls,
-            username=username,
-            password=password,
-            api_token=api_token,
-            cookie=cookie,
-            login_url=login_url,
-            out_dir=out_dir,
-            concurrency=concurrency,
-            no_files=no_files,
-            no_desc=no_desc,
-            save_html=save_html,
-        )
-    except Exception as e:
-        return HTMLResponse(
-            f"""
+def render_error_page(error: str) -> HTMLResponse:
+    return HTMLResponse(
+        f"""
 <!DOCTYPE html>
 <html lang="ru">
 <head>
@@ -647,19 +681,28 @@ async def run(request: Request):
   <div class="card">
     <h1>Ошибка при парсинге</h1>
     <p>Что-то пошло не так во время выполнения дампа. Текст исключения ниже может помочь разобраться:</p>
-    <pre>{e}</pre>
+    <pre>{html_lib.escape(error or '')}</pre>
     <a href="/">← Назад к форме</a>
   </div>
 </body>
 </html>
-            """,
-            status_code=400,
-        )
+        """,
+        status_code=400,
+    )
 
+
+def render_result_page(result: Dict[str, Any], out_dir: str) -> HTMLResponse:
     results = result["results"]
+    results_count = result.get("results_count", len(results))
+    failed = result.get("failed") or []
     index_path = result["index_path"]
     zip_path = result["zip_path"]
-    zip_url = f"/download?path={quote(zip_path)}"
+    if zip_path:
+        zip_url = f"/download?path={quote(zip_path)}"
+    else:
+        # архив не собирался — отдаём его потоком прямо из каталога дампа
+        zip_path = os.path.abspath(out_dir) + " (потоково)"
+        zip_url = f"/download_stream?path={quote(os.path.abspath(out_dir))}"
 
     rows = []
     for r in sorted(results, key=lambda x: x["title"].lower()):
@@ -671,6 +714,12 @@ async def run(request: Request):
             f"<td>{r['files_count']}</td>"
             f"</tr>"
         )
+    if results_count and not results:
+        # ядро не держало результаты в памяти — полный список в INDEX.md
+        rows.append(
+            f"<tr><td colspan=\"4\">Список задач не хранится в памяти, см. "
+            f"<code>{index_path}</code></td></tr>"
+        )
 
     html = f"""
 <!DOCTYPE html>
@@ -987,13 +1036,18 @@ async def run(request: Request):
         <div class="stats">
           <div class="stat-card">
             <div class="stat-label">Всего задач</div>
-            <div class="stat-value">{len(results)}</div>
+            <div class="stat-value">{results_count}</div>
             <div class="stat-extra">Отсортировано по заголовку (A→Я).</div>
+            <div class="stat-extra">Не удалось скачать: {len(failed)}, повторов запросов: {result.get("retries", 0)}.</div>
           </div>
           <div class="stat-card">
             <div class="stat-label">Структура дампа</div>
             <div class="stat-extra">Главный индекс:</div>
             <div class="stat-extra"><code>{index_path}</code></div>
+            <div class="stat-extra">Контрольные суммы: <code>{result.get("checksums_path") or "—"}</code>
+              (<a href="/verify?path={quote(os.path.abspath(out_dir))}" target="_blank">проверить</a>)</div>
+            <div class="stat-extra">Экспорт: <code>{result.get("export_path") or "—"}</code>,
+              <code>{result.get("export_db") or "—"}</code></div>
           </div>
         </div>
 
@@ -1038,6 +1092,518 @@ async def run(request: Request):
     return HTMLResponse(html)
 
 
+# ---- очередь заданий ----
+#
+# /run не ждёт окончания дампа: задание кладётся в FIFO-очередь, её
+# разбирают MAX_CONCURRENT_SCRAPES воркеров, а браузер опрашивает
+# /jobs/{id} (JSON) или /jobs/{id}/result (HTML).
+# Задания в одну и ту же папку выполняются строго по очереди: два дампа
+# в один out_dir перетирали бы друг другу журнал, манифест, INDEX и ZIP.
+
+MAX_CONCURRENT_SCRAPES = max(1, int(os.environ.get("CTFD_SCRAPER_MAX_JOBS", "2")))
+MAX_FINISHED_JOBS = 100
+
+# общее для всех заданий хранилище файлов (см. scraper_core.BlobStore)
+BLOB_STORE_DIR = os.environ.get("CTFD_SCRAPER_BLOB_STORE") or None
+BLOB_STORE_MAX_BYTES = int(float(os.environ.get("CTFD_SCRAPER_BLOB_STORE_MAX_GB", "0")) * 1024**3)
+
+# общая SQLite-база экспорта для всех заданий (см. scraper_core.DumpExport);
+# по умолчанию у каждого дампа своя <out_dir>/dump.sqlite
+EXPORT_DB = os.environ.get("CTFD_SCRAPER_EXPORT_DB") or None
+
+# "0" — не держать результаты задач в памяти сервера (очень большие дампы):
+# на странице результата остаётся только число задач и путь к INDEX.md
+KEEP_RESULTS = os.environ.get("CTFD_SCRAPER_KEEP_RESULTS", "1") != "0"
+
+# процессы для разбора/хэшей/сжатия (см. scraper_core.CpuPool); "auto" —
+# доступные ядра, поровну между одновременными заданиями
+_cpu_workers = os.environ.get("CTFD_SCRAPER_CPU_WORKERS", "0").strip().lower()
+CPU_WORKERS = (
+    max(1, cpu_count() // MAX_CONCURRENT_SCRAPES)
+    if _cpu_workers == "auto"
+    else max(0, int(_cpu_workers or 0))
+)
+
+# SSE: как часто отправлять снимок прогресса и сколько строк лога хранить/слать
+SSE_INTERVAL = 0.5
+JOB_LOG_LINES = 500
+SSE_MAX_LOG_LINES = 100
+
+jobs: Dict[str, Dict[str, Any]] = {}
+job_queue: Optional[asyncio.Queue] = None
+job_workers: List[asyncio.Task] = []
+# абсолютный out_dir, в который сейчас пишет задание -> ждущие его job_id
+busy_out_dirs: Dict[str, deque] = {}
+
+
+def ensure_job_workers() -> asyncio.Queue:
+    """
+    Очередь и воркеры создаются лениво — внутри работающего event loop.
+    """
+    global job_queue
+    if job_queue is None:
+        job_queue = asyncio.Queue()
+        for _ in range(MAX_CONCURRENT_SCRAPES):
+            job_workers.append(asyncio.create_task(job_worker(job_queue)))
+    return job_queue
+
+
+async def job_worker(queue: asyncio.Queue) -> None:
+    while True:
+        job_id = await queue.get()
+        job = jobs.get(job_id)
+        if job is None:
+            queue.task_done()
+            continue
+        out_dir = os.path.abspath(job["params"]["out_dir"])
+        if out_dir in busy_out_dirs:
+            # папка занята: задание остаётся в статусе queued и будет
+            # запущено воркером, который сейчас пишет в эту папку
+            busy_out_dirs[out_dir].append(job_id)
+            queue.task_done()
+            continue
+        busy_out_dirs[out_dir] = deque()
+        try:
+            while job is not None:
+                await run_job(job)
+                waiting = busy_out_dirs[out_dir]
+                job = None
+                while waiting and job is None:
+                    job = jobs.get(waiting.popleft())
+        finally:
+            del busy_out_dirs[out_dir]
+            queue.task_done()
+
+
+async def run_job(job: Dict[str, Any]) -> None:
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    job["version"] += 1
+    try:
+        job["result"] = await run_scrape(
+            **job["params"],
+            on_event=lambda event, job=job: apply_job_event(job, event),
+        )
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        job_log(job, f"Ошибка: {e}")
+    finally:
+        job["finished_at"] = time.time()
+        job["version"] += 1
+
+
+def job_log(job: Dict[str, Any], text: str) -> None:
+    job["log_seq"] += 1
+    job["log"].append((job["log_seq"], text))
+
+
+def apply_job_event(job: Dict[str, Any], event: Dict[str, Any]) -> None:
+    """
+    Сворачивает поток событий ядра в компактное состояние задания:
+    счётчики, активные закачки и короткий лог. Браузеру уходят только
+    периодические снимки этого состояния, а не каждое событие.
+    """
+    progress = job["progress"]
+    kind = event["type"]
+    if kind == "discovered":
+        progress["discovered"] = event["count"]
+        if event.get("done", True):
+            job_log(job, f"Найдено задач: {event['count']}")
+    elif kind == "challenge_started":
+        progress["started"] += 1
+    elif kind == "challenge_finished":
+        progress["finished"] += 1
+        job_log(job, f"✓ {event.get('title') or event['url']} (файлов: {event.get('files_count', 0)})")
+    elif kind == "challenge_retry":
+        job_log(job, f"↻ {event['url']}: попытка {event['attempt']} ({event.get('error')})")
+    elif kind == "challenge_failed":
+        progress["failed"] += 1
+        job_log(job, f"✗ {event['url']}: {event.get('error')}")
+    elif kind in ("file_started", "file_progress"):
+        progress["active_files"][event["url"]] = {
+            "name": event["name"],
+            "bytes": event.get("bytes", 0),
+            "total": event.get("total"),
+        }
+    elif kind == "file_finished":
+        progress["active_files"].pop(event["url"], None)
+        progress["files"] += 1
+        progress["bytes"] += event.get("bytes", 0)
+    elif kind == "archive_started":
+        progress["archive"] = {"done": 0, "total": None}
+        job_log(job, "Собираю ZIP-архив…")
+    elif kind == "archive_progress":
+        progress["archive"] = {"done": event["done"], "total": event["total"]}
+    elif kind == "archive_finished":
+        job_log(job, f"Архив готов: {event.get('path')}")
+    job["version"] += 1
+
+
+def prune_finished_jobs() -> None:
+    finished = [j for j in jobs.values() if j["status"] in ("done", "failed")]
+    finished.sort(key=lambda j: j["finished_at"] or 0)
+    for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        jobs.pop(job["id"], None)
+
+
+def submit_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    queue = ensure_job_workers()
+    prune_finished_jobs()
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "status": "queued",
+        "params": params,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+        "progress": {
+            "discovered": 0,
+            "started": 0,
+            "finished": 0,
+            "failed": 0,
+            "files": 0,
+            "bytes": 0,
+            "active_files": {},
+            "archive": None,
+        },
+        "log": deque(maxlen=JOB_LOG_LINES),
+        "log_seq": 0,
+        "version": 0,
+    }
+    jobs[job["id"]] = job
+    queue.put_nowait(job["id"])
+    return job
+
+
+def queue_position(job: Dict[str, Any]) -> Optional[int]:
+    if job["status"] != "queued":
+        return None
+    queued = sorted(
+        (j for j in jobs.values() if j["status"] == "queued"),
+        key=lambda j: j["created_at"],
+    )
+    return next(i for i, j in enumerate(queued, start=1) if j["id"] == job["id"])
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    result = job["result"] or {}
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "queue_position": queue_position(job),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "results_count": result.get("results_count", len(result.get("results") or [])),
+        "index_path": result.get("index_path") or "",
+        "checksums_path": result.get("checksums_path") or "",
+        "export_path": result.get("export_path") or "",
+        "export_db": result.get("export_db") or "",
+        "zip_path": result.get("zip_path") or "",
+        "progress": progress_snapshot(job),
+    }
+
+
+def progress_snapshot(job: Dict[str, Any]) -> Dict[str, Any]:
+    progress = dict(job["progress"])
+    # в снимок — только самые крупные активные закачки
+    active = sorted(
+        progress.pop("active_files").values(), key=lambda f: f["bytes"], reverse=True
+    )
+    progress["active_files"] = active[:10]
+    progress["active_files_count"] = len(active)
+    return progress
+
+
+def render_waiting_page(job: Dict[str, Any]) -> HTMLResponse:
+    pos = queue_position(job)
+    if pos is not None:
+        state = f"В очереди, позиция {pos}"
+    else:
+        state = "Дамп выполняется"
+    return HTMLResponse(
+        f"""
+<!DOCTYPE html>
+<html lang="ru">
+<head>
+  <meta charset="utf-8" />
+  <title>CTFd Scraper — задание {job['id']}</title>
+  <meta name="viewport" content="width=device-width, initial-scale=1" />
+  <noscript><meta http-equiv="refresh" content="3" /></noscript>
+  <style>
+    :root {{
+      color-scheme: dark;
+      --bg: #020617;
+      --text-main: #e5e7eb;
+      --text-muted: #94a3b8;
+      --accent: #38bdf8;
+    }}
+
+    * {{ box-sizing: border-box; }}
+
+    body {{
+      margin: 0;
+      min-height: 100vh;
+      font-family: system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+      color: var(--text-main);
+      background:
+        radial-gradient(circle at top left, rgba(56, 189, 248, 0.25), transparent 55%),
+        var(--bg);
+      display: flex;
+      align-items: center;
+      justify-content: center;
+      padding: 24px;
+    }}
+
+    .card {{
+      width: 100%;
+      max-width: 720px;
+      background: var(--bg);
+      border-radius: 18px;
+      border: 1px solid rgba(56, 189, 248, 0.45);
+      box-shadow: 0 22px 80px rgba(15, 23, 42, 0.9);
+      padding: 22px 22px 18px;
+    }}
+
+    h1 {{
+      margin: 0 0 8px;
+      font-size: 20px;
+      color: var(--accent);
+    }}
+
+    p {{
+      margin: 0 0 10px;
+      font-size: 13px;
+      color: var(--text-muted);
+    }}
+
+    code {{
+      font-size: 12px;
+    }}
+
+    .bar {{
+      height: 8px;
+      border-radius: 999px;
+      background: rgba(148, 163, 184, 0.2);
+      overflow: hidden;
+      margin: 12px 0;
+    }}
+
+    .bar > div {{
+      height: 100%;
+      width: 0;
+      background: var(--accent);
+      transition: width 0.3s;
+    }}
+
+    pre {{
+      margin: 0;
+      padding: 10px 12px;
+      border-radius: 10px;
+      border: 1px solid rgba(148, 163, 184, 0.35);
+      font-size: 12px;
+      max-height: 320px;
+      overflow: auto;
+      white-space: pre-wrap;
+      word-break: break-word;
+    }}
+  </style>
+</head>
+<body>
+  <div class="card">
+    <h1>{state}</h1>
+    <p>Задание <code>{job['id']}</code>. Страница обновится сама, когда дамп будет готов.</p>
+    <p>Статус в JSON: <code>/jobs/{job['id']}</code></p>
+    <div class="bar"><div id="bar"></div></div>
+    <p id="stats"></p>
+    <pre id="log"></pre>
+  </div>
+  <script>
+    const es = new EventSource("/jobs/{job['id']}/events");
+    const logEl = document.getElementById("log");
+    es.addEventListener("progress", (ev) => {{
+      const s = JSON.parse(ev.data);
+      const p = s.progress;
+      const done = p.finished + p.failed;
+      const pct = p.discovered ? Math.round(100 * done / p.discovered) : 0;
+      document.getElementById("bar").style.width = pct + "%";
+      let text = `Задачи: ${{done}} / ${{p.discovered}} (ошибок: ${{p.failed}}), файлов: ${{p.files}}, ` +
+        `${{(p.bytes / 1048576).toFixed(1)}} MB`;
+      if (p.active_files_count) text += `, качается файлов: ${{p.active_files_count}}`;
+      if (p.archive) text += `, архив: ${{p.archive.done}} / ${{p.archive.total ?? "?"}}`;
+      document.getElementById("stats").textContent = text;
+      if (s.log.length) {{
+        logEl.textContent += s.log.join("\\n") + "\\n";
+        logEl.scrollTop = logEl.scrollHeight;
+      }}
+    }});
+    es.addEventListener("done", () => {{
+      es.close();
+      location.reload();
+    }});
+  </script>
+</body>
+</html>
+        """
+    )
+
+
+@app.post("/run")
+async def run(request: Request):
+    body_bytes = await request.body()
+    body_str = body_bytes.decode("utf-8", errors="ignore")
+    data = parse_qs(body_str)
+
+    def g(key: str, default: str = "") -> str:
+        return data.get(key, [default])[0]
+
+    base_url = g("base_url")
+    username = g("username")
+    password = g("password")
+    api_token = g("api_token")
+    cookie = g("cookie")
+    login_url = g("login_url")
+    host_credentials_str = g("host_credentials").strip()
+    out_dir = g("out_dir") or "./ctf_dump"
+    concurrency_str = g("concurrency", "5")
+    file_concurrency_str = g("file_concurrency", "8")
+    max_rps_str = g("max_rps", "").strip()
+
+    no_files = "no_files" in data
+    no_desc = "no_desc" in data
+    save_html = "save_html" in data
+    update = "update" in data
+    stream_zip = "stream_zip" in data
+    adaptive = "fixed_concurrency" not in data
+    http2 = "http2" in data
+    use_blake3 = "use_blake3" in data
+
+    try:
+        concurrency = int(concurrency_str)
+        if concurrency <= 0:
+            concurrency = 1
+    except ValueError:
+        concurrency = 5
+
+    try:
+        file_concurrency = int(file_concurrency_str)
+        if file_concurrency <= 0:
+            file_concurrency = 1
+    except ValueError:
+        file_concurrency = 8
+
+    try:
+        max_rps = max(0.0, float(max_rps_str.replace(",", "."))) if max_rps_str else 0.0
+    except ValueError:
+        max_rps = 0.0
+
+    urls = [u.strip() for u in base_url.split() if u.strip()]
+
+    try:
+        host_credentials = json.loads(host_credentials_str) if host_credentials_str else {}
+        parse_host_credentials(host_credentials)
+    except (ValueError, TypeError, AttributeError) as e:
+        return render_error_page(f"Доступы по хостам: неверный JSON ({e})")
+
+    params = dict(
+        base_urls=urls,
+        username=username,
+        password=password,
+        api_token=api_token,
+        cookie=cookie,
+        login_url=login_url,
+        host_credentials=host_credentials,
+        out_dir=out_dir,
+        concurrency=concurrency,
+        file_concurrency=file_concurrency,
+        no_files=no_files,
+        no_desc=no_desc,
+        save_html=save_html,
+        update=update,
+        make_zip=not stream_zip,
+        adaptive=adaptive,
+        max_rps=max_rps,
+        http2=http2,
+        blob_store_dir=BLOB_STORE_DIR,
+        blob_store_max_bytes=BLOB_STORE_MAX_BYTES,
+        cpu_workers=CPU_WORKERS,
+        use_blake3=use_blake3,
+        export_db=EXPORT_DB,
+        keep_results=KEEP_RESULTS,
+    )
+
+    # ставим дамп в очередь и сразу отдаём id задания
+    job = submit_job(params)
+    return RedirectResponse(
+        f"/jobs/{job['id']}/result",
+        status_code=303,
+        headers={"X-Job-Id": job["id"]},
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def job_info(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return JSONResponse(job_status(job))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events: снимок прогресса не чаще раза в SSE_INTERVAL и
+    только если что-то изменилось, плюс новые строки лога.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+
+    async def stream():
+        sent_version = -1
+        sent_seq = 0
+        while True:
+            if await request.is_disconnected():
+                break
+            if job["version"] != sent_version:
+                sent_version = job["version"]
+                lines = [text for seq, text in job["log"] if seq > sent_seq]
+                sent_seq = job["log_seq"]
+                payload = {
+                    "status": job["status"],
+                    "progress": progress_snapshot(job),
+                    "log": lines[-SSE_MAX_LOG_LINES:],
+                }
+                yield f"event: progress\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if job["status"] in ("done", "failed"):
+                yield f"event: done\ndata: {json.dumps({'status': job['status']})}\n\n"
+                break
+            await asyncio.sleep(SSE_INTERVAL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jobs/{job_id}/result", response_class=HTMLResponse)
+async def job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    if job["status"] == "done":
+        return render_result_page(job["result"], job["params"]["out_dir"])
+    if job["status"] == "failed":
+        return render_error_page(job["error"])
+    return render_waiting_page(job)
+
+
 @app.get("/download")
 async def download(path: str):
     abs_path = os.path.abspath(path)
@@ -1049,3 +1615,37 @@ async def download(path: str):
         media_type="application/zip",
         filename=os.path.basename(abs_path),
     )
+
+
+def dump_dir_or_404(path: str) -> str:
+    """
+    Путь к каталогу дампа. Принимаются только каталоги с манифестом
+    скрейпера: иначе ?path=/ отдал бы в ZIP всю файловую систему.
+    """
+    abs_path = os.path.abspath(path)
+    if not os.path.isfile(os.path.join(abs_path, MANIFEST_NAME)):
+        raise HTTPException(status_code=404, detail="Каталог дампа не найден")
+    return abs_path
+
+
+@app.get("/verify")
+async def verify(path: str, quick: bool = False):
+    """Перепроверка дампа по checksums.json — JSON-отчёт verify_dump."""
+    abs_path = dump_dir_or_404(path)
+    try:
+        report = await asyncio.to_thread(verify_dump, abs_path, 0, quick)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return JSONResponse(report)
+
+
+@app.get("/download_stream")
+async def download_stream(path: str):
+    abs_path = dump_dir_or_404(path)
+
+    filename = f"{os.path.basename(abs_path) or 'ctf_dump'}.zip"
+    return StreamingResponse(
+        iter_zip_stream(abs_path),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+    )